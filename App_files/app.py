@@ -1,25 +1,58 @@
 # app.py
-import sqlite3
 from datetime import datetime
 import base64
 import os
-import pandas as pd
+import threading
 from pathlib import Path
 import json
-from flask import Flask, render_template, request, jsonify, session
+from flask import Flask, render_template, request, jsonify, session, send_file, Response, stream_with_context
 from werkzeug.security import generate_password_hash, check_password_hash
+from metrics import instrument_app, metrics_token_valid, render_metrics
+from sql_profiler import install_sql_profiler
+from sessions import (ServerSessionInterface, session_store, ensure_session_store, build_user_context,
+                      rotate_session, start_session_flusher)
+from rate_limit import instrument_rate_limiting, render_rate_limit_metrics
+from profiling import (PROFILE_MODES, PROFILE_SKIP_REASONS, instrument_profiling, start_profile, finish_profile,
+                       list_profiles, get_profile, arm_profiling, armed_profiles)
+from db import (DB_PATH, get_db_connection, get_change_count, enable_wal, ensure_request_sequence,
+                ensure_change_counter, ensure_updated_at_trigger,
+                REQUIRED_REQUEST_FIELDS, validate_request_data, insert_service_requests)
+from archive import ARCHIVE_TABLE, ensure_archive_schema, requests_source
+from replica import REPLICA_PATH, get_analytics_connection, refresh_replica, start_replica_refresher
+from reports import submit_report, get_report_job, get_report_file
+from request_export import EXPORT_FORMATS, stream_export
+from rollups import GRANULARITIES, GROUP_BY_COLUMNS, ensure_rollups, query_timeseries
+from autocomplete import SUGGEST_LIMIT, suggest, update_requests as update_suggest_index, start_suggest_refresher
+from equipment import EQUIPMENT_NEW_TYPE_ROLES, ensure_equipment_catalog, get_catalog, resolve_equipment
+from status_timeline import ensure_status_timeline, get_request_timeline
+from request_age import (ensure_days_in_process, refresh_days_in_process, start_days_in_process_refresher,
+                         fresh_days_in_process, days_in_process_update)
 
 # ========== Flask приложение ==========
 app = Flask(__name__)
 app.secret_key = 'your-secret-key-here-change-in-production'  # Секретный ключ для сессий
+# Сессии хранятся на сервере, в cookie - только идентификатор (sessions.py)
+app.session_interface = ServerSessionInterface(session_store)
+# Метрики времени ответа и ошибок для /api/* (выдаются на /metrics)
+instrument_app(app)
+# Статистика операторов SQL и журнал медленных запросов (/api/admin/sql-profile)
+sql_profiler = install_sql_profiler()
+# Профилирование запросов по заголовку X-Profile администратора (/api/admin/profiles)
+instrument_profiling(app)
+# Лимиты частоты по пользователям и очередь тяжелых запросов (429 при перегрузке)
+instrument_rate_limiting(app)
+
+# Максимальное количество заявок в одном пакетном запросе
+BULK_CREATE_LIMIT = 1000
 
 # ========== База данных SQLite ==========
 def init_db():
     """Инициализация базы данных с таблицами для системы учета заявок"""
     # Подключаемся к существующей базе данных или создаем новую
-    db_path = 'service_requests.db'
-    conn = sqlite3.connect(db_path)
+    db_path = DB_PATH
+    conn = get_db_connection()
     cursor = conn.cursor()
+    enable_wal(cursor)
     
     # Проверяем существование таблицы users
     cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='users'")
@@ -36,8 +69,31 @@ def init_db():
             # Если нет пользователей, загружаем их из Excel
             load_users_from_xlsx(conn, cursor)
     
+    # Счетчик номеров заявок (для баз, созданных до его появления)
+    ensure_request_sequence(cursor)
+    # Архив завершенных заявок
+    ensure_archive_schema(cursor)
+    # Счетчик изменений (версия данных для снимков и кэшей)
+    ensure_change_counter(cursor)
+    ensure_updated_at_trigger(cursor)
+    # Справочник оборудования и ссылка на него из заявок
+    equipment_filled = ensure_equipment_catalog(cursor)
+    # Агрегаты по времени для /api/stats/timeseries
+    ensure_rollups(cursor)
+    # Индекс истории статусов и время в статусах
+    ensure_status_timeline(cursor)
+    # Индексы возраста заявок
+    ensure_days_in_process(cursor)
+    # Серверные сессии
+    ensure_session_store(cursor)
+    
     conn.commit()
+    # Возраст открытых заявок на момент запуска
+    refresh_days_in_process(conn)
     conn.close()
+    if equipment_filled and os.path.exists(REPLICA_PATH):
+        # В реплике еще нет equipment_type_id - обновляем ее, не дожидаясь фоновой задачи
+        refresh_replica(force=True)
 
 def create_tables_from_scratch(conn, cursor):
     """Создание всех таблиц с нуля на основе данных из xlsx"""
@@ -137,6 +193,8 @@ def create_tables_from_scratch(conn, cursor):
 
 def load_data_from_xlsx(conn, cursor):
     """Загрузка данных из Excel файла заявок в базу данных"""
+    # pandas нужен только импорту из Excel, веб-процесс не загружает его при запуске
+    import pandas as pd
     try:
         xlsx_file_path = 'service_requests_combined.xlsx'
         if not os.path.exists(xlsx_file_path):
@@ -224,6 +282,7 @@ def load_data_from_xlsx(conn, cursor):
 
 def load_users_from_xlsx(conn, cursor):
     """Загрузка данных пользователей из Excel файла"""
+    import pandas as pd
     try:
         users_file_path = 'inputDataUsers.xlsx'
         if not os.path.exists(users_file_path):
@@ -368,9 +427,6 @@ def create_test_data(conn, cursor):
     
     print("Тестовые данные созданы")
 
-# Инициализация БД
-init_db()
-
 # Функция для создания логотипа
 def create_logo():
     try:
@@ -404,7 +460,43 @@ def create_logo():
         logo_base64 = "data:image/svg+xml;base64," + base64.b64encode(svg_content.encode('utf-8')).decode('utf-8')
         return logo_base64
 
-logo_base64 = create_logo()
+# Логотип (создается в initialize_app)
+logo_base64 = None
+
+# ========== Инициализация ==========
+_initialized = False
+_init_lock = threading.Lock()
+
+
+def initialize_app(start_background=True):
+    """Подготовка базы данных, логотипа и фоновых задач.
+
+    Раньше выполнялась при импорте модуля, теперь вызывается явно при
+    запуске сервера или автоматически перед первым запросом. Повторные
+    вызовы ничего не делают.
+    """
+    global _initialized, logo_base64
+    if _initialized:
+        return app
+    with _init_lock:
+        if not _initialized:
+            init_db()
+            logo_base64 = create_logo()
+            if start_background:
+                # Фоновое обновление аналитической реплики и возраста заявок
+                start_replica_refresher()
+                start_days_in_process_refresher()
+                start_session_flusher()
+                start_suggest_refresher()
+            _initialized = True
+    return app
+
+
+@app.before_request
+def ensure_initialized():
+    """Инициализация при первом запросе, если сервер запущен без initialize_app"""
+    if not _initialized:
+        initialize_app()
 
 # ========== Маршруты Flask ==========
 @app.route('/', methods=['GET', 'POST'])
@@ -429,8 +521,7 @@ def handle_login_form():
         return render_login_page(error="Введите логин и пароль")
     
     try:
-        conn = sqlite3.connect('service_requests.db')
-        conn.row_factory = sqlite3.Row
+        conn = get_db_connection(row_factory=True)
         cursor = conn.cursor()
         
         # Ищем пользователя
@@ -438,11 +529,10 @@ def handle_login_form():
         user = cursor.fetchone()
         
         if user and check_password_hash(user['password_hash'], password):
-            # Устанавливаем сессию
-            session['user_id'] = user['id']
-            session['user_login'] = user['login']
-            session['user_name'] = user['fio']
-            session['user_type'] = user['user_type']
+            # Новая сессия с контекстом пользователя (роль, id мастера);
+            # идентификатор, выданный до входа, больше не действует
+            rotate_session(session)
+            session.update(build_user_context(cursor, user))
             
             conn.close()
             return render_main_page()
@@ -635,6 +725,15 @@ def render_login_page(error=None):
     '''
     return login_html
 
+def page_sections(user_type):
+    """Разделы главной страницы, доступные типу пользователя"""
+    return {
+        "masters": user_type in ['admin', 'manager', 'master', 'operator'],
+        "create_requests": user_type in ['admin', 'manager', 'client', 'operator'],
+        "stats": user_type in ['admin', 'manager', 'operator'],
+        "assign_masters": user_type in ['admin', 'manager', 'operator'],
+    }
+
 def render_main_page():
     """Рендеринг главной страницы после входа"""
     # Получаем информацию о пользователе
@@ -643,10 +742,21 @@ def render_main_page():
     user_login = session.get('user_login', '')
     
     # Определяем доступные разделы в зависимости от типа пользователя
-    can_view_masters = user_type in ['admin', 'manager', 'master', 'operator']
-    can_create_requests = user_type in ['admin', 'manager', 'client', 'operator']
-    can_view_stats = user_type in ['admin', 'manager', 'operator']
-    can_assign_masters = user_type in ['admin', 'manager', 'operator']
+    sections = page_sections(user_type)
+    can_view_masters = sections['masters']
+    can_create_requests = sections['create_requests']
+    can_view_stats = sections['stats']
+    can_assign_masters = sections['assign_masters']
+    
+    # Начальные данные встраиваются в страницу, чтобы не запрашивать их отдельно
+    bootstrap_script = ''
+    if BOOTSTRAP_EMBED:
+        try:
+            # "<" экранируется, чтобы данные не могли закрыть тег script
+            payload = json.dumps(build_bootstrap(), ensure_ascii=False).replace('<', '\\u003c')
+            bootstrap_script = f'<script id="bootstrapData" type="application/json">{payload}</script>'
+        except Exception as e:
+            print(f"Ошибка подготовки начальных данных: {e}")
     
     # Русское название типа пользователя
     user_type_names = {
@@ -789,6 +899,34 @@ def render_main_page():
                 font-weight: 600;
             }}
             
+            /* Таблица заявок с прокруткой: в DOM только видимые строки */
+            #requestsTableContainer {{
+                max-height: 70vh;
+                overflow-y: auto;
+            }}
+            
+            #requestsTable thead th {{
+                position: sticky;
+                top: 0;
+                z-index: 1;
+            }}
+            
+            #requestsTableBody tr.request-row {{
+                height: 64px;
+            }}
+            
+            #requestsTableBody tr.request-row td {{
+                max-width: 260px;
+                overflow: hidden;
+                text-overflow: ellipsis;
+                white-space: nowrap;
+            }}
+            
+            #requestsTableBody tr.spacer-row td {{
+                padding: 0;
+                border: none;
+            }}
+            
             .badge {{
                 padding: 5px 10px;
                 border-radius: 15px;
@@ -978,8 +1116,9 @@ def render_main_page():
             <section id="requests" class="content-section active">
                 <h2>{'Мои заявки' if user_type == 'master' else 'Все заявки'}</h2>
                 <div>
-                    <input type="text" id="searchInput" placeholder="Поиск по номеру, клиенту или описанию..." style="width: 100%; padding: 10px; margin-bottom: 20px;">
-                    <div class="table-container">
+                    <input type="text" id="searchInput" list="searchSuggestions" autocomplete="off" placeholder="Поиск по номеру, клиенту или описанию..." style="width: 100%; padding: 10px; margin-bottom: 20px;">
+                    <datalist id="searchSuggestions"></datalist>
+                    <div class="table-container" id="requestsTableContainer">
                         <table id="requestsTable">
                             <thead>
                                 <tr>
@@ -1008,11 +1147,13 @@ def render_main_page():
                     <div style="display: grid; gap: 20px; margin-top: 20px;">
                         <div>
                             <label>Тип оборудования *</label>
-                            <input type="text" id="tech_type" required style="width: 100%; padding: 10px;" placeholder="Кондиционер, увлажнитель и т.д.">
+                            <input type="text" id="tech_type" list="equipmentTypes" autocomplete="off" required style="width: 100%; padding: 10px;" placeholder="Кондиционер, увлажнитель и т.д.">
+                            <datalist id="equipmentTypes"></datalist>
                         </div>
                         <div>
                             <label>Модель устройства *</label>
-                            <input type="text" id="tech_model" required style="width: 100%; padding: 10px;" placeholder="Модель устройства">
+                            <input type="text" id="tech_model" list="equipmentModels" autocomplete="off" required style="width: 100%; padding: 10px;" placeholder="Модель устройства">
+                            <datalist id="equipmentModels"></datalist>
                         </div>
                         <div>
                             <label>Описание проблемы *</label>
@@ -1122,10 +1263,15 @@ def render_main_page():
             </div>
         </div>
         
+        {bootstrap_script}
         <script>
             let currentAssignRequestId = null;
             let selectedMasterId = null;
             let currentEditRequestId = null;
+            // Последние загруженные статистика и мастера: разделы открываются без запроса,
+            // после изменений заявок данные загружаются заново
+            let statsData = null;
+            let mastersData = null;
             
             // Показ секций
             function showSection(sectionId) {{
@@ -1136,72 +1282,306 @@ def render_main_page():
                 
                 // Загрузка данных для секции
                 if (sectionId === 'requests') loadRequests();
-                if (sectionId === 'stats') loadStats();
-                if (sectionId === 'masters') loadMasters();
+                if (sectionId === 'stats') statsData ? renderStats(statsData) : loadStats();
+                if (sectionId === 'masters') mastersData ? renderMasters(mastersData) : loadMasters();
+                if (sectionId === 'new-request' && !equipmentData) loadEquipmentTypes();
+            }}
+            
+            // ========== Таблица заявок ==========
+            // В DOM только строки видимой области и запас ROW_OVERSCAN сверху и снизу,
+            // остальная высота - строки-распорки. Строки хранятся по request_id:
+            // при прокрутке и перезагрузке списка переиспользуются, а после
+            // изменения заявки обновляется только ее строка.
+            const ROW_OVERSCAN = 10;
+            const USER_TYPE = '{user_type}';
+            const STATUS_CLASSES = {{
+                'Новая заявка': 'badge-new',
+                'В процессе ремонта': 'badge-process',
+                'Завершена': 'badge-completed',
+                'Ожидание комплектующих': 'badge-waiting'
+            }};
+            // Кнопки действий в зависимости от типа пользователя: [действие, класс, подпись]
+            const ACTION_BUTTONS = ['admin', 'manager', 'operator'].includes(USER_TYPE) ? [
+                ['view', 'btn-view', 'Просмотр'],
+                ['edit', 'btn-edit', 'Изменить'],
+                ['assign', 'btn-assign', 'Назначить']
+            ] : USER_TYPE === 'master' ? [
+                ['view', 'btn-view', 'Просмотр'],
+                ['edit', 'btn-edit', 'Изменить статус']
+            ] : [
+                ['view', 'btn-view', 'Просмотр']
+            ];
+            const REQUEST_ACTIONS = {{
+                view: requestId => viewRequest(requestId),
+                edit: requestId => openEditRequestModal(requestId),
+                assign: requestId => openAssignMasterModal(requestId)
+            }};
+            // Поля, которые выводятся в строке таблицы
+            const ROW_FIELDS = ['start_date', 'tech_type', 'tech_model', 'problem_description',
+                                'client_fio', 'client_phone', 'request_status', 'master_fio'];
+            
+            let rowHeight = 64;
+            let requestOrder = [];            // request_id в порядке вывода
+            const requestsById = new Map();   // request_id -> данные заявки
+            const renderedRows = new Map();   // request_id -> {{row, data}} для строк в DOM
+            let renderScheduled = false;
+            const topSpacer = createSpacerRow();
+            const bottomSpacer = createSpacerRow();
+            
+            function createSpacerRow() {{
+                const row = document.createElement('tr');
+                row.className = 'spacer-row';
+                const cell = document.createElement('td');
+                cell.colSpan = 8;
+                row.appendChild(cell);
+                return row;
+            }}
+            
+            function setCell(cell, text, smallText) {{
+                cell.textContent = text ?? '';
+                if (smallText !== undefined) {{
+                    const small = document.createElement('small');
+                    small.textContent = smallText ?? '';
+                    cell.append(document.createElement('br'), small);
+                }}
             }}
             
-            // Загрузка заявок
-            async function loadRequests() {{
+            function fillRequestRow(row, request) {{
+                const cells = row.cells;
+                setCell(cells[0], request.request_id);
+                setCell(cells[1], new Date(request.start_date).toLocaleDateString('ru-RU'));
+                setCell(cells[2], request.tech_type, request.tech_model);
+                setCell(cells[3], request.problem_description);
+                setCell(cells[4], request.client_fio, request.client_phone);
+                const badge = document.createElement('span');
+                badge.className = 'badge ' + (STATUS_CLASSES[request.request_status] || 'badge-new');
+                badge.textContent = request.request_status;
+                cells[5].replaceChildren(badge);
+                setCell(cells[6], request.master_fio || 'Не назначен');
+            }}
+            
+            function createRequestRow(request) {{
+                const row = document.createElement('tr');
+                row.className = 'request-row';
+                row.dataset.id = request.request_id;
+                for (let i = 0; i < 8; i++) {{
+                    row.appendChild(document.createElement('td'));
+                }}
+                ACTION_BUTTONS.forEach(([action, buttonClass, label]) => {{
+                    const button = document.createElement('button');
+                    button.className = 'action-btn ' + buttonClass;
+                    button.dataset.action = action;
+                    button.textContent = label;
+                    row.cells[7].appendChild(button);
+                }});
+                fillRequestRow(row, request);
+                return row;
+            }}
+            
+            function showTableMessage(html) {{
+                renderedRows.clear();
+                document.getElementById('requestsTableBody').innerHTML = html;
+            }}
+            
+            function scheduleRender() {{
+                if (!renderScheduled) {{
+                    renderScheduled = true;
+                    requestAnimationFrame(renderRequestsWindow);
+                }}
+            }}
+            
+            // Вывод строк видимой области
+            function renderRequestsWindow() {{
+                renderScheduled = false;
+                if (requestOrder.length === 0) {{
+                    showTableMessage('<tr><td colspan="8" style="text-align: center; padding: 20px;">Нет заявок</td></tr>');
+                    return;
+                }}
+                const container = document.getElementById('requestsTableContainer');
+                const tbody = document.getElementById('requestsTableBody');
+                const visible = Math.ceil(container.clientHeight / rowHeight) || 20;
+                const first = Math.max(0, Math.min(Math.floor(container.scrollTop / rowHeight) - ROW_OVERSCAN,
+                                                   requestOrder.length - visible - ROW_OVERSCAN));
+                const last = Math.min(requestOrder.length, first + visible + 2 * ROW_OVERSCAN);
+                
+                const rows = [];
+                const wanted = new Set();
+                for (let i = first; i < last; i++) {{
+                    const requestId = requestOrder[i];
+                    const data = requestsById.get(requestId);
+                    let entry = renderedRows.get(requestId);
+                    if (!entry) {{
+                        entry = {{ row: createRequestRow(data), data }};
+                        renderedRows.set(requestId, entry);
+                    }} else if (entry.data !== data) {{
+                        fillRequestRow(entry.row, data);
+                        entry.data = data;
+                    }}
+                    wanted.add(requestId);
+                    rows.push(entry.row);
+                }}
+                for (const requestId of renderedRows.keys()) {{
+                    if (!wanted.has(requestId)) renderedRows.delete(requestId);
+                }}
+                topSpacer.cells[0].style.height = (first * rowHeight) + 'px';
+                bottomSpacer.cells[0].style.height = ((requestOrder.length - last) * rowHeight) + 'px';
+                
+                // Сначала убираем лишние узлы, затем вставляем недостающие:
+                // строки, оставшиеся в окне, не перемещаются
+                const target = [topSpacer, ...rows, bottomSpacer];
+                const keep = new Set(target);
+                Array.from(tbody.children).forEach(node => {{
+                    if (!keep.has(node)) node.remove();
+                }});
+                target.forEach((node, index) => {{
+                    if (tbody.children[index] !== node) {{
+                        tbody.insertBefore(node, tbody.children[index] || null);
+                    }}
+                }});
+                
+                // Высота строки уточняется по первой отрисованной строке
+                const measured = rows[0].offsetHeight;
+                if (measured && Math.abs(measured - rowHeight) > 1) {{
+                    rowHeight = measured;
+                    scheduleRender();
+                }}
+            }}
+            
+            function sameRequest(a, b) {{
+                return ROW_FIELDS.every(field => a[field] === b[field]);
+            }}
+            
+            // Новый список заявок: неизменившиеся заявки сохраняют прежние объекты,
+            // поэтому их строки не перерисовываются
+            function setRequests(requests) {{
+                requestOrder = requests.map(request => request.request_id);
+                const present = new Set(requestOrder);
+                for (const requestId of requestsById.keys()) {{
+                    if (!present.has(requestId)) requestsById.delete(requestId);
+                }}
+                requests.forEach(request => {{
+                    const known = requestsById.get(request.request_id);
+                    if (!known || !sameRequest(known, request)) {{
+                        requestsById.set(request.request_id, request);
+                    }}
+                }});
+                scheduleRender();
+            }}
+            
+            // Обновление одной заявки (новая добавляется в начало списка)
+            function upsertRequest(request) {{
+                const requestId = request.request_id;
+                if (!requestsById.has(requestId)) {{
+                    requestOrder.unshift(requestId);
+                    requestsById.set(requestId, request);
+                    scheduleRender();
+                    return;
+                }}
+                requestsById.set(requestId, request);
+                const entry = renderedRows.get(requestId);
+                if (entry) {{
+                    fillRequestRow(entry.row, request);
+                    entry.data = request;
+                }}
+            }}
+            
+            async function refreshRequestRow(requestId) {{
                 try {{
-                    const response = await fetch('/api/requests');
-                    const requests = await response.json();
-                    
-                    const tbody = document.getElementById('requestsTableBody');
-                    tbody.innerHTML = '';
-                    
-                    if (requests.length === 0) {{
-                        tbody.innerHTML = '<tr><td colspan="8" style="text-align: center; padding: 20px;">Нет заявок</td></tr>';
+                    const response = await fetch('/api/requests/' + requestId);
+                    if (!response.ok) {{
+                        loadRequests();
                         return;
                     }}
-                    
-                    requests.forEach(request => {{
-                        const row = document.createElement('tr');
-                        const statusClass = {{
-                            'Новая заявка': 'badge-new',
-                            'В процессе ремонта': 'badge-process',
-                            'Завершена': 'badge-completed',
-                            'Ожидание комплектующих': 'badge-waiting'
-                        }}[request.request_status] || 'badge-new';
-                        
-                        // Кнопки действий в зависимости от типа пользователя
-                        let actionButtons = '';
-                        const userType = '{user_type}';
-                        
-                        if (userType === 'admin' || userType === 'manager' || userType === 'operator') {{
-                            actionButtons = `
-                                <button class="action-btn btn-view" onclick="viewRequest(${{request.request_id}})">Просмотр</button>
-                                <button class="action-btn btn-edit" onclick="openEditRequestModal(${{request.request_id}})">Изменить</button>
-                                <button class="action-btn btn-assign" onclick="openAssignMasterModal(${{request.request_id}})">Назначить</button>
-                            `;
-                        }} else if (userType === 'master') {{
-                            actionButtons = `
-                                <button class="action-btn btn-view" onclick="viewRequest(${{request.request_id}})">Просмотр</button>
-                                <button class="action-btn btn-edit" onclick="openEditRequestModal(${{request.request_id}})">Изменить статус</button>
-                            `;
-                        }} else {{
-                            actionButtons = `
-                                <button class="action-btn btn-view" onclick="viewRequest(${{request.request_id}})">Просмотр</button>
-                            `;
-                        }}
-                        
-                        row.innerHTML = `
-                            <td>${{request.request_id}}</td>
-                            <td>${{new Date(request.start_date).toLocaleDateString('ru-RU')}}</td>
-                            <td>${{request.tech_type}}<br><small>${{request.tech_model}}</small></td>
-                            <td>${{request.problem_description}}</td>
-                            <td>${{request.client_fio}}<br><small>${{request.client_phone}}</small></td>
-                            <td><span class="badge ${{statusClass}}">${{request.request_status}}</span></td>
-                            <td>${{request.master_fio || 'Не назначен'}}</td>
-                            <td>${{actionButtons}}</td>
-                        `;
-                        tbody.appendChild(row);
-                    }});
+                    upsertRequest(await response.json());
+                }} catch (error) {{
+                    console.error('Ошибка обновления заявки:', error);
+                }}
+            }}
+            
+            // Загрузка заявок (с учетом строки поиска); предыдущая незавершенная загрузка отменяется
+            let listController = null;
+            async function loadRequests() {{
+                if (listController) listController.abort();
+                const controller = listController = new AbortController();
+                const query = document.getElementById('searchInput').value.trim();
+                const url = query ? '/api/requests/search?q=' + encodeURIComponent(query) : '/api/requests';
+                try {{
+                    const response = await fetch(url, {{ signal: controller.signal }});
+                    setRequests(await response.json());
                 }} catch (error) {{
+                    if (error.name === 'AbortError') return;
                     console.error('Ошибка загрузки заявок:', error);
-                    document.getElementById('requestsTableBody').innerHTML = '<tr><td colspan="8" style="text-align: center; color: red;">Ошибка загрузки данных</td></tr>';
+                    showTableMessage('<tr><td colspan="8" style="text-align: center; color: red;">Ошибка загрузки данных</td></tr>');
+                }}
+            }}
+            
+            // ========== Поиск ==========
+            // Подсказки запрашиваются после паузы в наборе, незавершенный запрос подсказок
+            // отменяется следующим. Поиск заявок - по Enter или выбору подсказки.
+            const SUGGEST_DEBOUNCE_MS = 200;
+            const SUGGEST_FIELD_NAMES = {{
+                request_id: 'Номер заявки',
+                client_fio: 'Клиент',
+                client_phone: 'Телефон',
+                tech_type: 'Тип оборудования',
+                tech_model: 'Модель'
+            }};
+            let suggestTimer = null;
+            let suggestController = null;
+            
+            async function loadSuggestions(query) {{
+                if (suggestController) suggestController.abort();
+                const controller = suggestController = new AbortController();
+                try {{
+                    const response = await fetch('/api/requests/suggest?q=' + encodeURIComponent(query),
+                                                 {{ signal: controller.signal }});
+                    if (!response.ok) return;
+                    const suggestions = await response.json();
+                    document.getElementById('searchSuggestions').replaceChildren(...suggestions.map(item => {{
+                        const option = document.createElement('option');
+                        option.value = item.value;
+                        option.label = SUGGEST_FIELD_NAMES[item.field] || item.field;
+                        return option;
+                    }}));
+                }} catch (error) {{
+                    if (error.name !== 'AbortError') console.error('Ошибка загрузки подсказок:', error);
                 }}
             }}
             
+            function searchRequests() {{
+                clearTimeout(suggestTimer);
+                if (suggestController) suggestController.abort();
+                loadRequests();
+            }}
+            
+            function initSearch() {{
+                const input = document.getElementById('searchInput');
+                input.addEventListener('input', (event) => {{
+                    clearTimeout(suggestTimer);
+                    const query = input.value.trim();
+                    // Выбор подсказки из списка (или очистка строки) - сразу поиск
+                    if (!query || !event.inputType || event.inputType === 'insertReplacementText') {{
+                        searchRequests();
+                        return;
+                    }}
+                    suggestTimer = setTimeout(() => loadSuggestions(query), SUGGEST_DEBOUNCE_MS);
+                }});
+                input.addEventListener('keydown', (event) => {{
+                    if (event.key === 'Enter') searchRequests();
+                }});
+            }}
+            
+            function initRequestsTable() {{
+                // Один обработчик на все кнопки таблицы
+                document.getElementById('requestsTableBody').addEventListener('click', (event) => {{
+                    const button = event.target.closest('button[data-action]');
+                    if (!button) return;
+                    REQUEST_ACTIONS[button.dataset.action](Number(button.closest('tr').dataset.id));
+                }});
+                document.getElementById('requestsTableContainer').addEventListener('scroll', scheduleRender, {{ passive: true }});
+                window.addEventListener('resize', scheduleRender);
+            }}
+            
             // Открытие модального окна для назначения мастера
             async function openAssignMasterModal(requestId) {{
                 if (!{json.dumps(can_assign_masters)}) {{
@@ -1215,6 +1595,7 @@ def render_main_page():
                 try {{
                     const response = await fetch('/api/masters');
                     const masters = await response.json();
+                    mastersData = masters;
                     
                     const masterList = document.getElementById('masterList');
                     masterList.innerHTML = '';
@@ -1281,8 +1662,9 @@ def render_main_page():
                     const result = await response.json();
                     if (result.success) {{
                         alert('Мастер успешно назначен на заявку');
+                        refreshRequestRow(currentAssignRequestId);
+                        mastersData = null;
                         closeAssignMasterModal();
-                        loadRequests();
                         loadStats();
                     }} else {{
                         alert('Ошибка: ' + result.error);
@@ -1371,8 +1753,9 @@ def render_main_page():
                     const result = await response.json();
                     if (result.success) {{
                         alert('Заявка успешно обновлена');
+                        refreshRequestRow(currentEditRequestId);
+                        mastersData = null;
                         closeEditRequestModal();
-                        loadRequests();
                         loadStats();
                     }} else {{
                         alert('Ошибка: ' + result.error);
@@ -1428,6 +1811,36 @@ def render_main_page():
                 }}
             }}
             
+            // ========== Справочник оборудования ==========
+            // Загружается при открытии формы: типы - в подсказки поля типа,
+            // модели выбранного типа - в подсказки поля модели
+            let equipmentData = null;
+            
+            function fillDatalist(id, values) {{
+                document.getElementById(id).replaceChildren(...values.map(value => {{
+                    const option = document.createElement('option');
+                    option.value = value;
+                    return option;
+                }}));
+            }}
+            
+            function updateModelOptions() {{
+                const type = document.getElementById('tech_type').value.trim().toLowerCase();
+                const found = equipmentData && equipmentData.types.find(item => item.tech_type.toLowerCase() === type);
+                fillDatalist('equipmentModels', found ? found.models : []);
+            }}
+            
+            async function loadEquipmentTypes() {{
+                try {{
+                    const response = await fetch('/api/equipment-types');
+                    equipmentData = await response.json();
+                    fillDatalist('equipmentTypes', equipmentData.types.map(item => item.tech_type));
+                    updateModelOptions();
+                }} catch (error) {{
+                    console.error('Ошибка загрузки справочника оборудования:', error);
+                }}
+            }}
+            
             // Создание новой заявки
             async function createNewRequest() {{
                 const formData = {{
@@ -1455,8 +1868,10 @@ def render_main_page():
                         alert('Заявка №' + result.request_id + ' успешно создана!');
                         document.getElementById('newRequestForm').reset();
                         document.getElementById('client_fio').value = '{user_name}';
+                        mastersData = null;
+                        // В справочник могла добавиться новая модель
+                        equipmentData = null;
                         showSection('requests');
-                        loadRequests();
                         loadStats(); // Обновляем статистику
                     }} else {{
                         alert('Ошибка: ' + result.error);
@@ -1469,9 +1884,16 @@ def render_main_page():
             // Загрузка статистики
             async function loadStats() {{
                 try {{
-                    const response = await fetch('/api/stats');
-                    const stats = await response.json();
-                    
+                    const response = await fetch('/api/stats?include_archived=1');
+                    statsData = await response.json();
+                    renderStats(statsData);
+                }} catch (error) {{
+                    console.error('Ошибка загрузки статистики:', error);
+                }}
+            }}
+            
+            function renderStats(stats) {{
+                try {{
                     document.getElementById('totalRequests').textContent = stats.total_requests;
                     document.getElementById('completedRequests').textContent = stats.completed_requests;
                     document.getElementById('avgTime').textContent = stats.avg_days || '0';
@@ -1528,7 +1950,7 @@ def render_main_page():
                         }}
                     }});
                 }} catch (error) {{
-                    console.error('Ошибка загрузки статистики:', error);
+                    console.error('Ошибка вывода статистики:', error);
                 }}
             }}
             
@@ -1536,28 +1958,61 @@ def render_main_page():
             async function loadMasters() {{
                 try {{
                     const response = await fetch('/api/masters');
-                    const masters = await response.json();
-                    
-                    const tbody = document.getElementById('mastersTableBody');
-                    tbody.innerHTML = '';
-                    
-                    masters.forEach(master => {{
-                        const row = document.createElement('tr');
-                        row.innerHTML = `
-                            <td>${{master.master_fio}}</td>
-                            <td>${{master.master_phone}}</td>
-                            <td>${{master.master_login}}</td>
-                            <td>${{master.master_type}}</td>
-                            <td>${{master.active_requests || 0}}</td>
-                            <td>${{master.total_requests || 0}}</td>
-                        `;
-                        tbody.appendChild(row);
-                    }});
+                    mastersData = await response.json();
+                    renderMasters(mastersData);
                 }} catch (error) {{
                     console.error('Ошибка загрузки мастеров:', error);
                 }}
             }}
             
+            function renderMasters(masters) {{
+                const tbody = document.getElementById('mastersTableBody');
+                tbody.innerHTML = '';
+                
+                masters.forEach(master => {{
+                    const row = document.createElement('tr');
+                    row.innerHTML = `
+                        <td>${{master.master_fio}}</td>
+                        <td>${{master.master_phone}}</td>
+                        <td>${{master.master_login}}</td>
+                        <td>${{master.master_type}}</td>
+                        <td>${{master.active_requests || 0}}</td>
+                        <td>${{master.total_requests || 0}}</td>
+                    `;
+                    tbody.appendChild(row);
+                }});
+            }}
+            
+            // Начальные данные: встроенные в страницу или одним запросом /api/bootstrap
+            async function loadBootstrap() {{
+                let data = null;
+                const embedded = document.getElementById('bootstrapData');
+                if (embedded) {{
+                    data = JSON.parse(embedded.textContent);
+                    embedded.remove();
+                }} else {{
+                    try {{
+                        const response = await fetch('/api/bootstrap');
+                        if (response.ok) data = await response.json();
+                    }} catch (error) {{
+                        console.error('Ошибка загрузки начальных данных:', error);
+                    }}
+                }}
+                if (!data) {{
+                    loadRequests();
+                    loadStats();
+                    return;
+                }}
+                setRequests(data.requests);
+                // В начальных данных только первая страница заявок, остальные догружаются
+                if (!data.requests_complete) loadRequests();
+                mastersData = data.masters;
+                if (data.stats) {{
+                    statsData = data.stats;
+                    renderStats(statsData);
+                }}
+            }}
+            
             // Выход из системы
             async function logout() {{
                 await fetch('/api/logout');
@@ -1566,8 +2021,10 @@ def render_main_page():
             
             // Инициализация при загрузке
             document.addEventListener('DOMContentLoaded', () => {{
-                loadRequests();
-                loadStats();
+                initRequestsTable();
+                initSearch();
+                document.getElementById('tech_type').addEventListener('input', updateModelOptions);
+                loadBootstrap();
                 
                 // Закрытие модальных окон при клике вне их
                 document.addEventListener('click', (event) => {{
@@ -1584,6 +2041,51 @@ def render_main_page():
 
 # ========== API маршруты ==========
 
+def arg_flag(name):
+    """Булев параметр строки запроса (?name=1 / true / yes)"""
+    return request.args.get(name, '').lower() in ('1', 'true', 'yes')
+
+# Поля, по которым ищет строка поиска
+SEARCH_FIELDS = ('request_id', 'problem_description', 'client_fio', 'client_phone', 'tech_type', 'tech_model')
+
+def build_requests_query(cursor, user_type, user_login, query=None, status=None, include_archived=False,
+                         min_days=None, sort=None, master_id=None):
+    """SQL выборки заявок с учетом роли пользователя и фильтров.
+
+    Клиент видит только свои заявки, специалист - закрепленные за ним
+    (master_id из сессии; если не передан, ищется по логину), остальные
+    роли - все. Возвращает (sql, params) или None, если для специалиста
+    нет записи в таблице masters.
+    """
+    if user_type == 'client':
+        conditions, params = ["client_login = ?"], [user_login]
+    elif user_type == 'master':
+        if master_id is None:
+            cursor.execute("SELECT id FROM masters WHERE master_login = ?", (user_login,))
+            master_result = cursor.fetchone()
+            if not master_result:
+                return None
+            master_id = master_result[0]
+        conditions, params = ["master_id = ?"], [master_id]
+    else:  # admin, manager, operator
+        conditions, params = [], []
+
+    if query is not None:
+        conditions.append("(" + " OR ".join(f"{field} LIKE ?" for field in SEARCH_FIELDS) + ")")
+        params += [f"%{query}%"] * len(SEARCH_FIELDS)
+    if status:
+        conditions.append("request_status = ?")
+        params.append(status)
+    if min_days is not None:
+        conditions.append("days_in_process >= ?")
+        params.append(min_days)
+
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    source = requests_source(cursor, include_archived)
+    # sort=age - сначала самые долгие (по индексу days_in_process)
+    order = "days_in_process DESC" if sort == 'age' else "start_date DESC"
+    return f"SELECT * FROM {source} {where} ORDER BY {order}", params
+
 @app.route('/api/logout')
 def logout_api():
     """Выход из системы"""
@@ -1594,47 +2096,24 @@ def logout_api():
 def get_requests():
     """Получение всех заявок"""
     try:
-        conn = sqlite3.connect('service_requests.db')
-        conn.row_factory = sqlite3.Row
+        conn = get_db_connection(row_factory=True)
         cursor = conn.cursor()
         
         # Фильтрация в зависимости от роли пользователя
-        user_type = session.get('user_type')
-        user_login = session.get('user_login')
-        
-        if user_type == 'client':
-            # Клиент видит только свои заявки
-            cursor.execute('''
-                SELECT * FROM service_requests 
-                WHERE client_login = ? 
-                ORDER BY start_date DESC
-            ''', (user_login,))
-        elif user_type == 'master':
-            # Специалист видит только закрепленные за ним заявки
-            # Получаем ID мастера по его логину
-            cursor.execute("SELECT id FROM masters WHERE master_login = ?", (user_login,))
-            master_result = cursor.fetchone()
-            
-            if master_result:
-                master_id = master_result[0]
-                cursor.execute('''
-                    SELECT * FROM service_requests 
-                    WHERE master_id = ?
-                    ORDER BY start_date DESC
-                ''', (master_id,))
-            else:
-                # Если мастер не найден в таблице masters, показываем пустой список
-                return jsonify([])
-        else:  # admin, manager, operator
-            cursor.execute('''
-                SELECT * FROM service_requests 
-                ORDER BY start_date DESC
-            ''')
+        built = build_requests_query(cursor, session.get('user_type'), session.get('user_login'),
+                                     master_id=session.get('master_id'),
+                                     include_archived=arg_flag('include_archived'),
+                                     min_days=request.args.get('min_days', type=int),
+                                     sort=request.args.get('sort'))
+        if built is None:
+            # Если мастер не найден в таблице masters, показываем пустой список
+            return jsonify([])
+        cursor.execute(*built)
         
         rows = cursor.fetchall()
         conn.close()
         
-        return jsonify([dict(row) for row in rows])
+        return jsonify(fresh_days_in_process([dict(row) for row in rows]))
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -1642,8 +2121,7 @@ def get_requests():
 def get_request(request_id):
     """Получение конкретной заявки"""
     try:
-        conn = sqlite3.connect('service_requests.db')
-        conn.row_factory = sqlite3.Row
+        conn = get_db_connection(row_factory=True)
         cursor = conn.cursor()
         
         cursor.execute('''
@@ -1651,15 +2129,54 @@ def get_request(request_id):
         ''', (request_id,))
         
         request_data = cursor.fetchone()
+        if request_data is None:
+            # Завершенная заявка могла быть перенесена в архив
+            cursor.execute(f'''
+                SELECT * FROM {ARCHIVE_TABLE} WHERE request_id = ?
+            ''', (request_id,))
+            request_data = cursor.fetchone()
         conn.close()
         
         if request_data:
-            return jsonify(dict(request_data))
+            return jsonify(fresh_days_in_process([dict(request_data)])[0])
         else:
             return jsonify({"error": "Заявка не найдена"}), 404
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/requests/<int:request_id>/history')
+def get_request_history(request_id):
+    """История статусов заявки и время в каждом статусе"""
+    try:
+        user_type = session.get('user_type')
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        
+        cursor.execute(f'''
+            SELECT client_login, master_id FROM service_requests WHERE request_id = ?
+            UNION ALL
+            SELECT client_login, master_id FROM {ARCHIVE_TABLE} WHERE request_id = ?
+        ''', (request_id, request_id))
+        request_data = cursor.fetchone()
+        if not request_data:
+            conn.close()
+            return jsonify({"error": "Заявка не найдена"}), 404
+        
+        # Клиент видит историю своих заявок, специалист - закрепленных за ним
+        if user_type == 'client' and request_data[0] != session.get('user_login'):
+            conn.close()
+            return jsonify({"error": "Нет доступа"}), 403
+        if user_type == 'master' and (session.get('master_id') is None or request_data[1] != session['master_id']):
+            conn.close()
+            return jsonify({"error": "Нет доступа к этой заявке"}), 403
+        
+        timeline = get_request_timeline(cursor, request_id)
+        conn.close()
+        
+        return jsonify(timeline)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
 @app.route('/api/requests', methods=['POST'])
 def create_request():
     """Создание новой заявки"""
@@ -1670,35 +2187,57 @@ def create_request():
         if 'user_id' not in session:
             return jsonify({"success": False, "error": "Требуется авторизация"}), 401
         
-        # Генерируем новый request_id
-        conn = sqlite3.connect('service_requests.db')
-        cursor = conn.cursor()
-        cursor.execute("SELECT MAX(request_id) FROM service_requests")
-        max_id = cursor.fetchone()[0] or 0
-        new_request_id = max_id + 1
+        error = validate_request_data(data)
+        if error:
+            return jsonify({"success": False, "error": error}), 400
+        
+        # Тип и модель - в написании справочника оборудования
+        item = {field: data[field] for field in REQUIRED_REQUEST_FIELDS}
+        error = resolve_equipment(item, session.get('user_type') in EQUIPMENT_NEW_TYPE_ROLES)
+        if error:
+            return jsonify({"success": False, "error": error}), 400
+        
+        # Номер заявки выдается атомарно вместе со вставкой
+        conn = get_db_connection()
+        try:
+            new_request_id = insert_service_requests(conn, [item], session.get('user_login', ''))[0]
+        finally:
+            conn.close()
+        update_suggest_index([new_request_id])
         
-        # Добавляем заявку
-        cursor.execute('''
-            INSERT INTO service_requests (
-                request_id, start_date, tech_type, tech_model, problem_description,
-                request_status, client_fio, client_phone, client_login
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            new_request_id,
-            datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-            data['tech_type'],
-            data['tech_model'],
-            data['problem_description'],
-            'Новая заявка',
-            data['client_fio'],
-            data['client_phone'],
-            session.get('user_login', '')
-        ))
+        return jsonify({"success": True, "request_id": new_request_id})
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+@app.route('/api/requests/bulk', methods=['POST'])
+def create_requests_bulk():
+    """Пакетное создание заявок (для интеграций приема заявок)"""
+    try:
+        user_type = session.get('user_type')
+        if user_type not in ['admin', 'manager', 'operator']:
+            return jsonify({"success": False, "error": "Недостаточно прав"}), 403
         
-        conn.commit()
-        conn.close()
+        data = request.json
+        items = data.get('requests') if isinstance(data, dict) else data
+        if not isinstance(items, list) or not items:
+            return jsonify({"success": False, "error": "Ожидается непустой список заявок"}), 400
+        if len(items) > BULK_CREATE_LIMIT:
+            return jsonify({"success": False, "error": f"Не более {BULK_CREATE_LIMIT} заявок за один запрос"}), 400
+        
+        # Проверяем все заявки до записи: пакет создается целиком или не создается
+        for index, item in enumerate(items):
+            error = validate_request_data(item) or resolve_equipment(item, allow_new_type=True)
+            if error:
+                return jsonify({"success": False, "error": f"Заявка #{index}: {error}"}), 400
+        
+        conn = get_db_connection()
+        try:
+            request_ids = insert_service_requests(conn, items)
+        finally:
+            conn.close()
+        update_suggest_index(request_ids)
         
-        return jsonify({"success": True, "request_id": new_request_id})
+        return jsonify({"success": True, "request_ids": request_ids})
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
@@ -1709,7 +2248,7 @@ def update_request(request_id):
         data = request.json
         user_type = session.get('user_type')
         
-        conn = sqlite3.connect('service_requests.db')
+        conn = get_db_connection()
         cursor = conn.cursor()
         
         # Получаем текущую заявку
@@ -1724,14 +2263,10 @@ def update_request(request_id):
             return jsonify({"success": False, "error": "Нет доступа"}), 403
         
         # Для мастера проверяем, что заявка закреплена за ним
-        if user_type == 'master':
-            # Получаем ID мастера по логину
-            cursor.execute("SELECT id FROM masters WHERE master_login = ?", (session.get('user_login'),))
-            master_result = cursor.fetchone()
-            if master_result:
-                master_id = master_result[0]
-                if request_data[12] != master_id:  # master_id в позиции 12
-                    return jsonify({"success": False, "error": "Нет доступа к этой заявке"}), 403
+        # (id мастера записан в сессию при входе)
+        if user_type == 'master' and session.get('master_id') is not None:
+            if request_data[12] != session['master_id']:  # master_id в позиции 12
+                return jsonify({"success": False, "error": "Нет доступа к этой заявке"}), 403
         
         # Обновляем заявку
         update_fields = []
@@ -1746,9 +2281,16 @@ def update_request(request_id):
             update_values.append(data['request_status'])
             
             # Если статус "Завершена", устанавливаем дату завершения
+            completion_date = None
             if data['request_status'] == 'Завершена':
+                completion_date = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
                 update_fields.append("completion_date = ?")
-                update_values.append(datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+                update_values.append(completion_date)
+            
+            # Возраст заявки: при завершении фиксируется, иначе пересчитывается
+            age_field, age_values = days_in_process_update(data['request_status'], completion_date)
+            update_fields.append(age_field)
+            update_values.extend(age_values)
         
         if 'repair_parts' in data and user_type in ['admin', 'manager', 'master', 'operator']:
             update_fields.append("repair_parts = ?")
@@ -1773,9 +2315,10 @@ def update_request(request_id):
             # Записываем в историю изменение статуса
             if 'request_status' in data:
                 cursor.execute('''
-                    INSERT INTO status_history (request_id, old_status, new_status, changed_by)
-                    VALUES (?, ?, ?, ?)
-                ''', (request_id, request_data[6], data['request_status'], session.get('user_name', 'Система')))
+                    INSERT INTO status_history (request_id, old_status, new_status, changed_by, changed_at)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', (request_id, request_data[6], data['request_status'], session.get('user_name', 'Система'),
+                      datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
         
         conn.commit()
         conn.close()
@@ -1798,7 +2341,7 @@ def assign_master(request_id):
         if not master_id:
             return jsonify({"success": False, "error": "Не указан ID мастера"}), 400
         
-        conn = sqlite3.connect('service_requests.db')
+        conn = get_db_connection()
         cursor = conn.cursor()
         
         # Получаем данные мастера
@@ -1809,21 +2352,25 @@ def assign_master(request_id):
             return jsonify({"success": False, "error": "Мастер не найден"}), 404
         
         # Обновляем заявку
-        cursor.execute('''
+        age_field, age_values = days_in_process_update('В процессе ремонта')
+        cursor.execute(f'''
             UPDATE service_requests 
             SET master_id = ?, master_fio = ?, master_phone = ?,
-                request_status = 'В процессе ремонта'
+                request_status = 'В процессе ремонта', {age_field}
             WHERE request_id = ?
-        ''', (master_id, master[0], master[1], request_id))
+        ''', (master_id, master[0], master[1], *age_values, request_id))
         
         # Записываем в историю
         cursor.execute('''
-            INSERT INTO status_history (request_id, old_status, new_status, changed_by, comment)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (request_id, 'Новая заявка', 'В процессе ремонта', session.get('user_name', 'Система'), f'Назначен мастер: {master[0]}'))
+            INSERT INTO status_history (request_id, old_status, new_status, changed_by, comment, changed_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (request_id, 'Новая заявка', 'В процессе ремонта', session.get('user_name', 'Система'), f'Назначен мастер: {master[0]}',
+              datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
         
         conn.commit()
         conn.close()
+        # Подсказки мастера зависят от закрепленных за ним заявок
+        update_suggest_index([request_id])
         
         return jsonify({"success": True})
     except Exception as e:
@@ -1833,80 +2380,236 @@ def assign_master(request_id):
 def get_stats():
     """Получение статистики"""
     try:
-        conn = sqlite3.connect('service_requests.db')
-        cursor = conn.cursor()
-        
-        # Общее количество заявок
-        cursor.execute("SELECT COUNT(*) FROM service_requests")
-        total_requests = cursor.fetchone()[0]
-        
-        # Количество завершенных заявок
-        cursor.execute("SELECT COUNT(*) FROM service_requests WHERE request_status = 'Завершена'")
-        completed_requests = cursor.fetchone()[0]
-        
-        # Количество заявок в процессе
-        cursor.execute("SELECT COUNT(*) FROM service_requests WHERE request_status = 'В процессе ремонта'")
-        in_process = cursor.fetchone()[0]
-        
-        # Среднее время выполнения (для завершенных заявок)
-        cursor.execute('''
-            SELECT AVG(JULIANDAY(completion_date) - JULIANDAY(start_date)) 
-            FROM service_requests 
-            WHERE request_status = 'Завершена' AND completion_date IS NOT NULL
-        ''')
-        avg_days = cursor.fetchone()[0]
-        avg_days = round(avg_days, 1) if avg_days else 0
-        
-        # Распределение по статусам
-        cursor.execute('''
-            SELECT request_status, COUNT(*) as count 
-            FROM service_requests 
-            GROUP BY request_status
-        ''')
-        status_distribution = [{"status": row[0], "count": row[1]} for row in cursor.fetchall()]
-        
-        # Распределение по типам оборудования
-        cursor.execute('''
-            SELECT tech_type, COUNT(*) as count 
-            FROM service_requests 
-            GROUP BY tech_type
-        ''')
-        type_distribution = [{"tech_type": row[0], "count": row[1]} for row in cursor.fetchall()]
+        # Статистика читается из аналитической реплики, а не из рабочей базы
+        conn, freshness = get_analytics_connection()
+        stats = collect_stats(conn.cursor(), arg_flag('include_archived'))
+        conn.close()
         
+        return jsonify({**stats, "freshness": freshness})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+def collect_stats(cursor, include_archived=False):
+    """Сводная статистика заявок: количество, среднее время, распределения"""
+    source = requests_source(cursor, include_archived)
+    
+    # Общее количество заявок
+    cursor.execute(f"SELECT COUNT(*) FROM {source}")
+    total_requests = cursor.fetchone()[0]
+    
+    # Количество завершенных заявок
+    cursor.execute(f"SELECT COUNT(*) FROM {source} WHERE request_status = 'Завершена'")
+    completed_requests = cursor.fetchone()[0]
+    
+    # Количество заявок в процессе
+    cursor.execute(f"SELECT COUNT(*) FROM {source} WHERE request_status = 'В процессе ремонта'")
+    in_process = cursor.fetchone()[0]
+    
+    # Среднее время выполнения (для завершенных заявок)
+    cursor.execute(f'''
+        SELECT AVG(JULIANDAY(completion_date) - JULIANDAY(start_date)) 
+        FROM {source} 
+        WHERE request_status = 'Завершена' AND completion_date IS NOT NULL
+    ''')
+    avg_days = cursor.fetchone()[0]
+    avg_days = round(avg_days, 1) if avg_days else 0
+    
+    # Распределение по статусам
+    cursor.execute(f'''
+        SELECT request_status, COUNT(*) as count 
+        FROM {source} 
+        GROUP BY request_status
+    ''')
+    status_distribution = [{"status": row[0], "count": row[1]} for row in cursor.fetchall()]
+    
+    # Распределение по типам оборудования: группировка по индексу equipment_type_id,
+    # названия типов - из справочника
+    cursor.execute(f'''
+        SELECT e.tech_type, SUM(c.count) as count
+        FROM (SELECT equipment_type_id, COUNT(*) as count FROM {source} GROUP BY equipment_type_id) c
+        LEFT JOIN equipment_types e ON e.id = c.equipment_type_id
+        GROUP BY e.tech_type
+    ''')
+    type_distribution = [{"tech_type": row[0], "count": row[1]} for row in cursor.fetchall()]
+    
+    return {
+        "total_requests": total_requests,
+        "completed_requests": completed_requests,
+        "in_process": in_process,
+        "avg_days": avg_days,
+        "status_distribution": status_distribution,
+        "type_distribution": type_distribution
+    }
+
+@app.route('/api/stats/timeseries')
+def get_stats_timeseries():
+    """Временной ряд приема и выполнения заявок из агрегатов.
+
+    Параметры: start, end (YYYY-MM-DD), granularity (hour|day|week|month),
+    group_by (tech_type|master), tech_type, master_id.
+    """
+    try:
+        if session.get('user_type') not in ['admin', 'manager', 'operator']:
+            return jsonify({"error": "Недостаточно прав"}), 403
+        granularity = request.args.get('granularity', 'day')
+        if granularity not in GRANULARITIES:
+            return jsonify({"error": f"Неизвестная гранулярность: {granularity}"}), 400
+        group_by = request.args.get('group_by') or None
+        if group_by and group_by not in GROUP_BY_COLUMNS:
+            return jsonify({"error": f"Неизвестная разбивка: {group_by}"}), 400
+        
+        conn, freshness = get_analytics_connection()
+        series = query_timeseries(conn.cursor(),
+                                  start=request.args.get('start') or None,
+                                  end=request.args.get('end') or None,
+                                  granularity=granularity,
+                                  group_by=group_by,
+                                  tech_type=request.args.get('tech_type') or None,
+                                  master_id=request.args.get('master_id', type=int))
         conn.close()
         
         return jsonify({
-            "total_requests": total_requests,
-            "completed_requests": completed_requests,
-            "in_process": in_process,
-            "avg_days": avg_days,
-            "status_distribution": status_distribution,
-            "type_distribution": type_distribution
+            "granularity": granularity,
+            "group_by": group_by,
+            "series": series,
+            "freshness": freshness
         })
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/stats/sla')
+def get_stats_sla():
+    """Перцентили сроков выполнения, нарушения SLA и время в статусах (?sla_days=14)"""
+    try:
+        if session.get('user_type') not in ['admin', 'manager', 'operator']:
+            return jsonify({"error": "Недостаточно прав"}), 403
+        # numpy загружается при первом запросе аналитики, а не при запуске
+        from sla import SLA_DAYS, SLA_DAYS_MAX, get_sla_report
+        # Целое число дней в ограниченном диапазоне: sla_days входит в ключ кэша отчета
+        sla_days = request.args.get('sla_days', SLA_DAYS, type=int)
+        if not 1 <= sla_days <= SLA_DAYS_MAX:
+            return jsonify({"error": f"sla_days должен быть целым числом от 1 до {SLA_DAYS_MAX}"}), 400
+        return jsonify(get_sla_report(arg_flag('include_archived'), sla_days))
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
 @app.route('/api/masters')
 def get_masters():
     """Получение списка мастеров"""
     try:
-        conn = sqlite3.connect('service_requests.db')
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT m.*, 
-                   (SELECT COUNT(*) FROM service_requests sr 
-                    WHERE sr.master_id = m.id AND sr.request_status = 'В процессе ремонта') as active_requests,
-                   (SELECT COUNT(*) FROM service_requests sr 
-                    WHERE sr.master_id = m.id) as total_requests
-            FROM masters m
-            ORDER BY m.master_fio
-        ''')
-        rows = cursor.fetchall()
+        conn = get_db_connection(row_factory=True)
+        masters = query_masters(conn.cursor(), arg_flag('include_archived'))
         conn.close()
         
-        return jsonify([dict(row) for row in rows])
+        return jsonify(masters)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+def query_masters(cursor, include_archived=False):
+    """Мастера с количеством заявок в работе и всего"""
+    # В архиве только завершенные заявки, поэтому он влияет лишь на общее количество
+    archived_total = ''
+    if include_archived:
+        archived_total = f''' + (SELECT COUNT(*) FROM {ARCHIVE_TABLE} ar
+                                 WHERE ar.master_id = m.id)'''
+    cursor.execute(f'''
+        SELECT m.*, 
+               (SELECT COUNT(*) FROM service_requests sr 
+                WHERE sr.master_id = m.id AND sr.request_status = 'В процессе ремонта') as active_requests,
+               (SELECT COUNT(*) FROM service_requests sr 
+                WHERE sr.master_id = m.id){archived_total} as total_requests
+        FROM masters m
+        ORDER BY m.master_fio
+    ''')
+    return [dict(row) for row in cursor.fetchall()]
+
+# ========== Начальные данные страницы ==========
+# Сколько заявок отдается в начальных данных (остальные страница догружает)
+BOOTSTRAP_REQUESTS_LIMIT = 200
+# Встраивать начальные данные в HTML главной страницы
+BOOTSTRAP_EMBED = True
+# Сколько частей хранится в кэше (при переполнении кэш очищается)
+BOOTSTRAP_CACHE_SIZE = 1000
+
+# Части начальных данных: ключ -> (версия данных, значение). Версия - счетчик
+# изменений (data_changes), поэтому после любой записи часть строится заново
+_bootstrap_cache = {}
+_bootstrap_cache_lock = threading.Lock()
+
+def cached_part(key, version, build):
+    """Часть начальных данных из кэша или построенная build() для этой версии данных"""
+    with _bootstrap_cache_lock:
+        cached = _bootstrap_cache.get(key)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    value = build()
+    with _bootstrap_cache_lock:
+        if len(_bootstrap_cache) >= BOOTSTRAP_CACHE_SIZE:
+            _bootstrap_cache.clear()
+        _bootstrap_cache[key] = (version, value)
+    return value
+
+def first_requests_page(cursor, user_type, user_login, master_id):
+    """Первые BOOTSTRAP_REQUESTS_LIMIT заявок пользователя и признак, что это весь список"""
+    built = build_requests_query(cursor, user_type, user_login, master_id=master_id)
+    if built is None:
+        return [], True
+    sql, params = built
+    cursor.execute(f"{sql} LIMIT ?", [*params, BOOTSTRAP_REQUESTS_LIMIT + 1])
+    rows = [dict(row) for row in cursor.fetchall()]
+    return rows[:BOOTSTRAP_REQUESTS_LIMIT], len(rows) <= BOOTSTRAP_REQUESTS_LIMIT
+
+def build_bootstrap():
+    """Данные первого экрана текущего пользователя: пользователь, первая страница заявок,
+    мастера и сводная статистика (для разделов, доступных пользователю)"""
+    user_type = session.get('user_type')
+    user_login = session.get('user_login')
+    master_id = session.get('master_id')
+    sections = page_sections(user_type)
+    
+    conn = get_db_connection(row_factory=True)
+    try:
+        cursor = conn.cursor()
+        version = get_change_count(cursor)
+        # Список заявок зависит от роли, а для мастера и клиента - еще и от самого пользователя
+        scope = master_id if user_type == 'master' else user_login if user_type == 'client' else None
+        rows, complete = cached_part(('requests', user_type, scope), version,
+                                     lambda: first_requests_page(cursor, user_type, user_login, master_id))
+        masters = None
+        if sections['masters']:
+            masters = cached_part(('masters',), version, lambda: query_masters(cursor))
+    finally:
+        conn.close()
+    
+    stats = None
+    if sections['stats']:
+        # Как и /api/stats, статистика считается по реплике и включает архив
+        conn, freshness = get_analytics_connection()
+        try:
+            stats = cached_part(('stats', freshness['source']), freshness['data_version'],
+                                lambda: collect_stats(conn.cursor(), include_archived=True))
+        finally:
+            conn.close()
+        stats = {**stats, "freshness": freshness}
+    
+    return {
+        "user": {key: session.get(key) for key in
+                 ('user_id', 'user_login', 'user_name', 'user_type', 'master_id')},
+        "sections": sections,
+        "requests": fresh_days_in_process([dict(row) for row in rows]),
+        "requests_complete": complete,
+        "masters": masters,
+        "stats": stats,
+        "data_version": version
+    }
+
+@app.route('/api/bootstrap')
+def get_bootstrap():
+    """Начальные данные главной страницы одним запросом"""
+    try:
+        if 'user_id' not in session:
+            return jsonify({"error": "Требуется авторизация"}), 401
+        return jsonify(build_bootstrap())
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -1915,68 +2618,222 @@ def search_requests():
     """Поиск заявок"""
     try:
         query = request.args.get('q', '')
-        user_type = session.get('user_type')
-        user_login = session.get('user_login')
         
-        conn = sqlite3.connect('service_requests.db')
-        conn.row_factory = sqlite3.Row
+        conn = get_db_connection(row_factory=True)
         cursor = conn.cursor()
         
-        search_pattern = f"%{query}%"
-        
-        if user_type == 'client':
-            cursor.execute('''
-                SELECT * FROM service_requests 
-                WHERE client_login = ? AND (
-                    request_id LIKE ? OR 
-                    problem_description LIKE ? OR 
-                    client_fio LIKE ? OR 
-                    client_phone LIKE ? OR
-                    tech_type LIKE ? OR
-                    tech_model LIKE ?
-                )
-                ORDER BY start_date DESC
-            ''', (user_login, search_pattern, search_pattern, search_pattern, search_pattern, search_pattern, search_pattern))
-        elif user_type == 'master':
-            # Получаем ID мастера по его логину
-            cursor.execute("SELECT id FROM masters WHERE master_login = ?", (user_login,))
-            master_result = cursor.fetchone()
-            
-            if master_result:
-                master_id = master_result[0]
-                cursor.execute('''
-                    SELECT * FROM service_requests 
-                    WHERE master_id = ? AND (
-                        request_id LIKE ? OR 
-                        problem_description LIKE ? OR 
-                        client_fio LIKE ? OR 
-                        client_phone LIKE ? OR
-                        tech_type LIKE ? OR
-                        tech_model LIKE ?
-                    )
-                    ORDER BY start_date DESC
-                ''', (master_id, search_pattern, search_pattern, search_pattern, search_pattern, search_pattern, search_pattern))
-            else:
-                return jsonify([])
-        else:  # admin, manager, operator
-            cursor.execute('''
-                SELECT * FROM service_requests 
-                WHERE request_id LIKE ? OR 
-                    problem_description LIKE ? OR 
-                    client_fio LIKE ? OR 
-                    client_phone LIKE ? OR
-                    tech_type LIKE ? OR
-                    tech_model LIKE ?
-                ORDER BY start_date DESC
-            ''', (search_pattern, search_pattern, search_pattern, search_pattern, search_pattern, search_pattern))
+        built = build_requests_query(cursor, session.get('user_type'), session.get('user_login'),
+                                     master_id=session.get('master_id'),
+                                     query=query, include_archived=arg_flag('include_archived'))
+        if built is None:
+            return jsonify([])
+        cursor.execute(*built)
         
         rows = cursor.fetchall()
         conn.close()
         
-        return jsonify([dict(row) for row in rows])
+        return jsonify(fresh_days_in_process([dict(row) for row in rows]))
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/requests/suggest')
+def suggest_requests():
+    """Подсказки для строки поиска по началу ФИО, телефона, оборудования или номера (?q=...&limit=10)"""
+    try:
+        if 'user_id' not in session:
+            return jsonify({"error": "Требуется авторизация"}), 401
+        user_type = session.get('user_type')
+        limit = min(max(request.args.get('limit', SUGGEST_LIMIT, type=int), 1), 50)
+        if user_type == 'client':
+            scope = {"client_login": session.get('user_login')}
+        elif user_type == 'master':
+            if session.get('master_id') is None:
+                return jsonify([])
+            scope = {"master_id": session['master_id']}
+        else:
+            scope = {}
+        return jsonify(suggest(request.args.get('q', ''), limit, **scope))
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/equipment-types')
+def get_equipment_types():
+    """Справочник типов и моделей оборудования для формы создания заявки"""
+    try:
+        if 'user_id' not in session:
+            return jsonify({"error": "Требуется авторизация"}), 401
+        return jsonify({
+            "types": get_catalog().types(),
+            "allow_new_type": session.get('user_type') in EQUIPMENT_NEW_TYPE_ROLES,
+        })
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/requests/export')
+def export_requests():
+    """Потоковая выгрузка заявок (?format=csv|xlsx|jsonl) с фильтрами q, status, include_archived"""
+    try:
+        if 'user_id' not in session:
+            return jsonify({"error": "Требуется авторизация"}), 401
+        export_format = request.args.get('format', 'csv').lower()
+        if export_format not in EXPORT_FORMATS:
+            return jsonify({"error": f"Неизвестный формат: {export_format}"}), 400
+
+        # Выгрузки читают аналитическую реплику, а не рабочую базу
+        conn, freshness = get_analytics_connection()
+        try:
+            built = build_requests_query(conn.cursor(), session.get('user_type'), session.get('user_login'),
+                                         master_id=session.get('master_id'),
+                                         query=request.args.get('q') or None,
+                                         status=request.args.get('status') or None,
+                                         include_archived=arg_flag('include_archived'),
+                                         min_days=request.args.get('min_days', type=int),
+                                         sort=request.args.get('sort'))
+            if built is None:
+                built = ("SELECT * FROM service_requests WHERE 0", [])
+        except Exception:
+            conn.close()
+            raise
+
+        mimetype, extension, _ = EXPORT_FORMATS[export_format]
+        filename = f"requests_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{extension}"
+        response = Response(stream_with_context(stream_export(conn, built[0], built[1], export_format)),
+                            mimetype=mimetype)
+        response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+        response.headers['X-Data-Refreshed-At'] = freshness['refreshed_at']
+        return response
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route('/metrics')
+def metrics():
+    """Метрики API в текстовом формате Prometheus (для администратора или по токену METRICS_TOKEN)"""
+    if session.get('user_type') != 'admin' and not metrics_token_valid(request.headers.get('Authorization')):
+        return jsonify({"error": "Недостаточно прав"}), 403
+    return Response(render_metrics() + render_rate_limit_metrics(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+@app.route('/api/admin/sql-profile')
+def get_sql_profile():
+    """Статистика операторов SQL и медленные запросы (?limit=50&sort=total|count|p95|max)"""
+    if session.get('user_type') != 'admin':
+        return jsonify({"error": "Недостаточно прав"}), 403
+    return jsonify(sql_profiler.report(limit=request.args.get('limit', 50, type=int),
+                                       sort=request.args.get('sort', 'total')))
+
+@app.route('/api/admin/sql-profile', methods=['POST'])
+def configure_sql_profile():
+    """Настройка профилировщика: {"enabled": bool, "slow_query_ms": число, "reset": bool}"""
+    try:
+        if session.get('user_type') != 'admin':
+            return jsonify({"success": False, "error": "Недостаточно прав"}), 403
+        data = request.json or {}
+        if 'enabled' in data:
+            sql_profiler.enabled = bool(data['enabled'])
+        if 'slow_query_ms' in data:
+            sql_profiler.slow_query_ms = float(data['slow_query_ms'])
+        if data.get('reset'):
+            sql_profiler.reset()
+        return jsonify({"success": True, "enabled": sql_profiler.enabled,
+                        "slow_query_ms": sql_profiler.slow_query_ms})
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+@app.route('/api/admin/profiles')
+def get_profiles():
+    """Сохраненные профили и пользователи, для которых включено профилирование"""
+    if session.get('user_type') != 'admin':
+        return jsonify({"error": "Недостаточно прав"}), 403
+    return jsonify({"profiles": list_profiles(), "armed": armed_profiles()})
+
+@app.route('/api/admin/profiles/<profile_id>')
+def download_profile(profile_id):
+    """Файл профиля (.pstats или .tracemalloc), с ?format=summary - текстовая сводка"""
+    if session.get('user_type') != 'admin':
+        return jsonify({"error": "Недостаточно прав"}), 403
+    profile = get_profile(profile_id)
+    if profile is None:
+        return jsonify({"error": "Профиль не найден"}), 404
+    info, path, summary = profile
+    if request.args.get('format') == 'summary':
+        return jsonify({**info, "summary": summary})
+    return send_file(path, as_attachment=True, download_name=os.path.basename(path))
+
+@app.route('/api/admin/profiles/arm', methods=['POST'])
+def arm_user_profiling():
+    """Профилирование следующих запросов пользователя: {"user_login", "mode": "cpu"|"memory", "count"}"""
+    try:
+        if session.get('user_type') != 'admin':
+            return jsonify({"success": False, "error": "Недостаточно прав"}), 403
+        data = request.json or {}
+        mode = data.get('mode', 'cpu')
+        if not data.get('user_login') or mode not in PROFILE_MODES:
+            return jsonify({"success": False, "error": "Укажите user_login и mode (cpu или memory)"}), 400
+        count = min(max(int(data.get('count', 1)), 0), 100)
+        return jsonify({"success": True, "armed": arm_profiling(data['user_login'], mode, count)})
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+@app.route('/api/admin/profiles/import', methods=['POST'])
+def profile_import():
+    """Профиль загрузки данных из Excel в базу в памяти: {"mode": "memory"|"cpu"}"""
+    try:
+        if session.get('user_type') != 'admin':
+            return jsonify({"success": False, "error": "Недостаточно прав"}), 403
+        mode = (request.json or {}).get('mode', 'memory')
+        if mode not in PROFILE_MODES:
+            return jsonify({"success": False, "error": "mode должен быть cpu или memory"}), 400
+        state, reason = start_profile(mode)
+        if state is None:
+            return jsonify({"success": False, "error": PROFILE_SKIP_REASONS[reason]}), 429
+        # Рабочая база не затрагивается: таблицы создаются в памяти
+        conn = get_db_connection(db_path=':memory:')
+        error = None
+        try:
+            create_tables_from_scratch(conn, conn.cursor())
+        except Exception as e:
+            error = str(e)
+        finally:
+            conn.close()
+            info = finish_profile(state, "import", user=session.get('user_login'), error=error)
+        return jsonify({"success": error is None, "profile": info})
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+@app.route('/api/reports', methods=['POST'])
+def create_report():
+    """Постановка PDF-отчета в очередь"""
+    try:
+        if session.get('user_type') not in ['admin', 'manager', 'operator']:
+            return jsonify({"success": False, "error": "Недостаточно прав"}), 403
+        
+        job = submit_report(include_archived=arg_flag('include_archived'))
+        return jsonify({"success": True, "job": job}), 202
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+@app.route('/api/reports/<job_id>')
+def report_status(job_id):
+    """Состояние задачи построения отчета"""
+    if session.get('user_type') not in ['admin', 'manager', 'operator']:
+        return jsonify({"error": "Недостаточно прав"}), 403
+    
+    job = get_report_job(job_id)
+    if job is None:
+        return jsonify({"error": "Задача не найдена"}), 404
+    return jsonify(job)
+
+@app.route('/api/reports/<job_id>/download')
+def download_report(job_id):
+    """Скачивание готового отчета"""
+    if session.get('user_type') not in ['admin', 'manager', 'operator']:
+        return jsonify({"error": "Недостаточно прав"}), 403
+    
+    path = get_report_file(job_id)
+    if path is None:
+        return jsonify({"error": "Отчет еще не готов"}), 404
+    return send_file(os.path.abspath(path), mimetype='application/pdf',
+                     as_attachment=True, download_name=os.path.basename(path))
+
 if __name__ == "__main__":
     print("="*60)
     print("Сервисный центр - Система учета заявок на ремонт")
@@ -1997,4 +2854,5 @@ if __name__ == "__main__":
     print("   • Оператор: login4 / pass4")
     print("   • Заказчик: login7 / pass7 (видит только свои заявки)")
     print("="*60)
+    initialize_app()
     app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
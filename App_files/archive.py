@@ -0,0 +1,146 @@
+# archive.py
+"""Архивирование завершенных заявок.
+
+Завершенные заявки старше заданного возраста переносятся из
+service_requests в таблицу service_requests_archive небольшими пакетами:
+каждый пакет - отдельная короткая транзакция, между пакетами делается
+пауза, чтобы операторы могли писать в базу.
+
+Пример запуска:
+    python archive.py --days 365 --batch-size 500
+"""
+import argparse
+import sys
+import time
+from datetime import datetime, timedelta
+
+from db import get_db_connection
+
+ARCHIVE_TABLE = 'service_requests_archive'
+COMPLETED_STATUS = 'Завершена'
+# Заявки, завершенные раньше этого количества дней назад, переносятся в архив
+ARCHIVE_AFTER_DAYS = 365
+ARCHIVE_BATCH_SIZE = 500
+# Пауза между пакетами (секунды), чтобы не удерживать блокировку записи подряд
+ARCHIVE_BATCH_PAUSE = 0.05
+
+
+def get_request_columns(cursor, table='service_requests'):
+    """Список столбцов таблицы заявок в порядке объявления"""
+    cursor.execute(f"PRAGMA table_info({table})")
+    return [row[1] for row in cursor.fetchall()]
+
+
+def ensure_archive_schema(cursor):
+    """Создание архивной таблицы и синхронизация ее столбцов с service_requests"""
+    cursor.execute(f'''
+    CREATE TABLE IF NOT EXISTS {ARCHIVE_TABLE} AS
+    SELECT * FROM service_requests WHERE 0
+    ''')
+    archive_columns = set(get_request_columns(cursor, ARCHIVE_TABLE))
+    for column in get_request_columns(cursor) + ['archived_at']:
+        if column not in archive_columns:
+            cursor.execute(f"ALTER TABLE {ARCHIVE_TABLE} ADD COLUMN {column}")
+    cursor.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS idx_archive_request_id ON {ARCHIVE_TABLE}(request_id)")
+    cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_archive_client_login ON {ARCHIVE_TABLE}(client_login)")
+    cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_archive_master_id ON {ARCHIVE_TABLE}(master_id)")
+    # Индекс для выбора кандидатов на архивирование
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_requests_status_completion
+    ON service_requests(request_status, completion_date)
+    ''')
+
+
+def requests_source(cursor, include_archived=False):
+    """Источник строк заявок для FROM.
+
+    Без архива - просто service_requests. С архивом - UNION ALL рабочей и
+    архивной таблиц под тем же именем, поэтому условия WHERE и ORDER BY
+    в запросах не меняются.
+    """
+    if not include_archived:
+        return 'service_requests'
+    columns = ', '.join(get_request_columns(cursor))
+    return (f"(SELECT {columns} FROM service_requests "
+            f"UNION ALL SELECT {columns} FROM {ARCHIVE_TABLE}) AS service_requests")
+
+
+def archive_completed_requests(conn, older_than_days=ARCHIVE_AFTER_DAYS,
+                               batch_size=ARCHIVE_BATCH_SIZE, pause=ARCHIVE_BATCH_PAUSE):
+    """Перенос завершенных заявок старше older_than_days в архив, возвращает их количество.
+
+    Заявки, номер которых уже есть в архиве, не переносятся и остаются в
+    service_requests: REPLACE молча заменил бы архивную строку, а удаление
+    при REPLACE не вызывает триггеров DELETE, и то, что ведется триггерами
+    по архиву, посчитало бы заявку дважды.
+    """
+    cursor = conn.cursor()
+    ensure_archive_schema(cursor)
+    conn.commit()
+
+    columns = ', '.join(get_request_columns(cursor))
+    cutoff = (datetime.now() - timedelta(days=older_than_days)).strftime('%Y-%m-%d %H:%M:%S')
+    archived_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    candidates = '''
+        FROM service_requests sr
+        WHERE sr.request_status = ? AND sr.completion_date IS NOT NULL AND sr.completion_date < ?
+    '''
+    archived = f"EXISTS (SELECT 1 FROM {ARCHIVE_TABLE} ar WHERE ar.request_id = sr.request_id)"
+    total = 0
+
+    while True:
+        try:
+            cursor.execute("BEGIN IMMEDIATE")
+            cursor.execute(f'''
+                SELECT sr.request_id {candidates} AND NOT {archived}
+                LIMIT ?
+            ''', (COMPLETED_STATUS, cutoff, batch_size))
+            request_ids = [row[0] for row in cursor.fetchall()]
+            if not request_ids:
+                conn.commit()
+                break
+
+            placeholders = ', '.join('?' * len(request_ids))
+            cursor.execute(f'''
+                INSERT INTO {ARCHIVE_TABLE} ({columns}, archived_at)
+                SELECT {columns}, ? FROM service_requests WHERE request_id IN ({placeholders})
+            ''', [archived_at] + request_ids)
+            cursor.execute(f"DELETE FROM service_requests WHERE request_id IN ({placeholders})", request_ids)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+        total += len(request_ids)
+        print(f"Перенесено в архив: {total}")
+        if len(request_ids) < batch_size:
+            break
+        time.sleep(pause)
+
+    cursor.execute(f"SELECT COUNT(*) {candidates} AND {archived}", (COMPLETED_STATUS, cutoff))
+    skipped = cursor.fetchone()[0]
+    if skipped:
+        print(f"Пропущено заявок, номер которых уже есть в архиве: {skipped}")
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Архивирование завершенных заявок")
+    parser.add_argument('--days', type=int, default=ARCHIVE_AFTER_DAYS,
+                        help="переносить заявки, завершенные раньше стольких дней назад")
+    parser.add_argument('--batch-size', type=int, default=ARCHIVE_BATCH_SIZE)
+    parser.add_argument('--pause', type=float, default=ARCHIVE_BATCH_PAUSE,
+                        help="пауза между пакетами, секунды")
+    args = parser.parse_args()
+
+    conn = get_db_connection()
+    try:
+        total = archive_completed_requests(conn, args.days, args.batch_size, args.pause)
+    finally:
+        conn.close()
+    print(f"Архивирование завершено, всего перенесено заявок: {total}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
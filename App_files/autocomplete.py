@@ -0,0 +1,309 @@
+# autocomplete.py
+"""Подсказки строки поиска по префиксу.
+
+Индекс хранится в памяти: отсортированный список ключей (значение в нижнем
+регистре, начиная с каждого слова, для телефонов - еще и только цифры) и
+bisect, который находит диапазон ключей с нужным префиксом. Индексируются
+ФИО и телефоны клиентов, типы и модели оборудования; номера заявок ищутся
+по отдельному отсортированному списку номеров.
+
+Для каждого значения хранится число заявок всего, по клиентам и по
+мастерам: подсказки упорядочены по числу заявок, а клиент и мастер видят
+только значения своих заявок.
+
+Приложение обновляет индекс по строкам после записи заявок (update_requests).
+Фоновая задача сверяет число и максимальный номер заявок с базой и
+перестраивает индекс целиком, если заявки добавлены или удалены в обход
+приложения (импорт, архивирование, другой процесс).
+
+Пример запуска:
+    python autocomplete.py --benchmark
+"""
+import argparse
+import bisect
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from itertools import repeat
+
+from db import get_db_connection
+from scheduler import start_periodic_task
+
+# Поля заявки, значения которых подсказываются
+SUGGEST_FIELDS = ('client_fio', 'client_phone', 'tech_type', 'tech_model')
+SUGGEST_LIMIT = 10
+# Сколько подходящих значений просматривается для выбора самых частых
+SUGGEST_SCAN_LIMIT = 200
+# Как часто индекс сверяется с базой (секунды)
+SUGGEST_CHECK_INTERVAL = 60
+
+# Значения нормализуются в SQL одинаково при полной загрузке и обновлении строк
+_SELECT = "SELECT request_id, client_login, master_id, " + ", ".join(
+    f"TRIM(COALESCE({field}, ''))" for field in SUGGEST_FIELDS) + " FROM service_requests"
+_WORD_START = re.compile(r'\s+')
+_NON_DIGITS = re.compile(r'\D+')
+
+
+def _keys_for(field, value):
+    """Ключи значения: с начала и с каждого слова, для телефона - еще только цифры"""
+    text = value.casefold()
+    keys = {text}
+    keys.update(text[match.end():] for match in _WORD_START.finditer(text))
+    if field == 'client_phone':
+        keys.add(_NON_DIGITS.sub('', text))
+    keys.discard('')
+    return keys
+
+
+def _decrement(counter, key):
+    counter[key] -= 1
+    if counter[key] <= 0:
+        del counter[key]
+        return True
+    return False
+
+
+class SuggestIndex:
+    """Префиксный индекс значений заявок"""
+
+    def __init__(self):
+        # Отсортированные (ключ, поле, значение)
+        self._keys = []
+        # Число заявок: (поле, значение), (поле, значение, логин клиента), (поле, значение, id мастера)
+        self._totals = Counter()
+        self._by_client = Counter()
+        self._by_master = Counter()
+        # Номер заявки -> (логин клиента, id мастера, значения полей)
+        self._rows = {}
+        # Отсортированные номера заявок
+        self._ids = []
+
+    def __len__(self):
+        return len(self._rows)
+
+    def max_request_id(self):
+        return self._ids[-1] if self._ids else None
+
+    def load(self, rows):
+        """Заполнение пустого индекса: счетчики считаются Counter по столбцам, ключи сортируются один раз"""
+        if not rows:
+            return
+        ids, logins, masters, *columns = zip(*rows)
+        self._rows = dict(zip(ids, zip(logins, masters, zip(*columns))))
+        self._ids = sorted(ids)
+        for field, values in zip(SUGGEST_FIELDS, columns):
+            self._totals.update(zip(repeat(field), values))
+            self._by_client.update(zip(repeat(field), values, logins))
+            self._by_master.update(zip(repeat(field), values, masters))
+        for counter in (self._totals, self._by_client, self._by_master):
+            for key in [key for key in counter if not key[1]]:
+                del counter[key]
+        self._keys = sorted((key, field, value) for field, value in self._totals for key in _keys_for(field, value))
+
+    def remove(self, request_id):
+        row = self._rows.pop(request_id, None)
+        if row is None:
+            return
+        position = bisect.bisect_left(self._ids, request_id)
+        if position < len(self._ids) and self._ids[position] == request_id:
+            del self._ids[position]
+        client_login, master_id, values = row
+        for field, value in zip(SUGGEST_FIELDS, values):
+            if not value:
+                continue
+            _decrement(self._by_client, (field, value, client_login))
+            _decrement(self._by_master, (field, value, master_id))
+            if _decrement(self._totals, (field, value)):
+                # Значение больше не встречается - его ключи удаляются
+                for key in _keys_for(field, value):
+                    position = bisect.bisect_left(self._keys, (key, field, value))
+                    if position < len(self._keys) and self._keys[position] == (key, field, value):
+                        del self._keys[position]
+
+    def add(self, row):
+        request_id, client_login, master_id, values = row[0], row[1], row[2], tuple(row[3:])
+        self.remove(request_id)
+        self._rows[request_id] = (client_login, master_id, values)
+        bisect.insort(self._ids, request_id)
+        for field, value in zip(SUGGEST_FIELDS, values):
+            if not value:
+                continue
+            self._by_client[(field, value, client_login)] += 1
+            self._by_master[(field, value, master_id)] += 1
+            self._totals[(field, value)] += 1
+            if self._totals[(field, value)] == 1:
+                for key in _keys_for(field, value):
+                    bisect.insort(self._keys, (key, field, value))
+
+    def search(self, prefix, limit=SUGGEST_LIMIT, client_login=None, master_id=None):
+        """Подсказки [{"field", "value", "count"}]: номера заявок, затем самые частые значения
+
+        client_login / master_id ограничивают подсказки заявками клиента / мастера.
+        """
+        prefix = prefix.strip().casefold()
+        if not prefix:
+            return []
+        found = {}
+        scanned = 0
+        position = bisect.bisect_left(self._keys, (prefix,))
+        while position < len(self._keys) and len(found) < SUGGEST_SCAN_LIMIT and scanned < SUGGEST_SCAN_LIMIT * 10:
+            key, field, value = self._keys[position]
+            if not key.startswith(prefix):
+                break
+            position += 1
+            scanned += 1
+            if (field, value) in found:
+                continue
+            if client_login is not None:
+                count = self._by_client[(field, value, client_login)]
+            elif master_id is not None:
+                count = self._by_master[(field, value, master_id)]
+            else:
+                count = self._totals[(field, value)]
+            if count > 0:
+                found[(field, value)] = count
+        best = sorted(found.items(), key=lambda item: (-item[1], item[0][1]))
+        suggestions = [{"field": field, "value": value, "count": count} for (field, value), count in best]
+        if not prefix.isdigit():
+            return suggestions[:limit]
+        # Цифры могут быть и номером заявки, и началом телефона: номерам - не меньше половины мест
+        ids = self._search_ids(prefix, limit, client_login, master_id)
+        return (ids[:max(limit // 2, limit - len(suggestions))] + suggestions)[:limit]
+
+    def _search_ids(self, digits, limit, client_login, master_id):
+        """Номера заявок, начинающиеся с digits: 12, затем 120-129, 1200-1299..."""
+        if digits.startswith('0') or not self._ids:
+            return []
+        result = []
+        low, high = int(digits), int(digits) + 1
+        while low <= self._ids[-1] and len(result) < limit:
+            position = bisect.bisect_left(self._ids, low)
+            while position < len(self._ids) and self._ids[position] < high and len(result) < limit:
+                request_id = self._ids[position]
+                owner_login, owner_master, _ = self._rows[request_id]
+                if (client_login is None or owner_login == client_login) and \
+                        (master_id is None or owner_master == master_id):
+                    result.append({"field": "request_id", "value": str(request_id), "count": 1})
+                position += 1
+            low, high = low * 10, high * 10
+        return result
+
+
+# ========== Индекс приложения ==========
+_index = None
+_lock = threading.Lock()
+_build_lock = threading.Lock()
+
+
+def _select_rows(cursor, request_ids=None):
+    if request_ids is None:
+        cursor.execute(_SELECT)
+    else:
+        cursor.execute(f"{_SELECT} WHERE request_id IN ({', '.join('?' * len(request_ids))})", list(request_ids))
+    return cursor.fetchall()
+
+
+def _build():
+    global _index
+    conn = get_db_connection()
+    try:
+        index = SuggestIndex()
+        index.load(_select_rows(conn.cursor()))
+    finally:
+        conn.close()
+    with _lock:
+        _index = index
+    return index
+
+
+def rebuild_index():
+    """Построение индекса заново по таблице заявок"""
+    with _build_lock:
+        return _build()
+
+
+def _get_index():
+    """Индекс; если он еще не построен, строится (один раз, даже при одновременных запросах)"""
+    if _index is None:
+        with _build_lock:
+            if _index is None:
+                _build()
+    return _index
+
+
+def suggest(prefix, limit=SUGGEST_LIMIT, client_login=None, master_id=None):
+    """Подсказки для строки поиска (индекс строится при первом обращении)"""
+    index = _get_index()
+    with _lock:
+        return index.search(prefix, limit, client_login, master_id)
+
+
+def update_requests(request_ids):
+    """Обновление индекса по заявкам после их создания или изменения"""
+    if _index is None or not request_ids:
+        return
+    conn = get_db_connection()
+    try:
+        rows = {row[0]: row for row in _select_rows(conn.cursor(), request_ids)}
+    finally:
+        conn.close()
+    with _lock:
+        for request_id in request_ids:
+            if request_id in rows:
+                _index.add(rows[request_id])
+            else:
+                _index.remove(request_id)
+
+
+def check_index():
+    """Перестроение индекса, если заявки добавлены или удалены в обход приложения"""
+    if _index is None:
+        return False
+    conn = get_db_connection()
+    try:
+        count, max_request_id = conn.execute("SELECT COUNT(*), MAX(request_id) FROM service_requests").fetchone()
+    finally:
+        conn.close()
+    with _lock:
+        in_sync = len(_index) == count and _index.max_request_id() == max_request_id
+    if in_sync:
+        return False
+    rebuild_index()
+    return True
+
+
+def start_suggest_refresher():
+    """Построение индекса подсказок в фоне и запуск его периодической сверки с базой"""
+    threading.Thread(target=_get_index, name='suggest-index-build', daemon=True).start()
+    return start_periodic_task('suggest-index', SUGGEST_CHECK_INTERVAL, check_index)
+
+
+# ========== Замер ==========
+def benchmark(queries=10000):
+    """Время построения индекса и одной подсказки на текущей базе"""
+    started = time.perf_counter()
+    index = rebuild_index()
+    print(f"Построение индекса: {len(index)} заявок, {len(index._keys)} ключей, "
+          f"{(time.perf_counter() - started) * 1000:.1f} мс")
+    for prefix in ('1', '12', 'а', 'ив', 'кон', '89', 'xiaomi'):
+        started = time.perf_counter()
+        for _ in range(queries):
+            suggestions = suggest(prefix)
+        per_query = (time.perf_counter() - started) / queries * 1e6
+        print(f"'{prefix}': {len(suggestions)} подсказок, {per_query:.1f} мкс")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Индекс подсказок поиска")
+    parser.add_argument('--benchmark', action='store_true', help="замер построения индекса и подсказок")
+    parser.add_argument('--queries', type=int, default=10000, help="число запросов в замере")
+    args = parser.parse_args()
+    if args.benchmark:
+        benchmark(args.queries)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
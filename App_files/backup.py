@@ -0,0 +1,200 @@
+# backup.py
+"""Онлайн-резервное копирование базы данных через SQLite backup API.
+
+Снимок копируется постранично небольшими шагами с паузами между ними,
+поэтому приложение продолжает работать во время копирования.
+
+Каждый снимок - полная копия базы, а не разностная: если данные не
+менялись с момента предыдущего снимка, новый просто не создается. Место
+под снимки - до BACKUP_KEEP размеров базы. Старые снимки удаляются по
+правилам хранения.
+
+Пример запуска:
+    python backup.py                  # один снимок
+    python backup.py --every 3600     # снимок каждый час
+    python backup.py --list
+"""
+import argparse
+import glob
+import os
+import sqlite3
+import sys
+import time
+from datetime import datetime, timedelta
+
+from db import get_db_connection, get_change_count
+
+BACKUP_DIR = 'backups'
+BACKUP_PREFIX = 'service_requests_'
+# Количество страниц, копируемых за один шаг, и пауза между шагами (секунды)
+BACKUP_PAGES_PER_STEP = 256
+BACKUP_STEP_PAUSE = 0.01
+# Если источник меняется во время копирования, SQLite начинает копирование
+# заново. После стольких перезапусков снимок делается за один шаг: в режиме
+# WAL это держит только транзакцию чтения и не мешает записи.
+BACKUP_MAX_RESTARTS = 3
+# Правила хранения: количество последних снимков и максимальный возраст (дни)
+BACKUP_KEEP = 14
+BACKUP_MAX_AGE_DAYS = 30
+
+
+class BackupRestarted(Exception):
+    """Копирование слишком часто начиналось заново из-за записи в источник"""
+
+
+def list_snapshots(backup_dir=BACKUP_DIR):
+    """Список файлов снимков, от новых к старым"""
+    paths = glob.glob(os.path.join(backup_dir, BACKUP_PREFIX + '*.db'))
+    return sorted(paths, reverse=True)
+
+
+def latest_snapshot(backup_dir=BACKUP_DIR):
+    """Путь к последнему снимку или None"""
+    snapshots = list_snapshots(backup_dir)
+    return snapshots[0] if snapshots else None
+
+
+def open_snapshot(path=None, row_factory=False, backup_dir=BACKUP_DIR):
+    """Открытие снимка только для чтения (по умолчанию последнего).
+
+    Аналитические задачи работают с копией и не касаются рабочей базы.
+    """
+    path = path or latest_snapshot(backup_dir)
+    if path is None:
+        raise FileNotFoundError(f"В каталоге {backup_dir} нет снимков базы данных")
+    conn = sqlite3.connect(f"file:{os.path.abspath(path)}?mode=ro", uri=True)
+    if row_factory:
+        conn.row_factory = sqlite3.Row
+    return conn
+
+
+def snapshot_change_count(path):
+    """Версия данных, сохраненная в снимке"""
+    conn = open_snapshot(path)
+    try:
+        return get_change_count(conn.cursor())
+    except sqlite3.OperationalError:
+        return None
+    finally:
+        conn.close()
+
+
+def copy_database(target_path, db_path=None, pages=BACKUP_PAGES_PER_STEP, pause=BACKUP_STEP_PAUSE):
+    """Согласованная копия рабочей базы в target_path.
+
+    Копия пишется во временный файл и переименовывается только после
+    успешного завершения, поэтому читатели никогда не видят недописанный файл.
+    """
+    # Имя временного файла уникально для процесса, чтобы несколько
+    # процессов приложения не писали в один файл
+    partial_path = f"{target_path}.{os.getpid()}.part"
+    if os.path.exists(partial_path):
+        os.remove(partial_path)
+
+    source = get_db_connection(db_path=db_path)
+    target = sqlite3.connect(partial_path)
+    try:
+        state = {'remaining': None, 'restarts': 0}
+
+        def throttle(status, remaining, total):
+            # Рост оставшегося числа страниц означает перезапуск копирования
+            if state['remaining'] is not None and remaining > state['remaining']:
+                state['restarts'] += 1
+                if state['restarts'] > BACKUP_MAX_RESTARTS:
+                    raise BackupRestarted()
+            state['remaining'] = remaining
+            time.sleep(pause)
+
+        try:
+            source.backup(target, pages=pages, progress=throttle)
+        except BackupRestarted:
+            source.backup(target)
+
+        # Снимок - самостоятельный файл без WAL, его можно открывать только для чтения
+        target.execute("PRAGMA journal_mode=DELETE")
+        target.close()
+        os.replace(partial_path, target_path)
+    except Exception:
+        target.close()
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        raise
+    finally:
+        source.close()
+    return target_path
+
+
+def apply_retention(backup_dir=BACKUP_DIR, keep=BACKUP_KEEP, max_age_days=BACKUP_MAX_AGE_DAYS):
+    """Удаление снимков сверх лимита количества и старше max_age_days"""
+    cutoff = datetime.now() - timedelta(days=max_age_days)
+    removed = []
+    for index, path in enumerate(list_snapshots(backup_dir)):
+        too_old = datetime.fromtimestamp(os.path.getmtime(path)) < cutoff
+        # Последний снимок не удаляется никогда
+        if index > 0 and (index >= keep or too_old):
+            os.remove(path)
+            removed.append(path)
+    return removed
+
+
+def create_snapshot(db_path=None, backup_dir=BACKUP_DIR, force=False,
+                    pages=BACKUP_PAGES_PER_STEP, pause=BACKUP_STEP_PAUSE):
+    """Создание снимка (полной копии базы), если данные изменились с момента предыдущего.
+
+    Возвращает путь к новому снимку или None, если снимок не понадобился.
+    """
+    os.makedirs(backup_dir, exist_ok=True)
+
+    if not force:
+        latest = latest_snapshot(backup_dir)
+        if latest:
+            conn = get_db_connection(db_path=db_path)
+            try:
+                current = get_change_count(conn.cursor())
+            finally:
+                conn.close()
+            if snapshot_change_count(latest) == current:
+                print(f"Данные не менялись с последнего снимка {latest}")
+                return None
+
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S_%f')
+    path = os.path.join(backup_dir, f"{BACKUP_PREFIX}{timestamp}.db")
+    started = time.perf_counter()
+    copy_database(path, db_path, pages, pause)
+    print(f"Снимок создан: {path} ({time.perf_counter() - started:.2f} с)")
+
+    for removed in apply_retention(backup_dir):
+        print(f"Удален старый снимок: {removed}")
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Резервное копирование базы данных заявок")
+    parser.add_argument('--db', default=None, help="рабочая база данных")
+    parser.add_argument('--dir', default=BACKUP_DIR, help="каталог снимков")
+    parser.add_argument('--every', type=int, default=0,
+                        help="интервал между снимками, секунды (0 = один снимок)")
+    parser.add_argument('--force', action='store_true', help="создать снимок, даже если данные не менялись")
+    parser.add_argument('--list', action='store_true', help="показать существующие снимки")
+    args = parser.parse_args()
+
+    if args.list:
+        for path in list_snapshots(args.dir):
+            size_mb = os.path.getsize(path) / (1024 * 1024)
+            print(f"{path}  {size_mb:.1f} МБ, версия данных: {snapshot_change_count(path)}")
+        return 0
+
+    while True:
+        try:
+            create_snapshot(args.db, args.dir, args.force)
+        except Exception as e:
+            print(f"Ошибка при создании снимка: {e}")
+            if not args.every:
+                return 1
+        if not args.every:
+            return 0
+        time.sleep(args.every)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
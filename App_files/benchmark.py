@@ -0,0 +1,381 @@
+# benchmark.py
+"""Замеры маршрутов API, страницы и импорта на базах разного размера.
+
+Для каждого размера генерируется синтетическая база (synthetic_data.py,
+кэшируется в BENCH_DIR по размеру и seed), копируется в рабочий каталог
+и замеряется в отдельном процессе: приложение использует относительные
+пути (база, реплика, логотип), поэтому процесс запускается в этом
+каталоге, а разные размеры не делят состояние модулей.
+
+Каждый случай выполняется через тестовый клиент Flask: сначала прогрев,
+затем --iterations замеров. Отдельно замеряется старт веб-процесса
+(импорт app и initialize_app в новом процессе); если при старте
+загружается pandas, numpy или другой тяжелый модуль, прогон завершается
+с ошибкой. Результаты пишутся в JSON; режим --compare
+сравнивает медианы двух прогонов и отмечает регрессии.
+
+Пример запуска:
+    python benchmark.py --sizes 1000 10000 100000 --output bench_new.json
+    python benchmark.py --startup --output startup.json
+    python benchmark.py --compare bench_old.json bench_new.json
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+BENCH_DIR = '.benchmarks'
+DEFAULT_SIZES = (1000, 10000, 100000)
+DEFAULT_ITERATIONS = 20
+WARMUP_ITERATIONS = 2
+# Строк в Excel-файле для замера load_data_from_xlsx
+IMPORT_ROWS = 2000
+IMPORT_ITERATIONS = 3
+# Регрессия: медиана выросла больше чем на столько (доля)...
+REGRESSION_THRESHOLD = 0.2
+# ...и больше чем на столько миллисекунд (меньшие различия - шум)
+REGRESSION_MIN_MS = 1.0
+
+# Запусков процесса при замере времени старта
+STARTUP_REPEATS = 10
+# Модули, которые веб-процесс не должен загружать при старте
+HEAVY_MODULES = ('pandas', 'numpy', 'openpyxl', 'matplotlib', 'pyarrow')
+# Код, который замеряет старт в новом процессе
+_STARTUP_PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+app.initialize_app(start_background=False)
+initialized = time.perf_counter()
+print(json.dumps({"import": imported - started, "initialize": initialized - imported,
+                  "heavy": [name for name in %r if name in sys.modules]}))
+"""
+
+# Пользователи синтетической базы по ролям (пароль SYNTHETIC_PASSWORD)
+ROLE_LOGINS = {'admin': 'admin', 'operator': 'operator', 'master': 'master1', 'client': 'client1'}
+
+# Случаи: имя -> (роль, метод, адрес, тело запроса). В адресе и теле
+# подставляются {request_id} (заявка из середины базы), {open_id}
+# (очередная открытая заявка), {master_id} (очередной мастер), {status}
+# (очередной статус для изменения).
+CASES = {
+    'page': ('admin', 'GET', '/', None),
+    'requests:admin': ('admin', 'GET', '/api/requests', None),
+    'requests:operator': ('operator', 'GET', '/api/requests', None),
+    'requests:master': ('master', 'GET', '/api/requests', None),
+    'requests:client': ('client', 'GET', '/api/requests', None),
+    'requests:aged': ('admin', 'GET', '/api/requests?sort=age&min_days=30', None),
+    'request': ('admin', 'GET', '/api/requests/{request_id}', None),
+    'history': ('admin', 'GET', '/api/requests/{request_id}/history', None),
+    'search:admin': ('admin', 'GET', '/api/requests/search?q=Xiaomi', None),
+    'search:client': ('client', 'GET', '/api/requests/search?q=Не', None),
+    'suggest:admin': ('admin', 'GET', '/api/requests/suggest?q=ив', None),
+    'suggest:master': ('master', 'GET', '/api/requests/suggest?q=к', None),
+    'stats': ('admin', 'GET', '/api/stats', None),
+    'stats:timeseries': ('admin', 'GET', '/api/stats/timeseries?granularity=month', None),
+    'stats:sla': ('admin', 'GET', '/api/stats/sla', None),
+    'masters': ('admin', 'GET', '/api/masters', None),
+    'export:csv': ('admin', 'GET', '/api/requests/export?format=csv', None),
+    'create': ('client', 'POST', '/api/requests', {
+        'tech_type': 'Кондиционер', 'tech_model': 'Bench', 'problem_description': 'Замер создания',
+        'client_fio': 'Клиент Замеров', 'client_phone': '89000000000'}),
+    'update': ('admin', 'PUT', '/api/requests/{open_id}', {'request_status': '{status}'}),
+    'assign': ('operator', 'PUT', '/api/requests/{open_id}/assign', {'master_id': '{master_id}'}),
+}
+UPDATE_STATUSES = ('В процессе ремонта', 'Ожидание комплектующих')
+
+
+# ========== Подготовка баз ==========
+def prepare_database(size, seed):
+    """Путь к синтетической базе размера size (генерируется один раз)"""
+    from synthetic_data import DEFAULT_END, DEFAULT_START, _epoch, create_schema, finalize, generate
+    from db import DB_PATH, get_db_connection
+
+    os.makedirs(BENCH_DIR, exist_ok=True)
+    path = os.path.join(BENCH_DIR, f"synthetic_{size}_{seed}.db")
+    if os.path.exists(path):
+        return path
+    print(f"Генерация базы на {size} заявок...")
+    partial = f"{path}.part"
+    if os.path.exists(partial):
+        os.remove(partial)
+    conn = get_db_connection(db_path=partial)
+    try:
+        conn.execute("PRAGMA journal_mode=OFF")
+        conn.execute("PRAGMA synchronous=OFF")
+        create_schema(conn, DB_PATH)
+        generate(conn, size, max(3, int(size ** 0.5)), max(1, size // 5), seed,
+                 (_epoch(DEFAULT_START), _epoch(DEFAULT_END)), progress=lambda message: None)
+        conn.commit()
+        finalize(conn)
+    finally:
+        conn.close()
+    os.replace(partial, path)
+    return path
+
+
+def make_import_file(db_path, rows, path):
+    """Excel-файл заявок в формате service_requests_combined.xlsx из первых rows заявок базы"""
+    import pandas as pd
+
+    conn = sqlite3.connect(f"file:{os.path.abspath(db_path)}?mode=ro", uri=True)
+    try:
+        df = pd.read_sql_query('''
+            SELECT r.request_id, r.start_date, r.tech_type, r.tech_model, r.problem_description,
+                   r.request_status, r.completion_date, r.days_in_process, r.repair_parts,
+                   r.has_comment, r.comment_message, r.master_id, r.master_fio, r.master_phone,
+                   m.master_login, m.master_type, r.client_fio, r.client_phone, r.client_login,
+                   r.comment_master_id
+            FROM service_requests r LEFT JOIN masters m ON m.id = r.master_id
+            ORDER BY r.request_id LIMIT ?
+        ''', conn, params=(rows,), parse_dates=['start_date', 'completion_date'])
+    finally:
+        conn.close()
+    df.to_excel(path, sheet_name='Sheet1', index=False)
+
+
+# ========== Замеры (в рабочем процессе) ==========
+def summarize(samples):
+    """Статистика времен (миллисекунды)"""
+    ordered = sorted(samples)
+    return {
+        "iterations": len(samples),
+        "min_ms": round(ordered[0] * 1000, 3),
+        "median_ms": round(statistics.median(ordered) * 1000, 3),
+        "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 3),
+        "mean_ms": round(statistics.fmean(ordered) * 1000, 3),
+        "stdev_ms": round(statistics.stdev(ordered) * 1000, 3) if len(ordered) > 1 else 0.0,
+    }
+
+
+def measure(func, iterations, warmup=WARMUP_ITERATIONS):
+    """Времена выполнения func после прогрева; func получает номер итерации"""
+    for i in range(warmup):
+        func(i)
+    samples = []
+    for i in range(iterations):
+        started = time.perf_counter()
+        func(warmup + i)
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def _fill(template, values):
+    """Подстановка значений; строка вида '{name}' заменяется самим значением (с типом)"""
+    if isinstance(template, dict):
+        return {key: _fill(value, values) for key, value in template.items()}
+    if isinstance(template, str):
+        if template.startswith('{') and template.endswith('}') and template[1:-1] in values:
+            return values[template[1:-1]]
+        return template.format(**values)
+    return template
+
+
+def run_worker(iterations, import_iterations):
+    """Замер всех случаев в текущем каталоге; возвращает словарь результатов"""
+    # Реплика строится один раз до замеров и не обновляется в фоне во время них
+    import replica
+    replica.REPLICA_REFRESH_CHANGES = replica.REPLICA_REFRESH_INTERVAL = float('inf')
+    replica.refresh_replica(force=True)
+    # Замеряются обработчики, а не лимиты частоты
+    import rate_limit
+    rate_limit.RATE_LIMIT_ENABLED = False
+
+    started = time.perf_counter()
+    import app as application
+    imported = time.perf_counter()
+    application.initialize_app()
+    from synthetic_data import SYNTHETIC_PASSWORD, create_schema
+    results = {
+        "app_import_ms": round((imported - started) * 1000, 3),
+        "app_initialize_ms": round((time.perf_counter() - imported) * 1000, 3),
+        "cases": {},
+    }
+
+    conn = sqlite3.connect('service_requests.db')
+    total = conn.execute("SELECT COUNT(*) FROM service_requests").fetchone()[0]
+    request_id = conn.execute("SELECT request_id FROM service_requests ORDER BY request_id LIMIT 1 OFFSET ?",
+                              (total // 2,)).fetchone()[0]
+    open_ids = [row[0] for row in conn.execute(
+        "SELECT request_id FROM service_requests WHERE completion_date IS NULL ORDER BY request_id LIMIT 500")]
+    master_ids = [row[0] for row in conn.execute("SELECT id FROM masters ORDER BY id")]
+    conn.close()
+
+    clients = {}
+    for role, login in ROLE_LOGINS.items():
+        clients[role] = application.app.test_client()
+        response = clients[role].post('/', data={'login': login, 'password': SYNTHETIC_PASSWORD})
+        if response.status_code != 200:
+            raise RuntimeError(f"Не удалось войти как {login}")
+
+    for name, (role, method, url, body) in CASES.items():
+        errors = []
+
+        def call(i):
+            values = {
+                'request_id': request_id,
+                'open_id': open_ids[i % len(open_ids)] if open_ids else request_id,
+                'master_id': master_ids[i % len(master_ids)],
+                'status': UPDATE_STATUSES[i % len(UPDATE_STATUSES)],
+            }
+            response = clients[role].open(_fill(url, values), method=method, json=_fill(body, values))
+            response.get_data()
+            if response.status_code >= 400:
+                errors.append(response.status_code)
+
+        samples = measure(call, iterations)
+        results["cases"][name] = {**summarize(samples), "errors": len(errors)}
+
+    def load(i):
+        conn = sqlite3.connect(':memory:')
+        create_schema(conn, 'service_requests.db')
+        application.load_data_from_xlsx(conn, conn.cursor())
+        conn.close()
+
+    samples = measure(load, import_iterations, warmup=0)
+    results["cases"]["import:load_data_from_xlsx"] = {**summarize(samples), "errors": 0}
+    return results
+
+
+def run_size(size, seed, iterations, import_rows, import_iterations):
+    """Замер одного размера в отдельном процессе во временном каталоге"""
+    source = prepare_database(size, seed)
+    workdir = tempfile.mkdtemp(prefix=f'bench_{size}_')
+    try:
+        shutil.copy(source, os.path.join(workdir, 'service_requests.db'))
+        make_import_file(source, import_rows, os.path.join(workdir, 'service_requests_combined.xlsx'))
+        output = os.path.join(workdir, 'result.json')
+        # Вывод приложения (журнал медленных запросов, импорт) уходит в файл
+        log_path = os.path.join(BENCH_DIR, f"worker_{size}.log")
+        with open(log_path, 'w', encoding='utf-8') as log:
+            process = subprocess.run([sys.executable, os.path.abspath(__file__), '--worker', output,
+                                      '--iterations', str(iterations),
+                                      '--import-iterations', str(import_iterations)],
+                                     cwd=workdir, stdout=log, stderr=subprocess.STDOUT)
+        if process.returncode != 0:
+            raise RuntimeError(f"Замер размера {size} завершился с ошибкой, см. {log_path}")
+        with open(output, encoding='utf-8') as f:
+            result = json.load(f)
+        for name, case in result["cases"].items():
+            errors = f", ошибок: {case['errors']}" if case["errors"] else ''
+            print(f"  {name:<28} медиана {case['median_ms']:>10.3f} мс, p95 {case['p95_ms']:>10.3f} мс{errors}")
+        return result
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+# ========== Время старта ==========
+def measure_startup(repeats=STARTUP_REPEATS):
+    """Время запуска веб-процесса: импорт app, initialize_app и весь процесс целиком"""
+    from db import DB_PATH
+
+    workdir = tempfile.mkdtemp(prefix='bench_startup_')
+    try:
+        shutil.copy(DB_PATH, os.path.join(workdir, 'service_requests.db'))
+        env = {**os.environ, 'PYTHONPATH': os.path.dirname(os.path.abspath(__file__))}
+        probe = _STARTUP_PROBE % (HEAVY_MODULES,)
+        samples = {"process": [], "import": [], "initialize": []}
+        heavy = set()
+        for _ in range(repeats):
+            started = time.perf_counter()
+            process = subprocess.run([sys.executable, '-c', probe], cwd=workdir, env=env,
+                                     capture_output=True, text=True, check=True)
+            samples["process"].append(time.perf_counter() - started)
+            probe_result = json.loads(process.stdout.strip().splitlines()[-1])
+            samples["import"].append(probe_result["import"])
+            samples["initialize"].append(probe_result["initialize"])
+            heavy.update(probe_result["heavy"])
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return {"cases": {f"startup:{name}": {**summarize(values), "errors": 0} for name, values in samples.items()},
+            "heavy_modules": sorted(heavy)}
+
+
+# ========== Сравнение ==========
+def compare(baseline, current, threshold=REGRESSION_THRESHOLD, min_ms=REGRESSION_MIN_MS):
+    """Сравнение медиан двух прогонов, возвращает список регрессий"""
+    regressions = []
+    print(f"{'размер':>8} {'случай':<28} {'было, мс':>10} {'стало, мс':>10} {'изменение':>10}")
+    for size, result in current["sizes"].items():
+        base_cases = baseline["sizes"].get(size, {}).get("cases", {})
+        for name, case in result["cases"].items():
+            if name not in base_cases:
+                continue
+            before, after = base_cases[name]["median_ms"], case["median_ms"]
+            change = (after - before) / before if before else 0.0
+            regressed = change > threshold and after - before > min_ms
+            marker = '  РЕГРЕССИЯ' if regressed else ''
+            print(f"{size:>8} {name:<28} {before:>10.3f} {after:>10.3f} {change:>+9.1%}{marker}")
+            if regressed:
+                regressions.append({"size": size, "case": name, "before_ms": before, "after_ms": after})
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Замеры API и импорта на синтетических базах")
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(DEFAULT_SIZES), help="число заявок в базах")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--iterations', type=int, default=DEFAULT_ITERATIONS)
+    parser.add_argument('--import-rows', type=int, default=IMPORT_ROWS)
+    parser.add_argument('--import-iterations', type=int, default=IMPORT_ITERATIONS)
+    parser.add_argument('--output', default=None, help="файл результатов (по умолчанию в BENCH_DIR)")
+    parser.add_argument('--compare', nargs=2, metavar=('BASELINE', 'CURRENT'), help="сравнить два файла результатов")
+    parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD, help="допустимый рост медианы")
+    parser.add_argument('--startup', action='store_true', help="замерить только время старта веб-процесса")
+    parser.add_argument('--worker', metavar='OUTPUT', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        results = run_worker(args.iterations, args.import_iterations)
+        with open(args.worker, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False)
+        return 0
+
+    if args.compare:
+        with open(args.compare[0], encoding='utf-8') as f:
+            baseline = json.load(f)
+        with open(args.compare[1], encoding='utf-8') as f:
+            current = json.load(f)
+        regressions = compare(baseline, current, args.threshold)
+        print(f"Регрессий: {len(regressions)}")
+        return 1 if regressions else 0
+
+    results = {
+        "created_at": datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "seed": args.seed,
+        "iterations": args.iterations,
+        "sizes": {},
+    }
+    # Время старта - отдельный "размер" результатов, сравнивается вместе с остальными
+    startup = measure_startup()
+    results["sizes"]["startup"] = startup
+    for name, case in startup["cases"].items():
+        print(f"  {name:<28} медиана {case['median_ms']:>10.3f} мс, p95 {case['p95_ms']:>10.3f} мс")
+    if startup["heavy_modules"]:
+        print(f"При старте загружаются тяжелые модули: {', '.join(startup['heavy_modules'])}")
+    if not args.startup:
+        for size in args.sizes:
+            print(f"Размер {size}:")
+            results["sizes"][str(size)] = run_size(size, args.seed, args.iterations,
+                                                   args.import_rows, args.import_iterations)
+    output = args.output or os.path.join(BENCH_DIR, f"bench_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"Результаты: {output}")
+    return 1 if startup["heavy_modules"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
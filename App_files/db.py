@@ -0,0 +1,160 @@
+# db.py
+import sqlite3
+from datetime import datetime
+
+from metrics import TimedConnection
+
+# ========== Подключение к базе данных ==========
+DB_PATH = 'service_requests.db'
+# Сколько секунд соединение ждет освобождения блокировки записи,
+# прежде чем вернуть "database is locked"
+DB_TIMEOUT = 30
+
+# Поля, обязательные при создании заявки
+REQUIRED_REQUEST_FIELDS = ('tech_type', 'tech_model', 'problem_description', 'client_fio', 'client_phone')
+
+
+def get_db_connection(row_factory=False, db_path=None):
+    """Открытие соединения с базой данных с ожиданием блокировок"""
+    conn = sqlite3.connect(db_path or DB_PATH, timeout=DB_TIMEOUT, factory=TimedConnection)
+    if row_factory:
+        conn.row_factory = sqlite3.Row
+    return conn
+
+
+def enable_wal(cursor):
+    """Включение режима WAL: читатели не блокируют писателя и наоборот"""
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+
+
+# ========== Счетчик изменений данных ==========
+# Таблицы, изменение которых увеличивает счетчик (версию данных)
+TRACKED_TABLES = ('service_requests', 'status_history', 'masters')
+
+
+def ensure_change_counter(cursor):
+    """Создание счетчика изменений и триггеров, которые его увеличивают.
+
+    Счетчик ведется триггерами, поэтому учитывает запись из любого процесса
+    (приложение, импорт, архивирование) и переживает перезапуск.
+    """
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS data_changes (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        change_count INTEGER NOT NULL
+    )
+    ''')
+    cursor.execute("INSERT OR IGNORE INTO data_changes (id, change_count) VALUES (1, 0)")
+    for table in TRACKED_TABLES:
+        for event in ('INSERT', 'UPDATE', 'DELETE'):
+            cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_{event.lower()}_changes
+            AFTER {event} ON {table}
+            BEGIN
+                UPDATE data_changes SET change_count = change_count + 1 WHERE id = 1;
+            END
+            ''')
+
+
+def get_change_count(cursor):
+    """Текущая версия данных (количество изменений отслеживаемых таблиц)"""
+    cursor.execute("SELECT change_count FROM data_changes WHERE id = 1")
+    row = cursor.fetchone()
+    return row[0] if row else 0
+
+
+def ensure_updated_at_trigger(cursor):
+    """Триггер, обновляющий updated_at при любом изменении заявки.
+
+    Выгрузки сравнивают updated_at, чтобы находить изменившиеся строки,
+    поэтому он должен меняться и при записи, которая его не указывает
+    (назначение мастера, архивирование, ручные правки).
+    """
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS trg_service_requests_touch
+    AFTER UPDATE ON service_requests
+    WHEN NEW.updated_at IS OLD.updated_at
+    BEGIN
+        UPDATE service_requests SET updated_at = datetime('now', 'localtime') WHERE id = NEW.id;
+    END
+    ''')
+
+
+# ========== Выдача номеров заявок ==========
+def ensure_request_sequence(cursor):
+    """Создание таблицы-счетчика номеров заявок (если ее нет)"""
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS request_id_sequence (
+        name TEXT PRIMARY KEY,
+        last_value INTEGER NOT NULL
+    )
+    ''')
+    cursor.execute('''
+    INSERT OR IGNORE INTO request_id_sequence (name, last_value)
+    SELECT 'service_requests', COALESCE(MAX(request_id), 0) FROM service_requests
+    ''')
+
+
+def allocate_request_ids(cursor, count=1):
+    """Резервирование диапазона номеров заявок.
+
+    Должна вызываться внутри транзакции записи (BEGIN IMMEDIATE), тогда
+    UPDATE и SELECT выполняются атомарно и два писателя не получат один номер.
+    Счетчик никогда не опускается ниже MAX(request_id), поэтому заявки,
+    загруженные импортом с явными номерами, тоже учитываются.
+    Возвращает первый номер диапазона.
+    """
+    cursor.execute('''
+    UPDATE request_id_sequence
+    SET last_value = MAX(last_value, (SELECT COALESCE(MAX(request_id), 0) FROM service_requests)) + ?
+    WHERE name = 'service_requests'
+    ''', (count,))
+    cursor.execute("SELECT last_value FROM request_id_sequence WHERE name = 'service_requests'")
+    return cursor.fetchone()[0] - count + 1
+
+
+def validate_request_data(data):
+    """Проверка данных новой заявки, возвращает текст ошибки или None"""
+    if not isinstance(data, dict):
+        return "Ожидается объект заявки"
+    missing = [field for field in REQUIRED_REQUEST_FIELDS if not data.get(field)]
+    if missing:
+        return f"Не заполнены обязательные поля: {', '.join(missing)}"
+    return None
+
+
+def insert_service_requests(conn, items, client_login=''):
+    """Создание одной или нескольких заявок в одной короткой транзакции записи.
+
+    Номера выделяются одним блоком, строки вставляются через executemany.
+    Возвращает список выданных request_id в порядке items.
+    """
+    cursor = conn.cursor()
+    now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    try:
+        cursor.execute("BEGIN IMMEDIATE")
+        first_id = allocate_request_ids(cursor, len(items))
+        request_ids = list(range(first_id, first_id + len(items)))
+        cursor.executemany('''
+            INSERT INTO service_requests (
+                request_id, start_date, tech_type, tech_model, problem_description,
+                request_status, client_fio, client_phone, client_login, equipment_type_id
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', [(
+            request_id,
+            now,
+            item['tech_type'],
+            item['tech_model'],
+            item['problem_description'],
+            'Новая заявка',
+            item['client_fio'],
+            item['client_phone'],
+            item.get('client_login') or client_login,
+            item.get('equipment_type_id')
+        ) for request_id, item in zip(request_ids, items)])
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return request_ids
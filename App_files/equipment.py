@@ -0,0 +1,222 @@
+# equipment.py
+"""Справочник типов и моделей оборудования (equipment_types).
+
+Заявка ссылается на пару тип/модель справочника через
+service_requests.equipment_type_id; статистика группирует заявки по этому
+целочисленному индексированному столбцу, а названия берет из справочника.
+Текстовые tech_type и tech_model остаются в строке заявки как копия для
+вывода, поиска, выгрузок и отчетов (так же хранится ФИО мастера).
+
+Справочник заполняется из существующих заявок при миграции
+(ensure_equipment_catalog). Заявки, записанные в обход приложения (импорт
+из Excel, ETL, генератор), получают equipment_type_id триггером.
+
+Копия справочника держится в памяти (EquipmentCatalog): проверка типа при
+создании заявки и подсказки формы не обращаются к базе. Новые записи
+справочника дочитываются по id > последнего известного при промахе.
+
+Пример запуска:
+    python equipment.py     # миграция и заполнение справочника
+"""
+import sys
+import threading
+
+from archive import ARCHIVE_TABLE
+from db import get_db_connection, ensure_updated_at_trigger
+
+EQUIPMENT_TABLE = 'equipment_types'
+# Роли, которые могут создавать заявки с новым типом оборудования
+# (клиенты выбирают тип из справочника)
+EQUIPMENT_NEW_TYPE_ROLES = ('admin', 'manager', 'operator')
+
+# Без OR IGNORE: в триггере его заменяет политика внешней команды (у upsert
+# ETL это ABORT), поэтому существующая пара пропускается через NOT EXISTS
+_ASSIGN_ID = f'''
+    INSERT INTO {EQUIPMENT_TABLE} (tech_type, tech_model)
+    SELECT NEW.tech_type, NEW.tech_model
+    WHERE NOT EXISTS (
+        SELECT 1 FROM {EQUIPMENT_TABLE} WHERE tech_type = NEW.tech_type AND tech_model = NEW.tech_model
+    );
+    UPDATE service_requests SET equipment_type_id = (
+        SELECT id FROM {EQUIPMENT_TABLE} WHERE tech_type = NEW.tech_type AND tech_model = NEW.tech_model
+    ) WHERE id = NEW.id;
+'''
+
+
+def _columns(cursor, table):
+    cursor.execute(f"PRAGMA table_info({table})")
+    return [row[1] for row in cursor.fetchall()]
+
+
+def _backfill(cursor, table):
+    """Пары тип/модель строк table без equipment_type_id - в справочник, id - в строки"""
+    cursor.execute(f'''
+    INSERT OR IGNORE INTO {EQUIPMENT_TABLE} (tech_type, tech_model)
+    SELECT DISTINCT tech_type, tech_model FROM {table}
+    WHERE equipment_type_id IS NULL AND tech_type IS NOT NULL AND tech_model IS NOT NULL
+    ''')
+    cursor.execute(f'''
+    UPDATE {table} SET equipment_type_id = (
+        SELECT e.id FROM {EQUIPMENT_TABLE} e
+        WHERE e.tech_type = {table}.tech_type AND e.tech_model = {table}.tech_model
+    )
+    WHERE equipment_type_id IS NULL AND tech_type IS NOT NULL AND tech_model IS NOT NULL
+    ''')
+    return cursor.rowcount
+
+
+def ensure_equipment_catalog(cursor):
+    """Справочник оборудования, ссылка на него из заявок, индекс и триггеры.
+
+    Вызывается после ensure_archive_schema: архивные заявки тоже получают
+    equipment_type_id. Возвращает число заполненных строк заявок.
+    """
+    cursor.execute(f'''
+    CREATE TABLE IF NOT EXISTS {EQUIPMENT_TABLE} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        tech_type TEXT NOT NULL,
+        tech_model TEXT NOT NULL,
+        UNIQUE(tech_type, tech_model)
+    )
+    ''')
+    cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = ?", (ARCHIVE_TABLE,))
+    tables = ['service_requests'] + [row[0] for row in cursor.fetchall()]
+    # Заполнение ссылки - не изменение заявки: триггер updated_at на это время снимается
+    cursor.execute("DROP TRIGGER IF EXISTS trg_service_requests_touch")
+    filled = 0
+    for table in tables:
+        if 'equipment_type_id' not in _columns(cursor, table):
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN equipment_type_id INTEGER")
+        filled += _backfill(cursor, table)
+    ensure_updated_at_trigger(cursor)
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_service_requests_equipment_type
+    ON service_requests(equipment_type_id)
+    ''')
+    # Триггеры пересоздаются, чтобы базы со старым телом триггеров получили текущее
+    cursor.execute("DROP TRIGGER IF EXISTS trg_service_requests_equipment_insert")
+    cursor.execute("DROP TRIGGER IF EXISTS trg_service_requests_equipment_update")
+    cursor.execute(f'''
+    CREATE TRIGGER trg_service_requests_equipment_insert
+    AFTER INSERT ON service_requests
+    WHEN NEW.equipment_type_id IS NULL AND NEW.tech_type IS NOT NULL AND NEW.tech_model IS NOT NULL
+    BEGIN {_ASSIGN_ID} END
+    ''')
+    cursor.execute(f'''
+    CREATE TRIGGER trg_service_requests_equipment_update
+    AFTER UPDATE OF tech_type, tech_model ON service_requests
+    WHEN NEW.tech_type IS NOT NULL AND NEW.tech_model IS NOT NULL
+    BEGIN {_ASSIGN_ID} END
+    ''')
+    return filled
+
+
+def _normalize(value):
+    """Значение формы без лишних пробелов"""
+    return ' '.join(str(value).split())
+
+
+class EquipmentCatalog:
+    """Копия справочника оборудования в памяти"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (тип, модель) -> id
+        self._ids = {}
+        # тип без учета регистра -> написание в справочнике
+        self._types = {}
+        # тип -> {модель без учета регистра -> написание в справочнике}
+        self._models = {}
+        self._last_id = 0
+
+    def refresh(self):
+        """Дочитать записи справочника, добавленные после последнего чтения"""
+        conn = get_db_connection()
+        try:
+            rows = conn.execute(f"SELECT id, tech_type, tech_model FROM {EQUIPMENT_TABLE} WHERE id > ? ORDER BY id",
+                                (self._last_id,)).fetchall()
+        finally:
+            conn.close()
+        with self._lock:
+            for equipment_id, tech_type, tech_model in rows:
+                self._ids[(tech_type, tech_model)] = equipment_id
+                self._types.setdefault(tech_type.casefold(), tech_type)
+                self._models.setdefault(tech_type, {}).setdefault(tech_model.casefold(), tech_model)
+                self._last_id = max(self._last_id, equipment_id)
+        return len(rows)
+
+    def _lookup(self, tech_type, tech_model):
+        with self._lock:
+            canonical_type = self._types.get(tech_type.casefold())
+            if canonical_type is None:
+                return None, tech_model, None
+            canonical_model = self._models[canonical_type].get(tech_model.casefold(), tech_model)
+            return canonical_type, canonical_model, self._ids.get((canonical_type, canonical_model))
+
+    def resolve(self, tech_type, tech_model):
+        """(тип, модель, id) в написании справочника; тип None - тип не найден, id None - новая модель"""
+        tech_type, tech_model = _normalize(tech_type), _normalize(tech_model)
+        found = self._lookup(tech_type, tech_model)
+        if found[0] is None or found[2] is None:
+            # Промах: запись могла появиться после последнего чтения
+            if self.refresh():
+                found = self._lookup(tech_type, tech_model)
+        if found[0] is None:
+            return None, tech_model, None
+        return found
+
+    def types(self):
+        """[{"tech_type", "models"}] по алфавиту для подсказок формы"""
+        with self._lock:
+            return [{"tech_type": tech_type, "models": sorted(self._models[tech_type].values())}
+                    for tech_type in sorted(self._models)]
+
+
+catalog = EquipmentCatalog()
+_loaded = False
+_load_lock = threading.Lock()
+
+
+def get_catalog():
+    """Справочник в памяти; при первом обращении загружается целиком"""
+    global _loaded
+    if not _loaded:
+        with _load_lock:
+            if not _loaded:
+                catalog.refresh()
+                _loaded = True
+    return catalog
+
+
+def resolve_equipment(item, allow_new_type=False):
+    """Приведение tech_type и tech_model заявки к справочнику.
+
+    Записывает в item написание справочника и equipment_type_id (None для
+    новой пары - ее добавит триггер). Возвращает текст ошибки или None.
+    """
+    tech_type, tech_model, equipment_id = get_catalog().resolve(item['tech_type'], item['tech_model'])
+    if tech_type is None:
+        if not allow_new_type:
+            return f"Неизвестный тип оборудования: {_normalize(item['tech_type'])}. Выберите тип из списка"
+        tech_type = _normalize(item['tech_type'])
+    if not tech_type or not tech_model:
+        return "Не указаны тип или модель оборудования"
+    item['tech_type'], item['tech_model'], item['equipment_type_id'] = tech_type, tech_model, equipment_id
+    return None
+
+
+def main():
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        filled = ensure_equipment_catalog(cursor)
+        conn.commit()
+        count = cursor.execute(f"SELECT COUNT(*) FROM {EQUIPMENT_TABLE}").fetchone()[0]
+    finally:
+        conn.close()
+    print(f"Справочник оборудования: {count} записей, заполнено заявок: {filled}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
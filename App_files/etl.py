@@ -0,0 +1,426 @@
+# etl.py
+"""Инкрементальная сборка объединенной таблицы заявок.
+
+Заменяет create_combined_table из Data_analysis.ipynb. Для исходных файлов
+(inputDataRequests.xlsx, inputDataComments.xlsx, inputDataUsers.xlsx)
+запоминаются отпечатки и хэши строк, поэтому при повторном запуске:
+    - неизмененные файлы не перечитываются из Excel (берутся из кэша);
+    - объединяются только заявки, затронутые изменившимися строками;
+    - в базу приложения записываются только эти заявки.
+Файлы service_requests_combined.xlsx/csv/json пишутся параллельно.
+
+Пример запуска:
+    python etl.py --source-dir ../Data_Analysis --output-dir ../Data_Analysis
+    python etl.py --formats csv,json --force
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import pandas as pd
+
+from archive import ARCHIVE_TABLE
+from db import get_db_connection
+
+# Исходные файлы и ключевые столбцы их строк
+SOURCE_FILES = {
+    'requests': 'inputDataRequests.xlsx',
+    'comments': 'inputDataComments.xlsx',
+    'users': 'inputDataUsers.xlsx',
+}
+SOURCE_KEYS = {
+    'requests': 'requestID',
+    'comments': 'requestID',
+    'users': 'userID',
+}
+
+# Переименование столбцов исходных файлов (как в ноутбуке)
+COLUMN_MAPPING = {
+    'requestID': 'request_id',
+    'startDate': 'start_date',
+    'climateTechType': 'tech_type',
+    'climateTechModel': 'tech_model',
+    'problemDescryption': 'problem_description',
+    'requestStatus': 'request_status',
+    'completionDate': 'completion_date',
+    'repairParts': 'repair_parts',
+    'masterID': 'master_id',
+    'clientID': 'client_id',
+    'commentID': 'comment_id',
+    'message': 'comment_message',
+    'comment_masterID': 'comment_master_id'
+}
+
+COMBINED_COLUMNS = [
+    'id', 'request_id', 'start_date', 'tech_type', 'tech_model', 'problem_description',
+    'request_status', 'completion_date', 'days_in_process', 'repair_parts', 'has_comment',
+    'comment_message', 'master_id', 'master_fio', 'master_phone', 'master_login', 'master_type',
+    'client_id', 'client_fio', 'client_phone', 'client_login', 'client_type', 'comment_master_id'
+]
+
+# Столбцы service_requests, которые пишет ETL (первый - ключ)
+DB_REQUEST_COLUMNS = (
+    'request_id', 'start_date', 'tech_type', 'tech_model', 'problem_description',
+    'request_status', 'completion_date', 'days_in_process', 'repair_parts',
+    'has_comment', 'comment_message', 'master_id', 'master_fio', 'master_phone',
+    'client_fio', 'client_phone', 'client_login', 'comment_master_id'
+)
+# Сколько номеров проверяется в архиве одним запросом
+ARCHIVE_LOOKUP_CHUNK = 500
+
+OUTPUT_NAME = 'service_requests_combined'
+OUTPUT_FORMATS = ('xlsx', 'csv', 'json')
+CACHE_DIR_NAME = '.etl_cache'
+
+
+# ========== Состояние загрузки ==========
+def ensure_etl_schema(cursor):
+    """Таблицы состояния ETL в базе приложения"""
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS etl_files (
+        source TEXT PRIMARY KEY,
+        path TEXT NOT NULL,
+        size INTEGER NOT NULL,
+        mtime_ns INTEGER NOT NULL,
+        sha256 TEXT NOT NULL,
+        loaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS etl_row_hashes (
+        source TEXT NOT NULL,
+        row_key INTEGER NOT NULL,
+        row_hash INTEGER NOT NULL,
+        PRIMARY KEY (source, row_key)
+    )
+    ''')
+
+
+def find_source_file(source_dir, filename):
+    """Поиск исходного файла в каталоге и его подкаталогах"""
+    for root, _, files in os.walk(source_dir):
+        if filename in files:
+            return os.path.join(root, filename)
+    return None
+
+
+def file_sha256(path):
+    """Хэш содержимого файла"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def load_source(cursor, source, path, cache_dir, force=False):
+    """Чтение исходного файла: из кэша, если файл не менялся, иначе из Excel.
+
+    Возвращает (DataFrame, отпечаток файла, признак изменения).
+    """
+    stat = os.stat(path)
+    cursor.execute("SELECT size, mtime_ns, sha256 FROM etl_files WHERE source = ?", (source,))
+    previous = cursor.fetchone()
+    cache_path = os.path.join(cache_dir, f"{source}.pkl")
+
+    # Размер и время изменения совпали - файл заведомо тот же, хэш не считаем
+    if previous and previous[0] == stat.st_size and previous[1] == stat.st_mtime_ns:
+        sha256 = previous[2]
+    else:
+        sha256 = file_sha256(path)
+    fingerprint = (source, path, stat.st_size, stat.st_mtime_ns, sha256)
+
+    changed = force or previous is None or previous[2] != sha256
+    if not changed and os.path.exists(cache_path):
+        return pd.read_pickle(cache_path), fingerprint, False
+
+    df = pd.read_excel(path)
+    df.to_pickle(cache_path)
+    return df, fingerprint, changed
+
+
+def row_hashes(df, key):
+    """Хэши строк по ключу (несколько строк с одним ключом хэшируются вместе)"""
+    hashes = pd.util.hash_pandas_object(df, index=False).astype('int64')
+    if df[key].is_unique:
+        return dict(zip(df[key].astype('int64'), hashes))
+    grouped = hashes.groupby(df[key].astype('int64').values).agg(lambda s: hash(tuple(s)))
+    return grouped.to_dict()
+
+
+def diff_row_hashes(cursor, source, hashes):
+    """Ключи новых/измененных и удаленных строк по сравнению с прошлым запуском"""
+    cursor.execute("SELECT row_key, row_hash FROM etl_row_hashes WHERE source = ?", (source,))
+    previous = dict(cursor.fetchall())
+    changed = {key for key, value in hashes.items() if previous.get(key) != value}
+    deleted = set(previous) - set(hashes)
+    return changed, deleted
+
+
+# ========== Объединение ==========
+def compute_days_in_process(df):
+    """Количество дней в работе (для новых заявок не считается)"""
+    end = df['completion_date'].fillna(pd.Timestamp.now())
+    days = (end - df['start_date']).dt.days
+    active = df['start_date'].notna() & (df['request_status'] != 'Новая заявка')
+    return days.where(active).astype('Int64')
+
+
+def merge_requests(df_requests, df_comments, df_users):
+    """Объединение заявок с комментариями и данными клиентов и мастеров"""
+    df_combined = df_requests.copy()
+
+    # Один комментарий на заявку (последний), чтобы номер заявки оставался уникальным
+    comments_info = (df_comments.drop_duplicates('requestID', keep='last')
+                     .set_index('requestID')[['message', 'masterID']]
+                     .rename(columns={'masterID': 'comment_masterID'}))
+    df_combined = df_combined.merge(comments_info, left_on='requestID', right_index=True, how='left')
+
+    users = df_users.set_index('userID')[['fio', 'phone', 'login', 'type']]
+    client_info = users.rename(columns={
+        'fio': 'client_fio', 'phone': 'client_phone', 'login': 'client_login', 'type': 'client_type'
+    })
+    df_combined = df_combined.merge(client_info, left_on='clientID', right_index=True, how='left')
+    master_info = users.rename(columns={
+        'fio': 'master_fio', 'phone': 'master_phone', 'login': 'master_login', 'type': 'master_type'
+    })
+    df_combined = df_combined.merge(master_info, left_on='masterID', right_index=True, how='left')
+
+    df_combined = df_combined.rename(columns=COLUMN_MAPPING)
+    for col in ('start_date', 'completion_date'):
+        df_combined[col] = pd.to_datetime(df_combined[col], errors='coerce')
+    df_combined['days_in_process'] = compute_days_in_process(df_combined)
+    df_combined['has_comment'] = df_combined['comment_message'].notna()
+    return df_combined
+
+
+def finalize_combined(df_combined):
+    """Сортировка, сквозной id и порядок столбцов, как в ноутбуке"""
+    df_combined = df_combined.sort_values(['request_id', 'start_date']).reset_index(drop=True)
+    df_combined['id'] = range(1, len(df_combined) + 1)
+    df_combined['days_in_process'] = compute_days_in_process(df_combined)
+    return df_combined[[col for col in COMBINED_COLUMNS if col in df_combined.columns]]
+
+
+# ========== Запись результатов ==========
+def write_output(df_combined, fmt, output_dir):
+    """Запись объединенной таблицы в один формат (выполняется в отдельном процессе)"""
+    path = os.path.join(output_dir, f"{OUTPUT_NAME}.{fmt}")
+    if fmt == 'xlsx':
+        df_combined.to_excel(path, index=False)
+    elif fmt == 'csv':
+        df_combined.to_csv(path, index=False, encoding='utf-8-sig', sep=';')
+    elif fmt == 'json':
+        data = df_combined.astype(object).where(df_combined.notna(), None)
+        for col in ('start_date', 'completion_date'):
+            data[col] = df_combined[col].dt.strftime('%Y-%m-%d').astype(object).where(df_combined[col].notna(), None)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(data.to_dict(orient='records'), f, ensure_ascii=False, indent=2, default=str)
+    else:
+        raise ValueError(f"Неизвестный формат: {fmt}")
+    return path
+
+
+def write_outputs(df_combined, output_dir, formats):
+    """Параллельная запись всех форматов"""
+    with ProcessPoolExecutor(max_workers=len(formats)) as pool:
+        futures = [pool.submit(write_output, df_combined, fmt, output_dir) for fmt in formats]
+        return [future.result() for future in futures]
+
+
+def db_value(value):
+    """Преобразование значения pandas в значение для SQLite"""
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return None
+    if isinstance(value, pd.Timestamp):
+        return value.strftime('%Y-%m-%d %H:%M:%S')
+    if hasattr(value, 'item'):
+        return value.item()
+    return value
+
+
+def text_value(value):
+    """Текстовое значение (номера телефонов после объединения становятся float)"""
+    value = db_value(value)
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return '' if value is None else str(value)
+
+
+def archived_request_ids(cursor, request_ids):
+    """Номера из request_ids, которые уже лежат в архивной таблице"""
+    cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = ?", (ARCHIVE_TABLE,))
+    if cursor.fetchone() is None:
+        return set()
+    archived = set()
+    for start in range(0, len(request_ids), ARCHIVE_LOOKUP_CHUNK):
+        chunk = request_ids[start:start + ARCHIVE_LOOKUP_CHUNK]
+        cursor.execute(f"SELECT request_id FROM {ARCHIVE_TABLE} WHERE request_id IN ({', '.join('?' * len(chunk))})",
+                       chunk)
+        archived.update(row[0] for row in cursor.fetchall())
+    return archived
+
+
+def feed_database(cursor, df_rows):
+    """Запись объединенных заявок в базу приложения (вставка или обновление)"""
+    masters = df_rows[['master_id', 'master_fio', 'master_phone', 'master_login', 'master_type']].dropna()
+    cursor.executemany('''
+        INSERT OR IGNORE INTO masters (id, master_fio, master_phone, master_login, master_type)
+        VALUES (?, ?, ?, ?, ?)
+    ''', [(int(row.master_id), row.master_fio, text_value(row.master_phone), row.master_login, row.master_type)
+          for row in masters.drop_duplicates('master_id').itertuples(index=False)])
+
+    rows = []
+    for row in df_rows.itertuples(index=False):
+        rows.append((
+            int(row.request_id),
+            db_value(row.start_date),
+            db_value(row.tech_type) or '',
+            db_value(row.tech_model) or '',
+            db_value(row.problem_description) or '',
+            db_value(row.request_status) or 'Новая заявка',
+            db_value(row.completion_date),
+            db_value(row.days_in_process),
+            text_value(row.repair_parts),
+            bool(row.has_comment),
+            db_value(row.comment_message) or '',
+            None if pd.isna(row.master_id) else int(row.master_id),
+            db_value(row.master_fio) or '',
+            text_value(row.master_phone),
+            db_value(row.client_fio) or '',
+            text_value(row.client_phone),
+            db_value(row.client_login) or '',
+            None if pd.isna(row.comment_master_id) else int(row.comment_master_id),
+        ))
+    # Заявки, уже перенесенные в архив, обновляются там, а не вставляются
+    # в service_requests повторно (иначе с include_archived они видны дважды)
+    archived = archived_request_ids(cursor, [row[0] for row in rows])
+    fields = DB_REQUEST_COLUMNS[1:]
+    cursor.executemany(f'''
+        INSERT INTO service_requests ({', '.join(DB_REQUEST_COLUMNS)})
+        VALUES ({', '.join('?' * len(DB_REQUEST_COLUMNS))})
+        ON CONFLICT(request_id) DO UPDATE SET
+            {', '.join(f'{field} = excluded.{field}' for field in fields)},
+            updated_at = datetime('now', 'localtime')
+    ''', [row for row in rows if row[0] not in archived])
+    if archived:
+        cursor.executemany(f'''
+            UPDATE {ARCHIVE_TABLE} SET
+                {', '.join(f'{field} = ?' for field in fields)},
+                updated_at = datetime('now', 'localtime')
+            WHERE request_id = ?
+        ''', [row[1:] + row[:1] for row in rows if row[0] in archived])
+    return len(rows)
+
+
+# ========== Запуск ==========
+def run_etl(source_dir, output_dir, db_path=None, formats=OUTPUT_FORMATS, force=False):
+    """Инкрементальная сборка объединенной таблицы, возвращает сводку запуска"""
+    started = time.perf_counter()
+    cache_dir = os.path.join(output_dir, CACHE_DIR_NAME)
+    os.makedirs(cache_dir, exist_ok=True)
+    combined_cache = os.path.join(cache_dir, 'combined.pkl')
+    if not os.path.exists(combined_cache):
+        force = True
+
+    conn = get_db_connection(db_path=db_path)
+    cursor = conn.cursor()
+    try:
+        ensure_etl_schema(cursor)
+        conn.commit()
+
+        frames, fingerprints, any_changed = {}, [], False
+        for source, filename in SOURCE_FILES.items():
+            path = find_source_file(source_dir, filename)
+            if path is None:
+                raise FileNotFoundError(f"Файл {filename} не найден в {source_dir}")
+            frames[source], fingerprint, changed = load_source(cursor, source, path, cache_dir, force)
+            fingerprints.append(fingerprint)
+            any_changed = any_changed or changed
+            print(f"{filename}: {'изменен' if changed else 'без изменений'} ({len(frames[source])} строк)")
+
+        if not any_changed:
+            print("Исходные файлы не менялись, объединение не требуется")
+            return {"changed_requests": 0, "deleted_requests": 0, "outputs": []}
+
+        # Какие заявки затронуты изменившимися строками исходных файлов
+        hashes, changed_keys, deleted_keys = {}, {}, {}
+        for source, key in SOURCE_KEYS.items():
+            hashes[source] = row_hashes(frames[source], key)
+            if force:
+                changed_keys[source], deleted_keys[source] = set(hashes[source]), set()
+            else:
+                changed_keys[source], deleted_keys[source] = diff_row_hashes(cursor, source, hashes[source])
+
+        requests = frames['requests']
+        touched_users = changed_keys['users'] | deleted_keys['users']
+        affected = (requests['requestID'].isin(changed_keys['requests'])
+                    | requests['requestID'].isin(changed_keys['comments'] | deleted_keys['comments'])
+                    | requests['clientID'].isin(touched_users)
+                    | requests['masterID'].isin(touched_users))
+        merged = merge_requests(requests[affected], frames['comments'], frames['users'])
+        deleted_requests = deleted_keys['requests']
+
+        # Обновляем сохраненную объединенную таблицу только по затронутым заявкам
+        if force:
+            combined = merged
+        else:
+            combined = pd.read_pickle(combined_cache)
+            drop_ids = set(merged['request_id']) | deleted_requests
+            combined = pd.concat([combined[~combined['request_id'].isin(drop_ids)], merged], ignore_index=True)
+        combined = finalize_combined(combined)
+        print(f"Затронуто заявок: {len(merged)}, удалено из источника: {len(deleted_requests)}")
+
+        outputs = write_outputs(combined, output_dir, formats) if formats else []
+        for path in outputs:
+            print(f"✓ Файл создан: {path}")
+
+        # База и состояние ETL обновляются одной транзакцией
+        cursor.execute("BEGIN IMMEDIATE")
+        written = feed_database(cursor, merged)
+        for source in SOURCE_KEYS:
+            cursor.execute("DELETE FROM etl_row_hashes WHERE source = ?", (source,))
+            cursor.executemany("INSERT INTO etl_row_hashes (source, row_key, row_hash) VALUES (?, ?, ?)",
+                               [(source, int(k), int(v)) for k, v in hashes[source].items()])
+        cursor.executemany('''
+            INSERT OR REPLACE INTO etl_files (source, path, size, mtime_ns, sha256, loaded_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', [fp + (datetime.now().strftime('%Y-%m-%d %H:%M:%S'),) for fp in fingerprints])
+        conn.commit()
+        combined.to_pickle(combined_cache)
+        if deleted_requests:
+            print(f"Заявки удалены из источника, но оставлены в базе: {sorted(deleted_requests)}")
+
+        print(f"✓ В базу записано заявок: {written} ({time.perf_counter() - started:.2f} с)")
+        return {"changed_requests": len(merged), "deleted_requests": len(deleted_requests), "outputs": outputs}
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Инкрементальная сборка объединенной таблицы заявок")
+    parser.add_argument('--source-dir', default=os.path.join('..', 'Data_Analysis'),
+                        help="каталог с inputDataRequests/Comments/Users.xlsx (поиск в подкаталогах)")
+    parser.add_argument('--output-dir', default=os.path.join('..', 'Data_Analysis'),
+                        help="каталог для service_requests_combined.*")
+    parser.add_argument('--db', default=None, help="база данных приложения")
+    parser.add_argument('--formats', default=','.join(OUTPUT_FORMATS),
+                        help="форматы через запятую (xlsx,csv,json) или пустая строка")
+    parser.add_argument('--force', action='store_true', help="полная пересборка")
+    args = parser.parse_args()
+
+    formats = [fmt for fmt in args.formats.split(',') if fmt]
+    run_etl(args.source_dir, args.output_dir, args.db, formats, args.force)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,332 @@
+# load_test.py
+"""Нагрузочное тестирование запущенного приложения смесью запросов ролей.
+
+Скрипт входит под пользователями из inputDataUsers.xlsx, затем в течение
+--duration секунд отправляет запросы с частотой --rps: для каждого
+запроса выбирается роль (по долям --roles), пользователь этой роли и действие
+по смеси роли (список, поиск, просмотр, изменение, назначение мастера,
+создание, статистика). Запросы выдаются по расписанию независимо от
+скорости ответов, поэтому задержка считается от запланированного момента
+отправки и включает ожидание свободного потока - при перегрузке она
+растет, а не скрывается.
+
+В конце выводятся пропускная способность, p50/p95/p99, доля ошибок и
+доля отказов лимитера (429, считаются отдельно от ошибок) по каждому
+действию. Изменение, назначение и создание пишут в базу, поэтому
+запускать стоит на копии (например, на базе из synthetic_data.py).
+
+Лимиты частоты запросов (rate_limit.py) рассчитаны на одного живого
+пользователя: при --rps 50 один администратор из смеси по умолчанию
+упирается в них, и прогон меряет лимитер, а не конкуренцию за базу.
+Приложение для прогона запускается без лимитов (RATE_LIMIT_ENABLED=0)
+или с ослабленными (RATE_LIMIT_SCALE=20).
+
+Пример запуска:
+    RATE_LIMIT_ENABLED=0 python app.py          # в другом окне
+    python load_test.py --rps 50 --duration 60 --output load.json
+    python load_test.py --roles operator:1 --mix operator=list:50,edit:30,assign:20
+"""
+import argparse
+import http.cookiejar
+import json
+import os
+import queue
+import random
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import datetime
+
+DEFAULT_URL = 'http://127.0.0.1:5000'
+USERS_FILE = 'inputDataUsers.xlsx'
+REQUEST_TIMEOUT = 30
+
+# Тип пользователя в Excel -> роль в системе (как в load_users_from_xlsx)
+TYPE_MAPPING = {'Менеджер': 'admin', 'Специалист': 'master', 'Оператор': 'operator', 'Заказчик': 'client'}
+# Доли запросов по ролям
+ROLE_WEIGHTS = {'operator': 35, 'master': 30, 'client': 25, 'admin': 10}
+# Смесь действий каждой роли
+ACTION_MIX = {
+    'client': {'list': 60, 'search': 15, 'view': 20, 'create': 5},
+    'master': {'list': 45, 'search': 10, 'view': 25, 'edit': 20},
+    'operator': {'list': 35, 'search': 20, 'view': 20, 'edit': 10, 'assign': 10, 'create': 5},
+    'admin': {'list': 30, 'search': 15, 'view': 20, 'stats': 20, 'edit': 10, 'assign': 5},
+}
+SEARCH_TERMS = ('Кондиционер', 'Xiaomi', 'Не', 'шум', 'Ballu', 'Увлажнитель')
+# Статусы, между которыми переключаются открытые заявки при изменении
+EDIT_STATUSES = ('В процессе ремонта', 'Ожидание комплектующих')
+
+
+class UserSession:
+    """Вход под пользователем и запросы с его cookie"""
+
+    def __init__(self, base_url, login, password, role):
+        self.base_url = base_url.rstrip('/')
+        self.login = login
+        self.password = password
+        self.role = role
+        self.cookies = http.cookiejar.CookieJar()
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(self.cookies))
+        # Заявки, которые пользователь видел в последнем списке: (номер, статус)
+        self.visible = []
+
+    def request(self, method, path, body=None, form=None):
+        """Выполнение запроса, возвращает (код, тело)"""
+        data, headers = None, {}
+        if form is not None:
+            data = urllib.parse.urlencode(form).encode('utf-8')
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        elif body is not None:
+            data = json.dumps(body).encode('utf-8')
+            headers['Content-Type'] = 'application/json'
+        request = urllib.request.Request(self.base_url + path, data=data, headers=headers, method=method)
+        try:
+            with self.opener.open(request, timeout=REQUEST_TIMEOUT) as response:
+                return response.status, response.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.read()
+
+    def sign_in(self):
+        status, _ = self.request('POST', '/', form={'login': self.login, 'password': self.password})
+        # Страница входа возвращается с кодом 200 и при ошибке: сессия появляется только при успехе
+        return status == 200 and any(cookie.name == 'session' for cookie in self.cookies)
+
+
+def load_users(base_url, path):
+    """Сессии пользователей из Excel-файла по ролям"""
+    import pandas as pd
+
+    df = pd.read_excel(path, sheet_name='Sheet1')
+    sessions = {}
+    for _, row in df.iterrows():
+        role = TYPE_MAPPING.get(row['type'], 'client')
+        session = UserSession(base_url, str(row['login']), str(row['password']), role)
+        if session.sign_in():
+            sessions.setdefault(role, []).append(session)
+        else:
+            print(f"Не удалось войти как {row['login']}")
+    return sessions
+
+
+def parse_roles(value):
+    """Доли ролей: role:weight,role:weight"""
+    if not value:
+        return dict(ROLE_WEIGHTS)
+    weights = {}
+    for item in value.split(','):
+        role, _, weight = item.partition(':')
+        if role not in ROLE_WEIGHTS:
+            raise ValueError(f"Неизвестная роль: {role}")
+        weights[role] = float(weight)
+    return weights
+
+
+def parse_mix(values):
+    """Переопределения смеси: role=action:weight,action:weight"""
+    mix = {role: dict(actions) for role, actions in ACTION_MIX.items()}
+    for value in values or []:
+        role, _, actions = value.partition('=')
+        if role not in mix:
+            raise ValueError(f"Неизвестная роль: {role}")
+        mix[role] = {}
+        for item in actions.split(','):
+            action, _, weight = item.partition(':')
+            mix[role][action] = float(weight)
+    return mix
+
+
+# ========== Действия ==========
+def _remember(session, body):
+    try:
+        rows = json.loads(body)
+    except ValueError:
+        return
+    if isinstance(rows, list):
+        session.visible = [(row.get('request_id'), row.get('request_status')) for row in rows[:500]]
+
+
+def run_action(action, session, context, rng):
+    """Выполнение действия, возвращает код ответа"""
+    if action == 'list':
+        status, body = session.request('GET', '/api/requests')
+        if status == 200:
+            _remember(session, body)
+        return status
+    if action == 'search':
+        query = urllib.parse.quote(rng.choice(SEARCH_TERMS))
+        return session.request('GET', f'/api/requests/search?q={query}')[0]
+    if action == 'stats':
+        return session.request('GET', '/api/stats')[0]
+    if action == 'create':
+        return session.request('POST', '/api/requests', body={
+            'tech_type': 'Кондиционер',
+            'tech_model': 'Load-Test',
+            'problem_description': f'Нагрузочный тест {datetime.now():%H:%M:%S}',
+            'client_fio': 'Нагрузочный Тест',
+            'client_phone': '89000000000',
+        })[0]
+
+    # Остальные действия работают с заявкой из последнего списка пользователя
+    if not session.visible:
+        status, body = session.request('GET', '/api/requests')
+        if status != 200:
+            return status
+        _remember(session, body)
+        if not session.visible:
+            return 200
+    request_id, request_status = rng.choice(session.visible)
+    if action == 'view':
+        return session.request('GET', f'/api/requests/{request_id}')[0]
+    if action == 'edit':
+        body = {'comment_message': f'Нагрузочный тест {datetime.now():%H:%M:%S}'}
+        if request_status in EDIT_STATUSES:
+            body['request_status'] = EDIT_STATUSES[1 - EDIT_STATUSES.index(request_status)]
+        return session.request('PUT', f'/api/requests/{request_id}', body=body)[0]
+    if action == 'assign':
+        master_id = rng.choice(context['master_ids']) if context['master_ids'] else 1
+        return session.request('PUT', f'/api/requests/{request_id}/assign', body={'master_id': master_id})[0]
+    raise ValueError(f"Неизвестное действие: {action}")
+
+
+# ========== Прогон ==========
+def _percentile(ordered, q):
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))] if ordered else 0.0
+
+
+def run_load(sessions, mix, role_weights, rps, duration, threads, seed):
+    """Отправка запросов по расписанию, возвращает (результаты по действиям, время прогона)"""
+    rng = random.Random(seed)
+    roles = [role for role in role_weights if sessions.get(role) and role_weights[role] > 0]
+    weights = [role_weights[role] for role in roles]
+    context = {'master_ids': []}
+    admin = (sessions.get('admin') or sessions.get('operator') or [None])[0]
+    if admin is not None:
+        status, body = admin.request('GET', '/api/masters')
+        if status == 200:
+            context['master_ids'] = [row['id'] for row in json.loads(body)]
+
+    # План: (момент отправки, роль, действие) с постоянным интервалом
+    plan = queue.Queue()
+    results = {}
+    results_lock = threading.Lock()
+    total = int(rps * duration)
+    started = time.perf_counter() + 0.1
+    for i in range(total):
+        role = rng.choices(roles, weights)[0]
+        actions = mix[role]
+        action = rng.choices(list(actions), list(actions.values()))[0]
+        plan.put((started + i / rps, rng.choice(sessions[role]), action))
+
+    def worker(worker_id):
+        worker_rng = random.Random(seed * 1000 + worker_id)
+        while True:
+            try:
+                scheduled, session, action = plan.get_nowait()
+            except queue.Empty:
+                return
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            try:
+                status = run_action(action, session, context, worker_rng)
+            except Exception:
+                status = 'error'
+            latency = time.perf_counter() - scheduled
+            with results_lock:
+                entry = results.setdefault(action, {"latencies": [], "statuses": {}})
+                entry["latencies"].append(latency)
+                entry["statuses"][status] = entry["statuses"].get(status, 0) + 1
+
+    pool = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    return results, time.perf_counter() - started
+
+
+def summarize(results, elapsed):
+    """Пропускная способность, перцентили и ошибки по действиям"""
+    summary = {}
+    for action, entry in sorted(results.items()):
+        latencies = sorted(entry["latencies"])
+        # Отказы лимитера - не ошибки обработчиков, считаются отдельно
+        rate_limited = entry["statuses"].get(429, 0)
+        errors = sum(count for status, count in entry["statuses"].items()
+                     if status == 'error' or (status >= 400 and status != 429))
+        summary[action] = {
+            "requests": len(latencies),
+            "throughput_rps": round(len(latencies) / elapsed, 2),
+            "p50_ms": round(_percentile(latencies, 0.5) * 1000, 2),
+            "p95_ms": round(_percentile(latencies, 0.95) * 1000, 2),
+            "p99_ms": round(_percentile(latencies, 0.99) * 1000, 2),
+            "error_rate": round(errors / len(latencies), 4),
+            "rate_limited_rate": round(rate_limited / len(latencies), 4),
+            "statuses": {str(status): count for status, count in entry["statuses"].items()},
+        }
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочное тестирование смесью запросов ролей")
+    parser.add_argument('--url', default=DEFAULT_URL, help="адрес запущенного приложения")
+    parser.add_argument('--users', default=USERS_FILE, help="Excel-файл пользователей")
+    parser.add_argument('--rps', type=float, default=20, help="целевая частота запросов")
+    parser.add_argument('--duration', type=float, default=30, help="длительность (секунды)")
+    parser.add_argument('--threads', type=int, default=32, help="число потоков-отправителей")
+    parser.add_argument('--roles', help="доли ролей: role:weight,... (по умолчанию ROLE_WEIGHTS)")
+    parser.add_argument('--mix', action='append', help="смесь роли: role=action:weight,... (можно повторять)")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help="файл JSON с результатами")
+    parser.add_argument('--allow-remote', action='store_true', help="разрешить адрес не на localhost")
+    args = parser.parse_args()
+
+    host = urllib.parse.urlparse(args.url).hostname
+    if host not in ('127.0.0.1', 'localhost', '::1') and not args.allow_remote:
+        print(f"Адрес {args.url} не на localhost, используйте --allow-remote")
+        return 1
+    if not os.path.exists(args.users):
+        print(f"Файл {args.users} не найден!")
+        return 1
+
+    sessions = load_users(args.url, args.users)
+    if not sessions:
+        print("Не удалось войти ни под одним пользователем")
+        return 1
+    print(f"Пользователей: {', '.join(f'{role}: {len(items)}' for role, items in sessions.items())}")
+
+    results, elapsed = run_load(sessions, parse_mix(args.mix), parse_roles(args.roles), args.rps, args.duration, args.threads, args.seed)
+    summary = summarize(results, elapsed)
+    total = sum(item["requests"] for item in summary.values())
+
+    print("=" * 87)
+    print(f"{'действие':<10} {'запросов':>9} {'RPS':>8} {'p50, мс':>9} {'p95, мс':>9} {'p99, мс':>9} "
+          f"{'ошибки':>8} {'429':>8}")
+    for action, item in summary.items():
+        print(f"{action:<10} {item['requests']:>9} {item['throughput_rps']:>8.1f} {item['p50_ms']:>9.1f} "
+              f"{item['p95_ms']:>9.1f} {item['p99_ms']:>9.1f} {item['error_rate']:>8.1%} "
+              f"{item['rate_limited_rate']:>8.1%}")
+    print(f"Всего: {total} запросов за {elapsed:.1f} с ({total / elapsed:.1f} RPS при цели {args.rps})")
+    if any(item['rate_limited_rate'] for item in summary.values()):
+        print("Часть запросов отклонена лимитером (429): запустите приложение с RATE_LIMIT_ENABLED=0 "
+              "или RATE_LIMIT_SCALE=20")
+    print("=" * 87)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({
+                "created_at": datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                "url": args.url,
+                "target_rps": args.rps,
+                "duration": args.duration,
+                "elapsed": round(elapsed, 3),
+                "actions": summary,
+            }, f, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
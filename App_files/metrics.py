@@ -0,0 +1,348 @@
+# metrics.py
+"""Метрики обработчиков /api/* в текстовом формате Prometheus.
+
+Для каждого маршрута (шаблона URL, а не конкретного адреса) собираются:
+гистограмма времени ответа, время работы с базой, время сериализации JSON,
+размер ответа, число строк в ответе-списке и количество ответов по кодам.
+
+Запись идет без блокировок: у каждого потока свой набор счетчиков, общий
+замок берется только при первом обращении потока к маршруту и при выдаче
+/metrics, которая суммирует счетчики всех потоков. Когда поток завершается
+(сервер разработки заводит поток на каждый запрос), его счетчики
+прибавляются к общему итогу завершившихся потоков и удаляются из реестра.
+
+/metrics отдается администратору или сборщику метрик с токеном
+METRICS_TOKEN (заголовок Authorization: Bearer <токен>).
+
+Пример запуска:
+    python metrics.py --benchmark      # замер накладных расходов
+"""
+import argparse
+import hmac
+import itertools
+import os
+import sqlite3
+import sys
+import threading
+import time
+import weakref
+
+from flask import g, request
+from flask.json.provider import DefaultJSONProvider
+
+# Границы гистограммы времени ответа (секунды)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Префикс адресов, которые измеряются
+METRICS_PREFIX = '/api/'
+# Токен сборщика метрик; пустой - /metrics доступен только администратору
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+# Индексы счетчиков маршрута
+_COUNT, _LATENCY_SUM, _DB_SUM, _SERIALIZE_SUM, _BYTES_SUM, _ROWS_SUM = range(6)
+
+_registry_lock = threading.Lock()
+# Счетчики живых потоков: номер набора -> (маршруты, коды), где
+# маршруты - словарь (метод, маршрут) -> [счетчики, корзины],
+# коды - словарь (метод, маршрут, код) -> количество
+_thread_stats = {}
+# Сумма счетчиков завершившихся потоков в том же виде
+_retired_stats = {}
+_retired_statuses = {}
+_thread_numbers = itertools.count()
+_local = threading.local()
+
+
+def _add_counters(routes, statuses, thread_routes, thread_statuses):
+    """Прибавление счетчиков одного потока к routes и statuses"""
+    for key, (counters, buckets) in thread_routes.items():
+        total = routes.setdefault(key, [[0] * len(counters), [0] * len(buckets)])
+        total[0] = [a + b for a, b in zip(total[0], counters)]
+        total[1] = [a + b for a, b in zip(total[1], buckets)]
+    for key, count in thread_statuses.items():
+        statuses[key] = statuses.get(key, 0) + count
+
+
+def _retire(number):
+    """Перенос счетчиков завершившегося потока в общий итог"""
+    with _registry_lock:
+        thread_routes, thread_statuses = _thread_stats.pop(number)
+        _add_counters(_retired_stats, _retired_statuses, thread_routes, thread_statuses)
+
+
+class _ThreadCounters:
+    """Счетчики одного потока; удаляются вместе с его threading.local"""
+
+    def __init__(self):
+        self.stats, self.statuses = {}, {}
+        number = next(_thread_numbers)
+        with _registry_lock:
+            _thread_stats[number] = (self.stats, self.statuses)
+        weakref.finalize(self, _retire, number)
+
+
+def _stats():
+    counters = getattr(_local, 'counters', None)
+    if counters is None:
+        counters = _local.counters = _ThreadCounters()
+    return counters.stats, counters.statuses
+
+
+# ========== Время работы с базой ==========
+def add_db_time(seconds):
+    """Учет времени запроса к базе в текущем HTTP-запросе"""
+    _local.db_time = getattr(_local, 'db_time', 0.0) + seconds
+
+
+# Профилировщик операторов (см. sql_profiler.py) или None
+_statement_profiler = None
+
+
+def set_statement_profiler(profiler):
+    """Подключение профилировщика: on_connect(conn), on_execute(cursor, sql, params, seconds, many),
+    on_fetch(cursor, seconds, rows)"""
+    global _statement_profiler
+    _statement_profiler = profiler
+
+
+class TimedCursor(sqlite3.Cursor):
+    """Курсор, учитывающий время выполнения и выборки в метриках"""
+
+    def _run(self, method, sql, params, many):
+        started = time.perf_counter()
+        try:
+            return method(sql, params)
+        finally:
+            elapsed = time.perf_counter() - started
+            add_db_time(elapsed)
+            if _statement_profiler is not None:
+                _statement_profiler.on_execute(self, sql, params, elapsed, many)
+
+    def _fetch(self, method, *args):
+        started = time.perf_counter()
+        rows = None
+        try:
+            rows = method(*args)
+            return rows
+        finally:
+            elapsed = time.perf_counter() - started
+            add_db_time(elapsed)
+            if _statement_profiler is not None:
+                count = len(rows) if isinstance(rows, list) else int(rows is not None)
+                _statement_profiler.on_fetch(self, elapsed, count)
+
+    def execute(self, sql, parameters=()):
+        return self._run(super().execute, sql, parameters, False)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self._run(super().executemany, sql, seq_of_parameters, True)
+
+    def fetchone(self):
+        return self._fetch(super().fetchone)
+
+    def fetchmany(self, *args):
+        return self._fetch(super().fetchmany, *args)
+
+    def fetchall(self):
+        return self._fetch(super().fetchall)
+
+
+class TimedConnection(sqlite3.Connection):
+    """Соединение, курсоры которого учитываются в метриках"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if _statement_profiler is not None:
+            _statement_profiler.on_connect(self)
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    # Сокращения conn.execute/executemany тоже идут через TimedCursor
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+# ========== Сериализация ==========
+class TimedJSONProvider(DefaultJSONProvider):
+    """JSON-провайдер Flask, учитывающий время сериализации и число строк"""
+
+    def response(self, *args, **kwargs):
+        started = time.perf_counter()
+        response = super().response(*args, **kwargs)
+        _local.serialize_time = getattr(_local, 'serialize_time', 0.0) + time.perf_counter() - started
+        payload = args[0] if len(args) == 1 else None
+        if isinstance(payload, list):
+            _local.rows = getattr(_local, 'rows', 0) + len(payload)
+        return response
+
+
+# ========== Подключение к приложению ==========
+def _before_request():
+    if request.path.startswith(METRICS_PREFIX):
+        g.metrics_started = time.perf_counter()
+        _local.db_time = _local.serialize_time = 0.0
+        _local.rows = 0
+
+
+def _after_request(response):
+    started = g.pop('metrics_started', None)
+    if started is not None:
+        record_request(request.method, request.url_rule.rule if request.url_rule else 'unmatched',
+                       response.status_code, time.perf_counter() - started,
+                       _local.db_time, _local.serialize_time,
+                       response.calculate_content_length() or 0, _local.rows)
+    return response
+
+
+def instrument_app(app):
+    """Включение метрик для приложения Flask"""
+    app.json = TimedJSONProvider(app)
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+
+
+def record_request(method, route, status, latency, db_time=0.0, serialize_time=0.0, size=0, rows=0):
+    """Запись одного ответа в счетчики текущего потока"""
+    stats, statuses = _stats()
+    key = (method, route)
+    entry = stats.get(key)
+    if entry is None:
+        entry = [[0, 0.0, 0.0, 0.0, 0, 0], [0] * (len(LATENCY_BUCKETS) + 1)]
+        with _registry_lock:
+            stats[key] = entry
+    counters, buckets = entry
+    counters[_COUNT] += 1
+    counters[_LATENCY_SUM] += latency
+    counters[_DB_SUM] += db_time
+    counters[_SERIALIZE_SUM] += serialize_time
+    counters[_BYTES_SUM] += size
+    counters[_ROWS_SUM] += rows
+    for i, bound in enumerate(LATENCY_BUCKETS):
+        if latency <= bound:
+            buckets[i] += 1
+            break
+    else:
+        buckets[-1] += 1
+
+    status_key = (method, route, status)
+    if status_key in statuses:
+        statuses[status_key] += 1
+    else:
+        with _registry_lock:
+            statuses[status_key] = statuses.get(status_key, 0) + 1
+
+
+# ========== Выдача ==========
+def _merged():
+    """Сумма счетчиков всех потоков"""
+    routes, statuses = {}, {}
+    with _registry_lock:
+        _add_counters(routes, statuses, _retired_stats, _retired_statuses)
+        for thread_routes, thread_statuses in _thread_stats.values():
+            _add_counters(routes, statuses, thread_routes, thread_statuses)
+    return routes, statuses
+
+
+def _labels(method, route, **extra):
+    labels = {'method': method, 'route': route, **extra}
+    return ','.join(f'{name}="{value}"' for name, value in labels.items())
+
+
+def metrics_token_valid(authorization):
+    """Проверка заголовка Authorization сборщика метрик"""
+    if not METRICS_TOKEN or not authorization:
+        return False
+    scheme, _, token = authorization.partition(' ')
+    return scheme.lower() == 'bearer' and hmac.compare_digest(token.strip().encode(), METRICS_TOKEN.encode())
+
+
+def render_metrics():
+    """Текст метрик в формате Prometheus"""
+    routes, statuses = _merged()
+    lines = [
+        '# HELP api_request_duration_seconds Время обработки запроса',
+        '# TYPE api_request_duration_seconds histogram',
+    ]
+    for (method, route), (counters, buckets) in sorted(routes.items()):
+        cumulative = 0
+        for bound, count in zip(LATENCY_BUCKETS + ('+Inf',), buckets):
+            cumulative += count
+            lines.append(f'api_request_duration_seconds_bucket{{{_labels(method, route, le=bound)}}} {cumulative}')
+        lines.append(f'api_request_duration_seconds_sum{{{_labels(method, route)}}} {counters[_LATENCY_SUM]:.6f}')
+        lines.append(f'api_request_duration_seconds_count{{{_labels(method, route)}}} {counters[_COUNT]}')
+
+    for name, index, help_text, fmt in (
+            ('api_request_db_seconds_total', _DB_SUM, 'Время работы с базой', '.6f'),
+            ('api_request_serialization_seconds_total', _SERIALIZE_SUM, 'Время сериализации JSON', '.6f'),
+            ('api_response_bytes_total', _BYTES_SUM, 'Размер ответов в байтах', 'd'),
+            ('api_response_rows_total', _ROWS_SUM, 'Строк в ответах-списках', 'd')):
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} counter')
+        for (method, route), (counters, _) in sorted(routes.items()):
+            lines.append(f'{name}{{{_labels(method, route)}}} {counters[index]:{fmt}}')
+
+    lines.append('# HELP api_responses_total Ответы по кодам состояния')
+    lines.append('# TYPE api_responses_total counter')
+    for (method, route, status), count in sorted(statuses.items()):
+        lines.append(f'api_responses_total{{{_labels(method, route, status=status)}}} {count}')
+    return '\n'.join(lines) + '\n'
+
+
+# ========== Замер накладных расходов ==========
+def benchmark(requests_count=20000):
+    """Сравнение обработки запроса и запросов к базе с метриками и без"""
+    from flask import Flask, jsonify
+
+    def make_app(instrumented):
+        bench_app = Flask('metrics_benchmark')
+        if instrumented:
+            instrument_app(bench_app)
+
+        @bench_app.route('/api/ping')
+        def ping():
+            return jsonify([{"id": i} for i in range(10)])
+        return bench_app
+
+    for instrumented in (False, True):
+        client = make_app(instrumented).test_client()
+        client.get('/api/ping')
+        started = time.perf_counter()
+        for _ in range(requests_count):
+            client.get('/api/ping')
+        per_request = (time.perf_counter() - started) / requests_count * 1e6
+        print(f"Запрос {'с метриками' if instrumented else 'без метрик'}: {per_request:.1f} мкс")
+
+    for factory in (sqlite3.Connection, TimedConnection):
+        conn = sqlite3.connect(':memory:', factory=factory)
+        cursor = conn.cursor()
+        cursor.execute("CREATE TABLE t (id INTEGER PRIMARY KEY, value TEXT)")
+        cursor.executemany("INSERT INTO t (value) VALUES (?)", [('x',)] * 100)
+        started = time.perf_counter()
+        for i in range(requests_count):
+            cursor.execute("SELECT value FROM t WHERE id = ?", (i % 100 + 1,))
+            cursor.fetchone()
+        per_query = (time.perf_counter() - started) / requests_count * 1e6
+        conn.close()
+        print(f"Запрос к базе ({factory.__name__}): {per_query:.2f} мкс")
+
+    started = time.perf_counter()
+    for i in range(requests_count):
+        record_request('GET', '/api/bench', 200, 0.003, 0.001, 0.0005, 512, 10)
+    print(f"record_request: {(time.perf_counter() - started) / requests_count * 1e6:.2f} мкс")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Метрики API")
+    parser.add_argument('--benchmark', action='store_true', help="замер накладных расходов")
+    parser.add_argument('--requests', type=int, default=20000, help="число запросов в замере")
+    args = parser.parse_args()
+    if args.benchmark:
+        benchmark(args.requests)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,206 @@
+# parquet_export.py
+"""Выгрузка заявок и истории статусов в Parquet для аналитики.
+
+Данные раскладываются по месяцам (service_requests - по месяцу start_date,
+status_history - по месяцу changed_at) с явной схемой типов: даты остаются
+датами, has_comment - булевым. При повторном запуске переписываются только
+новые и изменившиеся месяцы. Чтение - через load_requests / load_status_history,
+которые читают только нужные столбцы и месяцы.
+
+Пример запуска:
+    python parquet_export.py                 # инкрементальная выгрузка
+    python parquet_export.py --full          # полная перезапись
+
+Пример чтения в ноутбуке:
+    from parquet_export import load_requests
+    df = load_requests(columns=['request_id', 'tech_type', 'start_date'], start_month='2023-01')
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+from datetime import datetime
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from archive import requests_source
+from replica import get_analytics_connection
+
+PARQUET_DIR = os.path.join('exports', 'parquet')
+MANIFEST_NAME = '_manifest.json'
+NO_MONTH = 'unknown'
+
+REQUESTS_SCHEMA = pa.schema([
+    ('request_id', pa.int64()),
+    ('start_date', pa.timestamp('s')),
+    ('tech_type', pa.string()),
+    ('tech_model', pa.string()),
+    ('problem_description', pa.string()),
+    ('request_status', pa.string()),
+    ('completion_date', pa.timestamp('s')),
+    ('days_in_process', pa.int64()),
+    ('repair_parts', pa.string()),
+    ('has_comment', pa.bool_()),
+    ('comment_message', pa.string()),
+    ('master_id', pa.int64()),
+    ('master_fio', pa.string()),
+    ('master_phone', pa.string()),
+    ('client_fio', pa.string()),
+    ('client_phone', pa.string()),
+    ('client_login', pa.string()),
+    ('comment_master_id', pa.int64()),
+    ('created_at', pa.timestamp('s')),
+    ('updated_at', pa.timestamp('s')),
+])
+
+STATUS_HISTORY_SCHEMA = pa.schema([
+    ('id', pa.int64()),
+    ('request_id', pa.int64()),
+    ('old_status', pa.string()),
+    ('new_status', pa.string()),
+    ('changed_by', pa.string()),
+    ('changed_at', pa.timestamp('s')),
+    ('comment', pa.string()),
+])
+
+# Таблица -> (схема, столбец даты для разбиения, подпись раздела для сравнения)
+EXPORT_TABLES = {
+    'service_requests': (REQUESTS_SCHEMA, 'start_date',
+                         'COUNT(*), SUM(id), MAX(updated_at), TOTAL(JULIANDAY(updated_at))'),
+    'status_history': (STATUS_HISTORY_SCHEMA, 'changed_at', 'COUNT(*), MAX(id)'),
+}
+
+
+def month_expression(column):
+    """SQL-выражение месяца 'YYYY-MM' для столбца даты"""
+    return f"COALESCE(strftime('%Y-%m', {column}), '{NO_MONTH}')"
+
+
+def read_manifest(table_dir):
+    """Подписи выгруженных месяцев с прошлого запуска"""
+    path = os.path.join(table_dir, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def write_manifest(table_dir, manifest):
+    path = os.path.join(table_dir, MANIFEST_NAME)
+    with open(path + '.part', 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(path + '.part', path)
+
+
+def to_arrow(df, schema):
+    """Приведение строк SQLite к явной схеме Parquet"""
+    for field in schema:
+        column = df[field.name]
+        if pa.types.is_timestamp(field.type):
+            df[field.name] = pd.to_datetime(column, errors='coerce')
+        elif pa.types.is_integer(field.type):
+            df[field.name] = pd.to_numeric(column, errors='coerce').astype('Int64')
+        elif pa.types.is_boolean(field.type):
+            df[field.name] = column.map(lambda v: str(v).lower() in ('1', 'true')).astype(bool)
+        else:
+            df[field.name] = column.map(lambda v: None if v is None or v != v else str(v))
+    return pa.Table.from_pandas(df[schema.names], schema=schema, preserve_index=False)
+
+
+def export_table(conn, table, out_dir=PARQUET_DIR, full=False):
+    """Выгрузка одной таблицы по месяцам, возвращает список переписанных месяцев"""
+    schema, date_column, signature_sql = EXPORT_TABLES[table]
+    table_dir = os.path.join(out_dir, table)
+    if full and os.path.isdir(table_dir):
+        shutil.rmtree(table_dir)
+    os.makedirs(table_dir, exist_ok=True)
+
+    cursor = conn.cursor()
+    # Архив тоже выгружается: аналитике нужна вся история
+    source = requests_source(cursor, include_archived=True) if table == 'service_requests' else table
+    month = month_expression(date_column)
+
+    cursor.execute(f"SELECT {month} AS month, {signature_sql} FROM {source} GROUP BY month")
+    signatures = {row[0]: list(row[1:]) for row in cursor.fetchall()}
+    manifest = read_manifest(table_dir)
+
+    written = []
+    for partition, signature in sorted(signatures.items()):
+        if manifest.get(partition) == signature:
+            continue
+        df = pd.read_sql_query(f"SELECT {', '.join(schema.names)} FROM {source} WHERE {month} = ?",
+                               conn, params=(partition,))
+        partition_dir = os.path.join(table_dir, f"month={partition}")
+        os.makedirs(partition_dir, exist_ok=True)
+        path = os.path.join(partition_dir, 'data.parquet')
+        pq.write_table(to_arrow(df, schema), path + '.part', compression='zstd')
+        os.replace(path + '.part', path)
+        manifest[partition] = signature
+        written.append(partition)
+
+    # Месяцы, которых больше нет в источнике
+    for partition in set(manifest) - set(signatures):
+        shutil.rmtree(os.path.join(table_dir, f"month={partition}"), ignore_errors=True)
+        del manifest[partition]
+
+    write_manifest(table_dir, manifest)
+    return written
+
+
+def export_all(out_dir=PARQUET_DIR, full=False):
+    """Выгрузка всех таблиц из аналитической реплики"""
+    conn, freshness = get_analytics_connection()
+    try:
+        result = {table: export_table(conn, table, out_dir, full) for table in EXPORT_TABLES}
+    finally:
+        conn.close()
+    result['freshness'] = freshness
+    return result
+
+
+# ========== Чтение ==========
+def _load(table, columns=None, start_month=None, end_month=None, out_dir=PARQUET_DIR, where=None):
+    schema = EXPORT_TABLES[table][0]
+    dataset = ds.dataset(os.path.join(out_dir, table), format='parquet', partitioning='hive',
+                         schema=schema.append(pa.field('month', pa.string())),
+                         exclude_invalid_files=True)
+    # Отбор месяцев по столбцу раздела: лишние файлы даже не открываются
+    condition = where
+    if start_month:
+        condition = ds.field('month') >= start_month if condition is None else condition & (ds.field('month') >= start_month)
+    if end_month:
+        condition = ds.field('month') <= end_month if condition is None else condition & (ds.field('month') <= end_month)
+    return dataset.to_table(columns=columns, filter=condition).to_pandas()
+
+
+def load_requests(columns=None, start_month=None, end_month=None, out_dir=PARQUET_DIR, where=None):
+    """Заявки из Parquet: только указанные столбцы и месяцы ('YYYY-MM', включительно)"""
+    return _load('service_requests', columns, start_month, end_month, out_dir, where)
+
+
+def load_status_history(columns=None, start_month=None, end_month=None, out_dir=PARQUET_DIR, where=None):
+    """История статусов из Parquet: только указанные столбцы и месяцы"""
+    return _load('status_history', columns, start_month, end_month, out_dir, where)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Выгрузка заявок в Parquet по месяцам")
+    parser.add_argument('--out', default=PARQUET_DIR, help="каталог выгрузки")
+    parser.add_argument('--full', action='store_true', help="перезаписать все месяцы")
+    args = parser.parse_args()
+
+    started = datetime.now()
+    result = export_all(args.out, args.full)
+    for table in EXPORT_TABLES:
+        print(f"{table}: переписано месяцев: {len(result[table])} {result[table]}")
+    print(f"Данные на {result['freshness']['refreshed_at']} ({result['freshness']['source']}), "
+          f"время: {(datetime.now() - started).total_seconds():.2f} с")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
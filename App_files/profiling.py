@@ -0,0 +1,253 @@
+# profiling.py
+"""Профилирование отдельных запросов по требованию.
+
+Запрос выполняется под профилировщиком, если:
+- администратор передал заголовок X-Profile: cpu|memory (или ?_profile=cpu|memory);
+- администратор "взвел" профилирование для пользователя (arm_profiling):
+  следующие count его запросов к /api/* будут профилированы.
+
+Режим cpu - cProfile, результат сохраняется в .pstats (читается pstats,
+snakeviz, flameprof для flame-графа). Режим memory - tracemalloc, снимок
+сохраняется в .tracemalloc (tracemalloc.Snapshot.load). Рядом пишется
+.txt с топом функций/строк и .json с описанием. Так же профилируется
+загрузка данных из Excel (/api/admin/profiles/import).
+
+Ограничения, чтобы режим можно было держать включенным: одновременно
+профилируется один запрос, не более PROFILE_MAX_PER_MINUTE в минуту,
+на диске хранятся последние PROFILE_KEEP профилей.
+"""
+import cProfile
+import io
+import json
+import os
+import pstats
+import re
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import deque
+from datetime import datetime
+
+from flask import g, request, session
+
+PROFILE_DIR = 'profiles'
+PROFILE_MODES = ('cpu', 'memory')
+PROFILE_HEADER = 'X-Profile'
+PROFILE_QUERY_ARG = '_profile'
+PROFILE_PREFIX = '/api/'
+# Не более стольких профилей в минуту
+PROFILE_MAX_PER_MINUTE = 5
+# Сколько профилей хранится на диске
+PROFILE_KEEP = 50
+# Сколько строк в текстовой сводке
+PROFILE_TOP = 30
+# Глубина стека tracemalloc
+TRACEMALLOC_FRAMES = 25
+
+_PROFILE_ID = re.compile(r'^[0-9a-f_]+$')
+_FILE_EXTENSIONS = {'cpu': 'pstats', 'memory': 'tracemalloc'}
+# Причины отказа (значение заголовка X-Profile-Skipped) и их описания
+PROFILE_SKIP_REASONS = {
+    'busy': "уже выполняется другой профиль",
+    'rate_limited': "превышен лимит профилей в минуту",
+}
+
+# Одновременно профилируется только один запрос
+_slot = threading.Semaphore(1)
+_recent = deque()
+_recent_lock = threading.Lock()
+# Логин -> {"mode", "remaining"}: профилирование запросов пользователя
+_armed = {}
+_armed_lock = threading.Lock()
+
+
+# ========== Запуск и сохранение ==========
+def _acquire():
+    """Занять слот профилирования с учетом ограничений, вернуть код причины отказа или None"""
+    if not _slot.acquire(blocking=False):
+        return 'busy'
+    now = time.monotonic()
+    with _recent_lock:
+        while _recent and now - _recent[0] > 60:
+            _recent.popleft()
+        if len(_recent) >= PROFILE_MAX_PER_MINUTE:
+            _slot.release()
+            return 'rate_limited'
+        _recent.append(now)
+    return None
+
+
+def start_profile(mode):
+    """Запуск профилировщика, возвращает состояние или (None, причина отказа)"""
+    reason = _acquire()
+    if reason:
+        return None, reason
+    # Номер выдается сразу: он уходит в заголовок ответа раньше, чем профиль сохранен
+    profile_id = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}"
+    state = {"mode": mode, "profile_id": profile_id, "started": time.perf_counter()}
+    if mode == 'memory':
+        tracemalloc.start(TRACEMALLOC_FRAMES)
+    else:
+        state["profiler"] = cProfile.Profile()
+        state["profiler"].enable()
+    return state, None
+
+
+def finish_profile(state, name, **meta):
+    """Остановка профилировщика и сохранение результата, возвращает описание профиля"""
+    try:
+        duration = time.perf_counter() - state["started"]
+        if state["mode"] == 'memory':
+            try:
+                snapshot = tracemalloc.take_snapshot()
+            finally:
+                tracemalloc.stop()
+        else:
+            state["profiler"].disable()
+
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        profile_id = state["profile_id"]
+        base = os.path.join(PROFILE_DIR, profile_id)
+        if state["mode"] == 'memory':
+            snapshot.dump(f"{base}.tracemalloc")
+            lines = [str(stat) for stat in snapshot.statistics('lineno')[:PROFILE_TOP]]
+            summary = '\n'.join(lines)
+        else:
+            state["profiler"].dump_stats(f"{base}.pstats")
+            buffer = io.StringIO()
+            pstats.Stats(state["profiler"], stream=buffer).sort_stats('cumulative').print_stats(PROFILE_TOP)
+            summary = buffer.getvalue()
+        with open(f"{base}.txt", 'w', encoding='utf-8') as f:
+            f.write(summary)
+
+        info = {
+            "profile_id": profile_id,
+            "mode": state["mode"],
+            "name": name,
+            "created_at": datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            "duration_ms": round(duration * 1000, 2),
+            **meta,
+        }
+        with open(f"{base}.json", 'w', encoding='utf-8') as f:
+            json.dump(info, f, ensure_ascii=False, indent=2)
+        _apply_retention()
+        return info
+    finally:
+        _slot.release()
+
+
+def _apply_retention():
+    profiles = sorted(name[:-len('.json')] for name in os.listdir(PROFILE_DIR) if name.endswith('.json'))
+    for profile_id in profiles[:max(0, len(profiles) - PROFILE_KEEP)]:
+        for extension in ('json', 'txt', *_FILE_EXTENSIONS.values()):
+            path = os.path.join(PROFILE_DIR, f"{profile_id}.{extension}")
+            if os.path.exists(path):
+                os.remove(path)
+
+
+# ========== Профили на диске ==========
+def list_profiles():
+    """Описания сохраненных профилей, новые первыми"""
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    profiles = []
+    for name in sorted(os.listdir(PROFILE_DIR), reverse=True):
+        if name.endswith('.json'):
+            with open(os.path.join(PROFILE_DIR, name), encoding='utf-8') as f:
+                profiles.append(json.load(f))
+    return profiles
+
+
+def get_profile(profile_id):
+    """(описание, путь к файлу профиля, текстовая сводка) или None"""
+    if not _PROFILE_ID.match(profile_id or ''):
+        return None
+    base = os.path.join(PROFILE_DIR, profile_id)
+    if not os.path.exists(f"{base}.json"):
+        return None
+    with open(f"{base}.json", encoding='utf-8') as f:
+        info = json.load(f)
+    with open(f"{base}.txt", encoding='utf-8') as f:
+        summary = f.read()
+    return info, f"{base}.{_FILE_EXTENSIONS[info['mode']]}", summary
+
+
+# ========== Профилирование запросов ==========
+def arm_profiling(user_login, mode='cpu', count=1):
+    """Профилировать следующие count запросов пользователя"""
+    with _armed_lock:
+        if count > 0:
+            _armed[user_login] = {"mode": mode, "remaining": count}
+        else:
+            _armed.pop(user_login, None)
+        return dict(_armed)
+
+
+def armed_profiles():
+    with _armed_lock:
+        return dict(_armed)
+
+
+def _requested_mode():
+    """Режим профилирования текущего запроса или None"""
+    if not request.path.startswith(PROFILE_PREFIX):
+        return None
+    mode = request.headers.get(PROFILE_HEADER) or request.args.get(PROFILE_QUERY_ARG)
+    if mode and session.get('user_type') == 'admin':
+        return mode if mode in PROFILE_MODES else 'cpu'
+    user_login = session.get('user_login')
+    if user_login:
+        with _armed_lock:
+            armed = _armed.get(user_login)
+            if armed:
+                armed["remaining"] -= 1
+                if armed["remaining"] <= 0:
+                    del _armed[user_login]
+                return armed["mode"]
+    return None
+
+
+def _before_request():
+    mode = _requested_mode()
+    if mode:
+        state, reason = start_profile(mode)
+        if state is None:
+            g.profile_skipped = reason
+        else:
+            g.profile_state = state
+
+
+def _after_request(response):
+    state = g.get('profile_state')
+    if state is not None:
+        # Профиль сохраняется в teardown_request, здесь ответ получает только его номер
+        g.profile_status = response.status_code
+        response.headers['X-Profile-Id'] = state['profile_id']
+    elif 'profile_skipped' in g:
+        response.headers['X-Profile-Skipped'] = g.pop('profile_skipped')
+    return response
+
+
+def _teardown_request(exc):
+    # teardown_request вызывается и тогда, когда исключение обработчика пропускает
+    # after_request (app.run(debug=True)): профилировщик всегда останавливается
+    # и слот освобождается
+    state = g.pop('profile_state', None)
+    if state is None:
+        return
+    meta = {"user": session.get('user_login'), "status": g.pop('profile_status', 500),
+            "query": request.query_string.decode('utf-8', 'replace')}
+    if exc is not None:
+        meta["error"] = repr(exc)
+    try:
+        finish_profile(state, f"{request.method} {request.path}", **meta)
+    except Exception as e:
+        print(f"Ошибка сохранения профиля {state['profile_id']}: {e}")
+
+
+def instrument_profiling(app):
+    """Включение профилирования запросов по требованию"""
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
@@ -0,0 +1,242 @@
+# rate_limit.py
+"""Ограничение частоты запросов и допуск к тяжелым обработчикам.
+
+Два уровня защиты /api/*:
+- token bucket на пару (пользователь, класс маршрута): у каждого класса
+  своя скорость пополнения и запас (RATE_LIMITS), поэтому, например,
+  статистика, выгрузки и пакетное создание не расходуют токены друг
+  друга. Пользователь - логин
+  из сессии, для анонимных запросов - адрес клиента. Проверка - O(1):
+  ведро пополняется по прошедшему времени в момент обращения, а хранилище
+  ведер - LRU-словарь ограниченного размера (RATE_LIMIT_MAX_KEYS);
+- общий лимит одновременных тяжелых запросов (поиск, выгрузки, отчеты,
+  статистика): не более ADMISSION_CONCURRENCY выполняются сразу, еще
+  ADMISSION_QUEUE_LIMIT ждут свободного места до ADMISSION_QUEUE_TIMEOUT
+  секунд, остальные сразу получают 429.
+
+Отказ - ответ 429 с заголовком Retry-After. Счетчики выдаются на /metrics
+(render_rate_limit_metrics).
+
+Для нагрузочных прогонов (load_test.py) лимиты выключаются или
+ослабляются переменными окружения при запуске приложения:
+    RATE_LIMIT_ENABLED=0 python app.py      # без лимитов
+    RATE_LIMIT_SCALE=20 python app.py       # скорость и запас ведер x20
+"""
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from flask import g, jsonify, request, session
+
+# Выключается в замерах производительности (benchmark.py) и переменной
+# окружения RATE_LIMIT_ENABLED=0 (нагрузочные прогоны load_test.py)
+RATE_LIMIT_ENABLED = os.environ.get('RATE_LIMIT_ENABLED', '1') != '0'
+# Множитель скорости и запаса всех ведер (RATE_LIMIT_SCALE=20 для нагрузочных прогонов)
+RATE_LIMIT_SCALE = float(os.environ.get('RATE_LIMIT_SCALE', '1'))
+RATE_LIMIT_PREFIX = '/api/'
+# Класс маршрута -> (запросов в секунду, запас ведра)
+RATE_LIMITS = {
+    'read': (10.0, 40),
+    'write': (5.0, 20),
+    'search': (2.0, 10),
+    # Статистика кэшируется по версии данных, повторные запросы дешевые
+    'stats': (1.0, 20),
+    # Пакетный прием заявок - запись, а не просмотр таблицы
+    'bulk': (1.0, 10),
+    'heavy': (0.5, 5),
+}
+# Обработчик -> класс маршрута; остальные GET - read, прочие методы - write
+ROUTE_CLASSES = {
+    'search_requests': 'search',
+    'get_stats': 'stats',
+    'get_stats_timeseries': 'stats',
+    'get_stats_sla': 'stats',
+    'create_requests_bulk': 'bulk',
+    'export_requests': 'heavy',
+    'create_report': 'heavy',
+}
+# Классы, на которые действует общий лимит одновременных запросов
+ADMISSION_CLASSES = ('search', 'stats', 'heavy')
+# Сколько тяжелых запросов выполняется одновременно
+ADMISSION_CONCURRENCY = 4
+# Сколько тяжелых запросов может ждать в очереди
+ADMISSION_QUEUE_LIMIT = 8
+# Сколько секунд запрос ждет в очереди
+ADMISSION_QUEUE_TIMEOUT = 2.0
+# Сколько ведер хранится (самые давние вытесняются)
+RATE_LIMIT_MAX_KEYS = 10000
+
+# Причины отказа и их описания
+RATE_LIMIT_REASONS = {
+    'rate_limited': "Слишком много запросов, повторите позже",
+    'queue_full': "Сервер перегружен, повторите позже",
+    'queue_timeout': "Сервер перегружен, повторите позже",
+}
+
+# (пользователь, класс) -> [токены, время последнего пополнения]
+_buckets = OrderedDict()
+_buckets_lock = threading.Lock()
+
+_admission = threading.Semaphore(ADMISSION_CONCURRENCY)
+_admission_lock = threading.Lock()
+_waiting = 0
+_running = 0
+
+_stats_lock = threading.Lock()
+# (класс, результат) -> количество
+_decisions = {}
+_queue_wait_sum = 0.0
+_queue_wait_count = 0
+
+
+# ========== Token bucket ==========
+def route_class(endpoint, method):
+    """Класс маршрута для лимитов"""
+    route = ROUTE_CLASSES.get(endpoint)
+    if route:
+        return route
+    return 'read' if method in ('GET', 'HEAD') else 'write'
+
+
+def take_token(key, route):
+    """Взять токен из ведра, вернуть 0 или через сколько секунд токен появится"""
+    rate, burst = RATE_LIMITS[route]
+    rate, burst = rate * RATE_LIMIT_SCALE, burst * RATE_LIMIT_SCALE
+    now = time.monotonic()
+    bucket_key = (key, route)
+    with _buckets_lock:
+        bucket = _buckets.get(bucket_key)
+        if bucket is None:
+            bucket = [float(burst), now]
+            _buckets[bucket_key] = bucket
+            if len(_buckets) > RATE_LIMIT_MAX_KEYS:
+                _buckets.popitem(last=False)
+        else:
+            _buckets.move_to_end(bucket_key)
+            bucket[0] = min(burst, bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+        if bucket[0] >= 1:
+            bucket[0] -= 1
+            return 0
+        return (1 - bucket[0]) / rate
+
+
+# ========== Допуск тяжелых запросов ==========
+def admit():
+    """Занять место для тяжелого запроса, вернуть код причины отказа или None"""
+    global _waiting, _running
+    if _admission.acquire(blocking=False):
+        with _admission_lock:
+            _running += 1
+        return None
+    with _admission_lock:
+        if _waiting >= ADMISSION_QUEUE_LIMIT:
+            return 'queue_full'
+        _waiting += 1
+    started = time.perf_counter()
+    acquired = _admission.acquire(timeout=ADMISSION_QUEUE_TIMEOUT)
+    _record_wait(time.perf_counter() - started)
+    with _admission_lock:
+        _waiting -= 1
+        if acquired:
+            _running += 1
+    return None if acquired else 'queue_timeout'
+
+
+def release():
+    global _running
+    with _admission_lock:
+        _running -= 1
+    _admission.release()
+
+
+# ========== Подключение к приложению ==========
+def _record(route, outcome):
+    key = (route, outcome)
+    with _stats_lock:
+        _decisions[key] = _decisions.get(key, 0) + 1
+
+
+def _record_wait(seconds):
+    global _queue_wait_sum, _queue_wait_count
+    with _stats_lock:
+        _queue_wait_sum += seconds
+        _queue_wait_count += 1
+
+
+def _reject(reason, retry_after):
+    response = jsonify({"error": RATE_LIMIT_REASONS[reason]})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+    response.headers['X-RateLimit-Reason'] = reason
+    return response
+
+
+def _before_request():
+    if not RATE_LIMIT_ENABLED or not request.path.startswith(RATE_LIMIT_PREFIX):
+        return None
+    route = route_class(request.endpoint, request.method)
+    key = session.get('user_login') or request.remote_addr
+    wait = take_token(key, route)
+    if wait:
+        _record(route, 'rate_limited')
+        return _reject('rate_limited', wait)
+    if route in ADMISSION_CLASSES:
+        reason = admit()
+        if reason:
+            _record(route, reason)
+            return _reject(reason, ADMISSION_QUEUE_TIMEOUT)
+        g.rate_limit_admitted = True
+    _record(route, 'allowed')
+    return None
+
+
+def _teardown_request(exc):
+    # Место освобождается после отправки ответа (в том числе потокового)
+    if g.pop('rate_limit_admitted', False):
+        release()
+
+
+def instrument_rate_limiting(app):
+    """Включение лимитов частоты и допуска тяжелых запросов"""
+    app.before_request(_before_request)
+    app.teardown_request(_teardown_request)
+
+
+# ========== Метрики ==========
+def rate_limit_stats():
+    """Состояние лимитов: занятые места, очередь, число ведер и решения по классам"""
+    with _admission_lock:
+        running, waiting = _running, _waiting
+    with _buckets_lock:
+        buckets = len(_buckets)
+    with _stats_lock:
+        decisions = {f"{route}:{outcome}": count for (route, outcome), count in sorted(_decisions.items())}
+        wait_sum, wait_count = _queue_wait_sum, _queue_wait_count
+    return {"running": running, "waiting": waiting, "buckets": buckets, "decisions": decisions,
+            "queue_wait_seconds_sum": round(wait_sum, 6), "queue_wait_count": wait_count}
+
+
+def render_rate_limit_metrics():
+    """Текст метрик лимитов в формате Prometheus"""
+    stats = rate_limit_stats()
+    lines = [
+        '# HELP api_rate_limit_decisions_total Решения лимитера по классам маршрутов',
+        '# TYPE api_rate_limit_decisions_total counter',
+    ]
+    for name, count in stats["decisions"].items():
+        route, outcome = name.split(':')
+        lines.append(f'api_rate_limit_decisions_total{{class="{route}",outcome="{outcome}"}} {count}')
+    for name, value, help_text, kind in (
+            ('api_admission_running', stats["running"], 'Выполняющиеся тяжелые запросы', 'gauge'),
+            ('api_admission_waiting', stats["waiting"], 'Тяжелые запросы в очереди', 'gauge'),
+            ('api_rate_limit_buckets', stats["buckets"], 'Число ведер token bucket', 'gauge'),
+            ('api_admission_wait_seconds_sum', f'{stats["queue_wait_seconds_sum"]:.6f}',
+             'Суммарное ожидание в очереди', 'counter'),
+            ('api_admission_wait_seconds_count', stats["queue_wait_count"], 'Число ожиданий в очереди', 'counter')):
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        lines.append(f'{name} {value}')
+    return '\n'.join(lines) + '\n'
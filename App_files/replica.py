@@ -0,0 +1,116 @@
+# replica.py
+"""Реплика базы данных для аналитики.
+
+Статистика, отчеты и выгрузки читают копию рабочей базы, которая
+обновляется в фоне по расписанию или после накопления изменений.
+Операционные запросы работают с рабочей базой и не ждут аналитику.
+
+Пример запуска:
+    python replica.py     # обновить реплику один раз
+"""
+import os
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime
+
+from db import get_db_connection, get_change_count
+from backup import copy_database
+from scheduler import start_periodic_task
+from metrics import TimedConnection
+
+# Включение режима аналитики: если выключен, аналитика читает рабочую базу
+ANALYTICS_REPLICA_ENABLED = True
+REPLICA_PATH = 'analytics_replica.db'
+# Реплика обновляется, когда накопилось столько изменений...
+REPLICA_REFRESH_CHANGES = 50
+# ...или когда есть хотя бы одно изменение и реплика старше стольких секунд
+REPLICA_REFRESH_INTERVAL = 60
+# Как часто фоновая задача проверяет необходимость обновления (секунды)
+REPLICA_CHECK_INTERVAL = 5
+
+_refresh_lock = threading.Lock()
+
+
+def replica_change_count():
+    """Версия данных в реплике или None, если реплики нет"""
+    if not os.path.exists(REPLICA_PATH):
+        return None
+    conn = sqlite3.connect(f"file:{os.path.abspath(REPLICA_PATH)}?mode=ro", uri=True)
+    try:
+        return get_change_count(conn.cursor())
+    except sqlite3.OperationalError:
+        return None
+    finally:
+        conn.close()
+
+
+def refresh_replica(force=False):
+    """Обновление реплики, если она отстала от рабочей базы.
+
+    Возвращает True, если реплика была обновлена.
+    """
+    # Одновременно реплику обновляет только один поток
+    if not _refresh_lock.acquire(blocking=False):
+        return False
+    try:
+        conn = get_db_connection()
+        try:
+            live_changes = get_change_count(conn.cursor())
+        finally:
+            conn.close()
+
+        replica_changes = replica_change_count()
+        if not force and replica_changes is not None:
+            pending = live_changes - replica_changes
+            age = time.time() - os.path.getmtime(REPLICA_PATH)
+            if pending <= 0:
+                return False
+            if pending < REPLICA_REFRESH_CHANGES and age < REPLICA_REFRESH_INTERVAL:
+                return False
+
+        copy_database(REPLICA_PATH)
+        return True
+    finally:
+        _refresh_lock.release()
+
+
+def start_replica_refresher():
+    """Запуск фонового обновления реплики"""
+    if ANALYTICS_REPLICA_ENABLED:
+        start_periodic_task('analytics-replica', REPLICA_CHECK_INTERVAL, refresh_replica)
+
+
+def get_analytics_connection(row_factory=False):
+    """Соединение для аналитических запросов и сведения о свежести данных.
+
+    Если реплика включена и существует, возвращается соединение только для
+    чтения к ней, иначе - к рабочей базе (пока реплика не создана, запрос
+    не ждет ее построения).
+    """
+    if ANALYTICS_REPLICA_ENABLED and os.path.exists(REPLICA_PATH):
+        conn = sqlite3.connect(f"file:{os.path.abspath(REPLICA_PATH)}?mode=ro", uri=True,
+                               factory=TimedConnection)
+        refreshed_at = datetime.fromtimestamp(os.path.getmtime(REPLICA_PATH))
+        freshness = {
+            "source": "replica",
+            "refreshed_at": refreshed_at.strftime('%Y-%m-%d %H:%M:%S'),
+            "data_version": get_change_count(conn.cursor()),
+        }
+    else:
+        conn = get_db_connection()
+        freshness = {
+            "source": "live",
+            "refreshed_at": datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            "data_version": get_change_count(conn.cursor()),
+        }
+    if row_factory:
+        conn.row_factory = sqlite3.Row
+    return conn, freshness
+
+
+if __name__ == "__main__":
+    refresh_replica(force=True)
+    print(f"Реплика обновлена: {REPLICA_PATH}, версия данных: {replica_change_count()}")
+    sys.exit(0)
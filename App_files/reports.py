@@ -0,0 +1,415 @@
+# reports.py
+"""Фоновая генерация PDF-отчетов по заявкам.
+
+Перенос create_service_dashboard_pdf из Data_analysis.ipynb в приложение:
+данные читаются один раз из аналитической реплики SQLite (без Excel),
+страницы рисуются в фоновом потоке (matplotlib без интерфейса, Agg) и
+пишутся в PDF векторными, а готовый отчет кэшируется по версии данных -
+одинаковый отчет не строится дважды.
+
+Пример запуска:
+    python reports.py        # построить отчет по текущим данным
+"""
+import os
+import queue
+import sys
+import threading
+import uuid
+from datetime import datetime
+
+from archive import requests_source
+from replica import get_analytics_connection
+
+REPORTS_DIR = 'reports'
+REPORT_PREFIX = 'service_requests_report_'
+# Сколько готовых отчетов хранить в кэше и сколько задач помнить
+REPORT_CACHE_KEEP = 10
+REPORT_JOBS_KEEP = 100
+
+STATUS_COLORS = {
+    'Готова к выдаче': '#4CAF50',
+    'В процессе ремонта': '#FF9800',
+    'Новая заявка': '#2196F3',
+    'Завершена': '#8BC34A',
+    'Ожидание комплектующих': '#9C27B0',
+}
+
+REPORT_COLUMNS = ('request_id', 'start_date', 'tech_type', 'tech_model', 'request_status',
+                  'completion_date', 'days_in_process', 'master_fio', 'client_fio')
+
+
+# ========== Страницы отчета ==========
+def _pyplot():
+    """Импорт matplotlib без графического интерфейса (только в потоке отчетов)"""
+    import matplotlib
+    matplotlib.use('Agg')
+    matplotlib.rcParams['font.size'] = 10
+    matplotlib.rcParams['font.family'] = 'DejaVu Sans'
+    # Шрифт встраивается как TrueType: текст в PDF остается текстом
+    matplotlib.rcParams['pdf.fonttype'] = 42
+    import matplotlib.pyplot as plt
+    return plt
+
+
+def _no_data(ax, title, text='Нет данных'):
+    ax.text(0.5, 0.5, text, ha='center', va='center', fontsize=12, color='gray')
+    ax.set_title(title, fontsize=14, fontweight='bold')
+
+
+def page_title(plt, df, meta):
+    """Титульная страница"""
+    import pandas as pd
+    fig, ax = plt.subplots(figsize=(11, 8.5))
+    ax.axis('off')
+    ax.text(0.5, 0.7, "Аналитический отчет по сервисным заявкам",
+            fontsize=24, fontweight='bold', ha='center', va='center', transform=ax.transAxes)
+    ax.text(0.5, 0.6, f"Версия данных: {meta['data_version']}",
+            fontsize=14, ha='center', va='center', transform=ax.transAxes)
+
+    statuses = df['request_status'].fillna('')
+    info_text = f"Дата генерации: {meta['generated_at']}\n"
+    info_text += f"Всего заявок: {len(df)}\n"
+    info_text += f"Уникальных типов техники: {df['tech_type'].nunique()}\n"
+    info_text += f"Уникальных моделей: {df['tech_model'].nunique()}\n"
+    info_text += f"Мастеров в системе: {df['master_fio'].replace('', pd.NA).nunique()}\n"
+    info_text += f"Клиентов в системе: {df['client_fio'].nunique()}\n\n"
+    info_text += "Статусы заявок:\n"
+    info_text += f"• Готово к выдаче/Завершено: {statuses.str.contains('Готова|Завершена').sum()}\n"
+    info_text += f"• В процессе ремонта: {statuses.str.contains('В процессе|ремонта').sum()}\n"
+    info_text += f"• Новые заявки: {statuses.str.contains('Новая').sum()}"
+    ax.text(0.5, 0.35, info_text, fontsize=12, ha='center', va='center', transform=ax.transAxes,
+            bbox=dict(boxstyle="round,pad=0.5", facecolor="#E6F3FF", alpha=0.8, edgecolor="#0066CC"))
+    return fig
+
+
+def page_tech_types(plt, df, meta):
+    """Распределение заявок по типам техники"""
+    import numpy as np
+    fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(14, 7))
+    counts = df['tech_type'].dropna().value_counts()
+    if counts.empty:
+        _no_data(ax1, 'Распределение заявок по типам техники')
+        _no_data(ax2, 'Количество заявок по типам техники')
+        return fig
+
+    ax1.pie(counts.values, labels=counts.index, autopct='%1.1f%%',
+            colors=plt.cm.Set3(np.linspace(0.1, 0.9, len(counts))), startangle=90,
+            textprops={'fontsize': 9}, wedgeprops={'edgecolor': 'white', 'linewidth': 1})
+    ax1.set_title('Распределение заявок по типам техники', fontsize=14, fontweight='bold')
+
+    bars = ax2.bar(range(len(counts)), counts.values,
+                   color=plt.cm.viridis(np.linspace(0.2, 0.8, len(counts))), edgecolor='black', linewidth=0.5)
+    ax2.set_xticks(range(len(counts)))
+    ax2.set_xticklabels(counts.index, rotation=45, ha='right', fontsize=9)
+    ax2.set_ylabel('Количество заявок', fontsize=10)
+    ax2.set_title('Количество заявок по типам техники', fontsize=14, fontweight='bold')
+    ax2.grid(axis='y', alpha=0.3, linestyle='--')
+    for bar, value in zip(bars, counts.values):
+        ax2.text(bar.get_x() + bar.get_width() / 2, bar.get_height(), f'{value}',
+                 ha='center', va='bottom', fontsize=9, fontweight='bold')
+    plt.tight_layout()
+    return fig
+
+
+def page_statuses(plt, df, meta):
+    """Статусы заявок и время в процессе"""
+    fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(14, 7))
+    counts = df['request_status'].dropna().value_counts()
+    if counts.empty:
+        _no_data(ax1, 'Распределение заявок по статусам')
+        _no_data(ax2, 'Время обработки по статусам заявок')
+        return fig
+
+    ax1.pie(counts.values, labels=counts.index, autopct='%1.1f%%',
+            colors=[STATUS_COLORS.get(status, '#BDBDBD') for status in counts.index],
+            startangle=90, textprops={'fontsize': 9})
+    ax1.set_title('Распределение заявок по статусам', fontsize=14, fontweight='bold')
+
+    days = df[df['days_in_process'].notna() & (df['days_in_process'] > 0)]
+    groups = [(status, group['days_in_process'].values) for status, group in days.groupby('request_status')]
+    if groups:
+        bp = ax2.boxplot([values for _, values in groups], patch_artist=True, showmeans=True,
+                         meanline=True, showfliers=False,
+                         medianprops={'color': 'red', 'linewidth': 2})
+        for patch, (status, _) in zip(bp['boxes'], groups):
+            patch.set_facecolor(STATUS_COLORS.get(status, '#BDBDBD'))
+            patch.set_alpha(0.7)
+        ax2.set_xticklabels([status for status, _ in groups], rotation=45, ha='right', fontsize=9)
+        ax2.set_ylabel('Дней в обработке', fontsize=10)
+        ax2.set_title('Время обработки по статусам заявок', fontsize=14, fontweight='bold')
+        ax2.grid(True, alpha=0.3, linestyle='--')
+    else:
+        _no_data(ax2, 'Время обработки по статусам заявок', 'Нет данных о времени обработки')
+    plt.tight_layout()
+    return fig
+
+
+def page_masters(plt, df, meta):
+    """Анализ работы мастеров"""
+    import numpy as np
+    import pandas as pd
+    fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(14, 7))
+    masters = df[df['master_fio'].fillna('') != '']
+    counts = masters['master_fio'].value_counts().head(10)
+    if counts.empty:
+        _no_data(ax1, 'Топ-10 мастеров по количеству заявок')
+        _no_data(ax2, 'Распределение статусов заявок по топ-5 мастерам')
+        return fig
+
+    ax1.barh(range(len(counts)), counts.values,
+             color=plt.cm.plasma_r(np.linspace(0.2, 0.9, len(counts))), edgecolor='black', linewidth=0.5)
+    ax1.set_yticks(range(len(counts)))
+    ax1.set_yticklabels([name[:20] + '...' if len(name) > 20 else name for name in counts.index], fontsize=9)
+    ax1.invert_yaxis()
+    ax1.set_xlabel('Количество заявок', fontsize=10)
+    ax1.set_title('Топ-10 мастеров по количеству заявок', fontsize=14, fontweight='bold')
+
+    top5 = counts.head(5).index
+    matrix = pd.crosstab(masters['master_fio'], masters['request_status']).reindex(top5).fillna(0)
+    bottom = np.zeros(len(top5))
+    for status in matrix.columns:
+        ax2.bar(range(len(top5)), matrix[status].values, bottom=bottom, label=status,
+                color=STATUS_COLORS.get(status, '#BDBDBD'), edgecolor='white', linewidth=0.5)
+        bottom += matrix[status].values
+    ax2.set_xticks(range(len(top5)))
+    ax2.set_xticklabels([name[:12] + '...' if len(name) > 12 else name for name in top5],
+                        rotation=45, ha='right', fontsize=9)
+    ax2.set_ylabel('Количество заявок', fontsize=10)
+    ax2.set_title('Распределение статусов заявок по топ-5 мастерам', fontsize=14, fontweight='bold')
+    ax2.legend(title='Статус', fontsize=8, title_fontsize=9, loc='upper right')
+    plt.tight_layout()
+    return fig
+
+
+def page_timeline(plt, df, meta):
+    """Временные показатели"""
+    fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(14, 7))
+    started = df[df['start_date'].notna()]
+    if started.empty:
+        _no_data(ax1, 'Динамика заявок по месяцам', 'Нет данных о датах начала')
+        _no_data(ax2, 'Распределение времени выполнения заявок', 'Нет данных о датах начала')
+        return fig
+
+    monthly = started.groupby(started['start_date'].dt.to_period('M').astype(str)).size()
+    ax1.bar(range(len(monthly)), monthly.values, color='#64B5F6', edgecolor='black', linewidth=0.5)
+    ax1.set_xticks(range(len(monthly)))
+    ax1.set_xticklabels(monthly.index, rotation=45, ha='right', fontsize=9)
+    ax1.set_ylabel('Количество заявок', fontsize=10)
+    ax1.set_title('Динамика заявок по месяцам', fontsize=14, fontweight='bold')
+
+    completed = started[started['completion_date'].notna()]
+    processing_days = (completed['completion_date'] - completed['start_date']).dt.days
+    if len(processing_days):
+        ax2.hist(processing_days, bins=max(1, min(15, processing_days.nunique())),
+                 color='#FFB74D', edgecolor='black', alpha=0.8)
+        ax2.axvline(processing_days.mean(), color='red', linestyle='--', linewidth=2,
+                    label=f'Среднее: {processing_days.mean():.1f} дней')
+        ax2.legend(fontsize=9)
+        ax2.set_xlabel('Дней на выполнение заявки', fontsize=10)
+        ax2.set_ylabel('Количество заявок', fontsize=10)
+        ax2.set_title('Распределение времени выполнения заявок', fontsize=14, fontweight='bold')
+    else:
+        _no_data(ax2, 'Распределение времени выполнения заявок', 'Нет завершенных заявок')
+    plt.tight_layout()
+    return fig
+
+
+def page_type_status_matrix(plt, df, meta):
+    """Матрица тип техники × статус"""
+    import numpy as np
+    import pandas as pd
+    fig, ax = plt.subplots(figsize=(12, 8))
+    pivot = pd.crosstab(df['tech_type'], df['request_status'])
+    if pivot.empty:
+        _no_data(ax, 'Матрица: Тип техники × Статус заявки', 'Нет данных для построения матрицы')
+        return fig
+
+    norm = pivot.div(pivot.sum(axis=1), axis=0)
+    im = ax.imshow(norm.values, cmap='YlOrRd', aspect='auto', vmin=0, vmax=1)
+    ax.set_xticks(np.arange(len(pivot.columns)))
+    ax.set_yticks(np.arange(len(pivot.index)))
+    ax.set_xticklabels(pivot.columns, rotation=45, ha='right', fontsize=9)
+    ax.set_yticklabels(pivot.index, fontsize=9)
+    for i in range(len(pivot.index)):
+        for j in range(len(pivot.columns)):
+            if pivot.iloc[i, j] > 0:
+                ax.text(j, i, f'{pivot.iloc[i, j]}', ha='center', va='center', fontsize=9, fontweight='bold',
+                        color='white' if norm.iloc[i, j] > 0.5 else 'black')
+    ax.set_title('Матрица: Тип техники × Статус заявки', fontsize=14, fontweight='bold', pad=20)
+    ax.set_xlabel('Статус заявки', fontsize=11)
+    ax.set_ylabel('Тип техники', fontsize=11)
+    plt.colorbar(im, ax=ax, fraction=0.046, pad=0.04).set_label('Доля заявок', fontsize=10)
+    plt.tight_layout()
+    return fig
+
+
+REPORT_PAGES = (page_title, page_tech_types, page_statuses, page_masters,
+                page_timeline, page_type_status_matrix)
+
+
+# ========== Построение отчета ==========
+def load_report_data(include_archived=False):
+    """Данные для отчета из аналитической реплики и версия этих данных"""
+    # pandas нужен только отчетам, веб-процесс не загружает его при запуске
+    import pandas as pd
+    conn, freshness = get_analytics_connection()
+    try:
+        source = requests_source(conn.cursor(), include_archived)
+        df = pd.read_sql_query(f"SELECT {', '.join(REPORT_COLUMNS)} FROM {source}", conn,
+                               parse_dates=['start_date', 'completion_date'])
+    finally:
+        conn.close()
+    return df, freshness['data_version']
+
+
+def report_path(data_version, include_archived=False):
+    """Путь к отчету в кэше для версии данных"""
+    suffix = '_all' if include_archived else ''
+    return os.path.join(REPORTS_DIR, f"{REPORT_PREFIX}v{data_version}{suffix}.pdf")
+
+
+def build_report(df, data_version, output_path):
+    """Рисование страниц и сборка PDF (страницы векторные, без растрового промежуточного шага)"""
+    meta = {'data_version': data_version, 'generated_at': datetime.now().strftime('%d.%m.%Y %H:%M')}
+    plt = _pyplot()
+    from matplotlib.backends.backend_pdf import PdfPages
+
+    os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+    partial_path = f"{output_path}.{os.getpid()}.part"
+    try:
+        with PdfPages(partial_path) as pdf:
+            for page in REPORT_PAGES:
+                fig = page(plt, df, meta)
+                try:
+                    pdf.savefig(fig, bbox_inches='tight')
+                finally:
+                    plt.close(fig)
+        os.replace(partial_path, output_path)
+    finally:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+    return output_path
+
+
+def prune_report_cache():
+    """Удаление старых отчетов сверх REPORT_CACHE_KEEP"""
+    if not os.path.isdir(REPORTS_DIR):
+        return
+    paths = [os.path.join(REPORTS_DIR, name) for name in os.listdir(REPORTS_DIR)
+             if name.startswith(REPORT_PREFIX) and name.endswith('.pdf')]
+    paths.sort(key=os.path.getmtime, reverse=True)
+    for path in paths[REPORT_CACHE_KEEP:]:
+        os.remove(path)
+
+
+# ========== Очередь задач ==========
+_jobs = {}
+_jobs_lock = threading.Lock()
+_job_queue = queue.Queue()
+_worker_thread = None
+
+
+def _public_job(job):
+    """Описание задачи для API"""
+    return {key: value for key, value in job.items() if key != 'path'}
+
+
+def _run_jobs():
+    """Поток-диспетчер: задачи выполняются по очереди.
+
+    pyplot не рассчитан на рисование из нескольких потоков, поэтому все
+    отчеты рисует только этот поток.
+    """
+    while True:
+        job_id = _job_queue.get()
+        with _jobs_lock:
+            job = _jobs[job_id]
+            job['status'] = 'running'
+        try:
+            df, data_version = load_report_data(job['include_archived'])
+            # Реплика могла обновиться после постановки задачи - отчет
+            # подписывается версией данных, по которым он реально построен
+            path = report_path(data_version, job['include_archived'])
+            build_report(df, data_version, path)
+            with _jobs_lock:
+                job['data_version'], job['path'] = data_version, path
+            prune_report_cache()
+            status, error = 'done', None
+        except Exception as e:
+            print(f"Ошибка при создании отчета {job_id}: {e}")
+            status, error = 'failed', str(e)
+        with _jobs_lock:
+            job['status'] = status
+            job['error'] = error
+            job['finished_at'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _forget_old_jobs():
+    """Удаление из памяти старых завершенных задач (вызывается под _jobs_lock)"""
+    finished = [job_id for job_id, job in _jobs.items() if job['status'] in ('done', 'failed')]
+    for job_id in finished[:max(0, len(_jobs) - REPORT_JOBS_KEEP)]:
+        del _jobs[job_id]
+
+
+def submit_report(include_archived=False):
+    """Постановка отчета в очередь.
+
+    Если отчет для текущей версии данных уже построен или строится,
+    новая задача не создается - возвращается существующий результат.
+    """
+    global _worker_thread
+    conn, freshness = get_analytics_connection()
+    conn.close()
+    data_version = freshness['data_version']
+    path = report_path(data_version, include_archived)
+
+    with _jobs_lock:
+        for job in _jobs.values():
+            if job['path'] == path and job['status'] in ('queued', 'running', 'done') and \
+                    (job['status'] != 'done' or os.path.exists(path)):
+                return _public_job(job)
+
+        _forget_old_jobs()
+        job_id = uuid.uuid4().hex
+        cached = os.path.exists(path)
+        job = {
+            'job_id': job_id,
+            'status': 'done' if cached else 'queued',
+            'cached': cached,
+            'data_version': data_version,
+            'include_archived': include_archived,
+            'created_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'finished_at': None,
+            'error': None,
+            'path': path,
+        }
+        _jobs[job_id] = job
+        if not cached:
+            if _worker_thread is None:
+                _worker_thread = threading.Thread(target=_run_jobs, name='report-jobs', daemon=True)
+                _worker_thread.start()
+            _job_queue.put(job_id)
+        return _public_job(job)
+
+
+def get_report_job(job_id):
+    """Состояние задачи или None"""
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+        return _public_job(job) if job else None
+
+
+def get_report_file(job_id):
+    """Путь к готовому PDF задачи или None"""
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+        if job and job['status'] == 'done' and os.path.exists(job['path']):
+            return job['path']
+    return None
+
+
+if __name__ == "__main__":
+    df, version = load_report_data()
+    path = build_report(df, version, report_path(version))
+    print(f"Отчет создан: {path}")
+    sys.exit(0)
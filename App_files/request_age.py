@@ -0,0 +1,135 @@
+# request_age.py
+"""Поддержание days_in_process в актуальном состоянии.
+
+Раньше столбец заполнялся только при импорте из Excel. Теперь:
+- фоновая задача раз в DAYS_REFRESH_INTERVAL секунд пересчитывает возраст
+  открытых заявок и пишет только строки, у которых сменилось число дней;
+- update_request фиксирует значение при завершении заявки;
+- пока задача не отработала сегодня, значения при чтении досчитываются
+  на лету (fresh_days_in_process).
+
+Правило как в ETL: целые дни от start_date до completion_date (или до
+текущего момента), для новых заявок - NULL.
+
+Пример запуска:
+    python request_age.py     # пересчитать один раз
+"""
+import sys
+from datetime import date, datetime
+
+from db import get_db_connection, ensure_updated_at_trigger
+from scheduler import start_periodic_task
+
+NEW_STATUS = 'Новая заявка'
+# Как часто фоновая задача пересчитывает возраст открытых заявок (секунды)
+DAYS_REFRESH_INTERVAL = 3600
+
+# День последнего пересчета в этом процессе
+_refreshed_on = None
+
+
+def days_in_process_sql(end="datetime('now', 'localtime')"):
+    """SQL-выражение days_in_process для строки service_requests"""
+    return (f"CASE WHEN request_status = '{NEW_STATUS}' OR start_date IS NULL THEN NULL "
+            f"ELSE CAST(JULIANDAY(COALESCE(completion_date, {end})) - JULIANDAY(start_date) AS INTEGER) END")
+
+
+def days_in_process_update(new_status, completion_date=None):
+    """Фрагмент SET и параметры для days_in_process при смене статуса заявки.
+
+    При завершении значение фиксируется на completion_date.
+    """
+    if new_status == NEW_STATUS:
+        return "days_in_process = NULL", []
+    if completion_date:
+        return "days_in_process = CAST(JULIANDAY(?) - JULIANDAY(start_date) AS INTEGER)", [completion_date]
+    return ("days_in_process = CAST(JULIANDAY(COALESCE(completion_date, datetime('now', 'localtime'))) "
+            "- JULIANDAY(start_date) AS INTEGER)", [])
+
+
+def ensure_days_in_process(cursor):
+    """Индексы для сортировки по возрасту и для выбора открытых заявок"""
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_requests_days_in_process
+    ON service_requests(days_in_process)
+    ''')
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_requests_open
+    ON service_requests(request_id) WHERE completion_date IS NULL
+    ''')
+
+
+def refresh_days_in_process(conn=None):
+    """Пересчет возраста открытых заявок, возвращает число обновленных строк.
+
+    Обновляются только строки, у которых значение действительно изменилось,
+    поэтому за день каждая заявка переписывается не больше одного раза.
+    Пересчет возраста - не изменение заявки: триггер updated_at на время
+    пересчета снимается в той же транзакции, другие соединения его
+    отсутствия не видят.
+    """
+    global _refreshed_on
+    own_connection = conn is None
+    if own_connection:
+        conn = get_db_connection()
+    try:
+        expression = days_in_process_sql()
+        cursor = conn.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            cursor.execute("DROP TRIGGER IF EXISTS trg_service_requests_touch")
+            cursor.execute(f'''
+                UPDATE service_requests
+                SET days_in_process = {expression}
+                WHERE completion_date IS NULL AND days_in_process IS NOT {expression}
+            ''')
+            updated = cursor.rowcount
+            ensure_updated_at_trigger(cursor)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        _refreshed_on = date.today()
+        return updated
+    finally:
+        if own_connection:
+            conn.close()
+
+
+def start_days_in_process_refresher():
+    """Запуск фонового пересчета возраста заявок"""
+    return start_periodic_task('days-in-process', DAYS_REFRESH_INTERVAL, refresh_days_in_process)
+
+
+def _parse_date(value):
+    try:
+        return datetime.strptime(str(value)[:19], '%Y-%m-%d %H:%M:%S')
+    except ValueError:
+        try:
+            return datetime.strptime(str(value)[:10], '%Y-%m-%d')
+        except ValueError:
+            return None
+
+
+def fresh_days_in_process(rows):
+    """Досчет days_in_process открытых заявок при чтении, если пересчет сегодня не выполнялся.
+
+    rows - список словарей заявок, меняется на месте и возвращается.
+    """
+    if _refreshed_on == date.today():
+        return rows
+    now = datetime.now()
+    for row in rows:
+        if row.get('completion_date') or row.get('request_status') == NEW_STATUS:
+            continue
+        start = _parse_date(row.get('start_date')) if row.get('start_date') else None
+        if start is not None:
+            row['days_in_process'] = (now - start).days
+    return rows
+
+
+if __name__ == "__main__":
+    started = datetime.now()
+    updated = refresh_days_in_process()
+    print(f"Обновлено заявок: {updated}, время: {(datetime.now() - started).total_seconds():.2f} с")
+    sys.exit(0)
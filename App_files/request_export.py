@@ -0,0 +1,97 @@
+# request_export.py
+"""Потоковая выгрузка заявок в CSV, XLSX и JSON Lines.
+
+Строки читаются из курсора пачками и сразу отдаются клиенту, поэтому память
+не растет с размером выгрузки. XLSX - zip-архив, его нельзя отдавать до
+завершения записи: строки пишутся в книгу openpyxl в режиме write_only
+(она держит на диске, а не в памяти), после чего файл отдается частями.
+"""
+import csv
+import io
+import json
+import os
+import tempfile
+
+# Сколько строк читается из курсора за один раз
+EXPORT_BATCH_SIZE = 1000
+# Размер части файла XLSX при отдаче
+EXPORT_CHUNK_SIZE = 64 * 1024
+
+
+def iter_batches(cursor):
+    """Строки курсора пачками по EXPORT_BATCH_SIZE"""
+    while True:
+        rows = cursor.fetchmany(EXPORT_BATCH_SIZE)
+        if not rows:
+            return
+        yield rows
+
+
+def column_names(cursor):
+    return [column[0] for column in cursor.description]
+
+
+def stream_csv(cursor):
+    """CSV в формате выгрузок ETL: UTF-8 с BOM, разделитель ';'"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, delimiter=';')
+    buffer.write('\ufeff')
+    writer.writerow(column_names(cursor))
+    for rows in iter_batches(cursor):
+        writer.writerows(rows)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+def stream_jsonl(cursor):
+    """JSON Lines: одна заявка - одна строка"""
+    columns = column_names(cursor)
+    for rows in iter_batches(cursor):
+        yield ''.join(json.dumps(dict(zip(columns, row)), ensure_ascii=False) + '\n'
+                      for row in rows).encode('utf-8')
+
+
+def stream_xlsx(cursor):
+    """XLSX через книгу write_only во временном файле"""
+    # openpyxl загружается только при выгрузке в XLSX
+    from openpyxl import Workbook
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet('Заявки')
+    sheet.append(column_names(cursor))
+    for rows in iter_batches(cursor):
+        for row in rows:
+            sheet.append(list(row))
+
+    fd, path = tempfile.mkstemp(suffix='.xlsx')
+    os.close(fd)
+    try:
+        workbook.save(path)
+        with open(path, 'rb') as f:
+            while True:
+                chunk = f.read(EXPORT_CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+    finally:
+        os.remove(path)
+
+
+# Формат -> (MIME-тип, расширение файла, генератор)
+EXPORT_FORMATS = {
+    'csv': ('text/csv; charset=utf-8', 'csv', stream_csv),
+    'xlsx': ('application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', 'xlsx', stream_xlsx),
+    'jsonl': ('application/x-ndjson; charset=utf-8', 'jsonl', stream_jsonl),
+}
+
+
+def stream_export(conn, sql, params, export_format):
+    """Генератор байтов выгрузки; закрывает соединение по завершении или обрыве"""
+    try:
+        cursor = conn.cursor()
+        cursor.execute(sql, params)
+        yield from EXPORT_FORMATS[export_format][2](cursor)
+    finally:
+        conn.close()
@@ -0,0 +1,252 @@
+# rollups.py
+"""Агрегаты заявок по времени для графиков и планирования загрузки.
+
+request_rollups хранит по часам (по типу оборудования и мастеру) число
+принятых и завершенных заявок и сумму сроков выполнения, turnaround_histogram -
+по дням распределение сроков выполнения по интервалам (для перцентилей).
+Агрегаты ведутся триггерами на service_requests и архиве: создание,
+завершение, переназначение и удаление заявки сразу меняют только свои
+строки агрегатов, поэтому временные ряды не требуют полного просмотра заявок.
+
+Завершенной считается заявка с completion_date, срок выполнения - дни
+от start_date до completion_date.
+
+Пример запуска:
+    python rollups.py --rebuild      # пересчитать агрегаты с нуля
+"""
+import argparse
+import sys
+from datetime import datetime
+
+from archive import ARCHIVE_TABLE
+from db import get_db_connection
+
+ROLLUP_TABLE = 'request_rollups'
+HISTOGRAM_TABLE = 'turnaround_histogram'
+
+# Границы интервалов срока выполнения в днях: интервал i - [EDGES[i-1], EDGES[i])
+TURNAROUND_BIN_EDGES = (1, 2, 3, 5, 7, 10, 14, 21, 30, 45, 60, 90, 180, 365, 730)
+
+# Гранулярность -> выражение группировки по часовому и дневному ключу
+GRANULARITIES = {
+    'hour': ("bucket", None),
+    'day': ("substr(bucket, 1, 10)", "bucket"),
+    'week': ("date(bucket, 'weekday 0', '-6 days')", "date(bucket, 'weekday 0', '-6 days')"),
+    'month': ("substr(bucket, 1, 7)", "substr(bucket, 1, 7)"),
+}
+
+# Измерение разбивки -> столбец агрегатов
+GROUP_BY_COLUMNS = {'tech_type': 'tech_type', 'master': 'master_id'}
+
+
+def _turnaround(row):
+    return f"(JULIANDAY({row}.completion_date) - JULIANDAY({row}.start_date))"
+
+
+def _bin_expression(row):
+    days = _turnaround(row)
+    cases = ' '.join(f"WHEN {days} < {edge} THEN {i}" for i, edge in enumerate(TURNAROUND_BIN_EDGES))
+    return f"CASE {cases} ELSE {len(TURNAROUND_BIN_EDGES)} END"
+
+
+def _apply_statements(row, sign, source=''):
+    """Операторы, добавляющие (sign=1) или вычитающие (sign=-1) вклад строки в агрегаты.
+
+    В триггере row - NEW/OLD, при пересчете source - 'FROM таблица row'.
+    """
+    tech_type = f"COALESCE({row}.tech_type, '')"
+    master_id = f"COALESCE({row}.master_id, 0)"
+    completed = (f"{row}.completion_date IS NOT NULL AND JULIANDAY({row}.completion_date) IS NOT NULL "
+                 f"AND JULIANDAY({row}.start_date) IS NOT NULL")
+    return [
+        f'''INSERT INTO {ROLLUP_TABLE} (bucket, tech_type, master_id, created, completed, turnaround_sum)
+        SELECT strftime('%Y-%m-%d %H:00', {row}.start_date), {tech_type}, {master_id}, {sign}, 0, 0
+        {source} WHERE strftime('%Y-%m-%d %H:00', {row}.start_date) IS NOT NULL
+        ON CONFLICT(bucket, tech_type, master_id) DO UPDATE SET created = created + excluded.created''',
+        f'''INSERT INTO {ROLLUP_TABLE} (bucket, tech_type, master_id, created, completed, turnaround_sum)
+        SELECT strftime('%Y-%m-%d %H:00', {row}.completion_date), {tech_type}, {master_id},
+               0, {sign}, {sign} * {_turnaround(row)}
+        {source} WHERE {completed}
+        ON CONFLICT(bucket, tech_type, master_id) DO UPDATE SET
+            completed = completed + excluded.completed,
+            turnaround_sum = turnaround_sum + excluded.turnaround_sum''',
+        f'''INSERT INTO {HISTOGRAM_TABLE} (bucket, tech_type, master_id, bin, count)
+        SELECT date({row}.completion_date), {tech_type}, {master_id}, {_bin_expression(row)}, {sign}
+        {source} WHERE {completed}
+        ON CONFLICT(bucket, tech_type, master_id, bin) DO UPDATE SET count = count + excluded.count''',
+    ]
+
+
+def ensure_rollups(cursor):
+    """Создание таблиц агрегатов и триггеров; при первом создании - заполнение.
+
+    Вызывается после ensure_archive_schema: архив тоже учитывается, поэтому
+    перенос заявки в архив не меняет агрегатов.
+    """
+    cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?", (ROLLUP_TABLE,))
+    created = cursor.fetchone() is None
+
+    cursor.execute(f'''
+    CREATE TABLE IF NOT EXISTS {ROLLUP_TABLE} (
+        bucket TEXT NOT NULL,
+        tech_type TEXT NOT NULL,
+        master_id INTEGER NOT NULL,
+        created INTEGER NOT NULL DEFAULT 0,
+        completed INTEGER NOT NULL DEFAULT 0,
+        turnaround_sum REAL NOT NULL DEFAULT 0,
+        PRIMARY KEY (bucket, tech_type, master_id)
+    )
+    ''')
+    cursor.execute(f'''
+    CREATE TABLE IF NOT EXISTS {HISTOGRAM_TABLE} (
+        bucket TEXT NOT NULL,
+        tech_type TEXT NOT NULL,
+        master_id INTEGER NOT NULL,
+        bin INTEGER NOT NULL,
+        count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (bucket, tech_type, master_id, bin)
+    )
+    ''')
+
+    tracked_columns = 'start_date, completion_date, tech_type, master_id'
+    for table in ('service_requests', ARCHIVE_TABLE):
+        triggers = {
+            'insert': ('AFTER INSERT', _apply_statements('NEW', 1)),
+            'delete': ('AFTER DELETE', _apply_statements('OLD', -1)),
+            'update': (f'AFTER UPDATE OF {tracked_columns}',
+                       _apply_statements('OLD', -1) + _apply_statements('NEW', 1)),
+        }
+        for event, (timing, statements) in triggers.items():
+            body = ';\n'.join(statements)
+            cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_{event}_rollups
+            {timing} ON {table}
+            BEGIN
+                {body};
+            END
+            ''')
+
+    if created:
+        rebuild_rollups(cursor)
+
+
+def rebuild_rollups(cursor):
+    """Пересчет агрегатов с нуля по заявкам и архиву"""
+    cursor.execute(f"DELETE FROM {ROLLUP_TABLE}")
+    cursor.execute(f"DELETE FROM {HISTOGRAM_TABLE}")
+    for table in ('service_requests', ARCHIVE_TABLE):
+        for statement in _apply_statements('r', 1, source=f"FROM {table} r"):
+            cursor.execute(statement)
+
+
+def _percentile(bins, total, q):
+    """Верхняя граница интервала, в который попадает перцентиль q (приближенно).
+
+    Последний интервал (от TURNAROUND_BIN_EDGES[-1] дней) сверху не ограничен:
+    перцентиль в нем неизвестен, возвращается None.
+    """
+    threshold = q * total
+    cumulative = 0
+    for i in sorted(bins):
+        cumulative += bins[i]
+        if cumulative >= threshold:
+            return TURNAROUND_BIN_EDGES[i] if i < len(TURNAROUND_BIN_EDGES) else None
+    return None
+
+
+def query_timeseries(cursor, start=None, end=None, granularity='day', group_by=None,
+                     tech_type=None, master_id=None):
+    """Временной ряд из агрегатов.
+
+    start/end - даты 'YYYY-MM-DD' (end включительно). Для каждого периода
+    (и значения group_by) возвращаются принятые и завершенные заявки, средний
+    срок и p50/p90 срока в днях. Перцентили берутся из дневной гистограммы
+    и равны верхней границе интервала, поэтому для hour не считаются;
+    перцентиль, попавший в интервал сроков от 730 дней, равен None.
+    """
+    period, histogram_period = GRANULARITIES[granularity]
+    group_column = GROUP_BY_COLUMNS[group_by] if group_by else None
+
+    conditions, params = [], []
+    if start:
+        conditions.append("bucket >= ?")
+        params.append(start)
+    if end:
+        conditions.append("bucket < date(?, '+1 day')")
+        params.append(end)
+    if tech_type is not None:
+        conditions.append("tech_type = ?")
+        params.append(tech_type)
+    if master_id is not None:
+        conditions.append("master_id = ?")
+        params.append(master_id)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    group_select = f", {group_column}" if group_column else ", NULL"
+    group_clause = f", {group_column}" if group_column else ""
+
+    cursor.execute(f'''
+        SELECT {period} AS period{group_select}, SUM(created), SUM(completed), SUM(turnaround_sum)
+        FROM {ROLLUP_TABLE} {where}
+        GROUP BY period{group_clause}
+        HAVING SUM(created) != 0 OR SUM(completed) != 0
+        ORDER BY period{group_clause}
+    ''', params)
+    series = []
+    index = {}
+    for period_value, group_value, created, completed, turnaround_sum in cursor.fetchall():
+        point = {
+            "period": period_value,
+            "created": created,
+            "completed": completed,
+            "avg_turnaround_days": round(turnaround_sum / completed, 1) if completed else None,
+            "p50_turnaround_days": None,
+            "p90_turnaround_days": None,
+        }
+        if group_by:
+            point[group_by] = group_value
+        series.append(point)
+        index[(period_value, group_value)] = point
+
+    if histogram_period:
+        cursor.execute(f'''
+            SELECT {histogram_period} AS period{group_select}, bin, SUM(count)
+            FROM {HISTOGRAM_TABLE} {where}
+            GROUP BY period{group_clause}, bin
+        ''', params)
+        histograms = {}
+        for period_value, group_value, bin_index, count in cursor.fetchall():
+            if count:
+                histograms.setdefault((period_value, group_value), {})[bin_index] = count
+        for key, bins in histograms.items():
+            point = index.get(key)
+            total = sum(bins.values())
+            if point is None or total <= 0:
+                continue
+            point["p50_turnaround_days"] = _percentile(bins, total, 0.5)
+            point["p90_turnaround_days"] = _percentile(bins, total, 0.9)
+    return series
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Агрегаты заявок по времени")
+    parser.add_argument('--rebuild', action='store_true', help="пересчитать агрегаты с нуля")
+    parser.add_argument('--granularity', default='month', choices=list(GRANULARITIES))
+    args = parser.parse_args()
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    if args.rebuild:
+        started = datetime.now()
+        cursor.execute("BEGIN IMMEDIATE")
+        ensure_rollups(cursor)
+        rebuild_rollups(cursor)
+        conn.commit()
+        print(f"Агрегаты пересчитаны за {(datetime.now() - started).total_seconds():.2f} с")
+    for point in query_timeseries(cursor, granularity=args.granularity):
+        print(point)
+    conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
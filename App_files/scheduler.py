@@ -0,0 +1,29 @@
+# scheduler.py
+import threading
+
+# Запущенные фоновые задачи: имя -> поток
+_tasks = {}
+_tasks_lock = threading.Lock()
+
+
+def start_periodic_task(name, interval, func):
+    """Запуск func каждые interval секунд в фоновом потоке (один раз на имя).
+
+    Ошибки задачи печатаются и не останавливают расписание.
+    """
+    with _tasks_lock:
+        if name in _tasks:
+            return _tasks[name]
+
+        def loop():
+            stop_event = threading.Event()
+            while not stop_event.wait(interval):
+                try:
+                    func()
+                except Exception as e:
+                    print(f"Ошибка фоновой задачи {name}: {e}")
+
+        thread = threading.Thread(target=loop, name=name, daemon=True)
+        thread.start()
+        _tasks[name] = thread
+        return thread
@@ -0,0 +1,227 @@
+# sessions.py
+"""Серверное хранилище сессий.
+
+В cookie хранится только случайный идентификатор сессии, а данные -
+в памяти процесса и в таблице user_sessions (чтобы сессии переживали
+перезапуск). При входе выдается новый идентификатор (rotate_session:
+идентификатор, полученный до входа, перестает действовать) и в сессию
+сразу записывается контекст пользователя: роль, id мастера и логин
+клиента, поэтому обработчикам не нужно заново искать мастера по логину -
+проверка доступа сводится к чтению словаря сессии.
+
+Время последнего обращения обновляется только в памяти; фоновая задача
+раз в SESSION_FLUSH_INTERVAL секунд записывает его в базу одним пакетом
+и удаляет сессии, простаивавшие дольше SESSION_IDLE_TIMEOUT.
+"""
+import json
+import secrets
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+
+from db import get_db_connection
+from scheduler import start_periodic_task
+
+SESSION_TABLE = 'user_sessions'
+# Сессия без обращений дольше стольких секунд удаляется
+SESSION_IDLE_TIMEOUT = 8 * 3600
+# Как часто время обращений записывается в базу (секунды)
+SESSION_FLUSH_INTERVAL = 30
+
+
+def _timestamp(seconds):
+    return datetime.fromtimestamp(seconds).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def ensure_session_store(cursor):
+    """Создание таблицы сессий"""
+    cursor.execute(f'''
+    CREATE TABLE IF NOT EXISTS {SESSION_TABLE} (
+        session_id TEXT PRIMARY KEY,
+        data TEXT NOT NULL,
+        created_at TIMESTAMP DEFAULT (datetime('now', 'localtime')),
+        last_seen TIMESTAMP NOT NULL
+    )
+    ''')
+    cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_user_sessions_last_seen ON {SESSION_TABLE}(last_seen)")
+
+
+def build_user_context(cursor, user):
+    """Данные сессии пользователя: строка users, id мастера и логин клиента"""
+    master_id = None
+    if user['user_type'] == 'master':
+        cursor.execute("SELECT id FROM masters WHERE master_login = ?", (user['login'],))
+        row = cursor.fetchone()
+        master_id = row[0] if row else None
+    return {
+        'user_id': user['id'],
+        'user_login': user['login'],
+        'user_name': user['fio'],
+        'user_type': user['user_type'],
+        'master_id': master_id,
+        'client_login': user['login'] if user['user_type'] == 'client' else None,
+    }
+
+
+class SessionStore:
+    """Сессии в памяти с записью в SQLite"""
+
+    def __init__(self, idle_timeout=SESSION_IDLE_TIMEOUT):
+        self.idle_timeout = idle_timeout
+        self._lock = threading.Lock()
+        # Идентификатор -> [данные, время последнего обращения]
+        self._sessions = {}
+        # Сессии, время обращения которых еще не записано в базу
+        self._seen = set()
+
+    def get(self, sid):
+        """Данные сессии (с отметкой обращения) или None"""
+        now = time.time()
+        entry = self._sessions.get(sid)
+        if entry is None:
+            entry = self._load(sid)
+            if entry is None:
+                return None
+        if now - entry[1] > self.idle_timeout:
+            self.delete(sid)
+            return None
+        entry[1] = now
+        with self._lock:
+            self._seen.add(sid)
+        return entry[0]
+
+    def _load(self, sid):
+        """Сессия из базы (после перезапуска процесса)"""
+        conn = get_db_connection()
+        try:
+            row = conn.execute(f"SELECT data, last_seen FROM {SESSION_TABLE} WHERE session_id = ?",
+                               (sid,)).fetchone()
+        except sqlite3.OperationalError:
+            # Таблица еще не создана: база не инициализирована
+            return None
+        finally:
+            conn.close()
+        if row is None:
+            return None
+        entry = [json.loads(row[0]), datetime.strptime(row[1], '%Y-%m-%d %H:%M:%S').timestamp()]
+        with self._lock:
+            self._sessions[sid] = entry
+        return entry
+
+    def save(self, sid, data):
+        """Запись данных сессии (при входе и изменении сессии)"""
+        now = time.time()
+        conn = get_db_connection()
+        try:
+            conn.execute(f'''
+                INSERT INTO {SESSION_TABLE} (session_id, data, last_seen) VALUES (?, ?, ?)
+                ON CONFLICT(session_id) DO UPDATE SET data = excluded.data, last_seen = excluded.last_seen
+            ''', (sid, json.dumps(data, ensure_ascii=False), _timestamp(now)))
+            conn.commit()
+        finally:
+            conn.close()
+        with self._lock:
+            self._sessions[sid] = [data, now]
+
+    def delete(self, sid):
+        with self._lock:
+            self._sessions.pop(sid, None)
+            self._seen.discard(sid)
+        conn = get_db_connection()
+        try:
+            conn.execute(f"DELETE FROM {SESSION_TABLE} WHERE session_id = ?", (sid,))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def flush(self):
+        """Запись времени обращений пакетом и удаление простаивающих сессий"""
+        cutoff = time.time() - self.idle_timeout
+        with self._lock:
+            seen = [(_timestamp(self._sessions[sid][1]), sid) for sid in self._seen if sid in self._sessions]
+            self._seen.clear()
+            idle = [sid for sid, entry in self._sessions.items() if entry[1] < cutoff]
+            for sid in idle:
+                del self._sessions[sid]
+        conn = get_db_connection()
+        try:
+            conn.executemany(f"UPDATE {SESSION_TABLE} SET last_seen = ? WHERE session_id = ?", seen)
+            conn.execute(f"DELETE FROM {SESSION_TABLE} WHERE last_seen < ?", (_timestamp(cutoff),))
+            conn.commit()
+        finally:
+            conn.close()
+        return len(seen), len(idle)
+
+    def stats(self):
+        with self._lock:
+            return {"active": len(self._sessions), "pending_last_seen": len(self._seen)}
+
+
+class ServerSession(CallbackDict, SessionMixin):
+    """Сессия Flask, данные которой хранятся на сервере"""
+
+    def __init__(self, initial=None, sid=None):
+        def on_update(session):
+            session.modified = True
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.modified = False
+
+
+class ServerSessionInterface(SessionInterface):
+    """Подключение SessionStore к Flask вместо подписанных cookie"""
+
+    def __init__(self, store):
+        self.store = store
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        data = self.store.get(sid) if sid else None
+        if data is None:
+            return ServerSession()
+        return ServerSession(data, sid)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        if session.accessed:
+            response.vary.add('Cookie')
+        if not session:
+            # Выход: сессия очищена
+            if session.sid is not None and session.modified:
+                self.store.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+        if not session.modified:
+            return
+        if session.sid is None:
+            session.sid = secrets.token_urlsafe(32)
+        self.store.save(session.sid, dict(session))
+        response.set_cookie(name, session.sid, domain=domain, path=path,
+                            httponly=self.get_cookie_httponly(app), secure=self.get_cookie_secure(app),
+                            samesite=self.get_cookie_samesite(app))
+
+
+session_store = SessionStore()
+
+
+def rotate_session(session):
+    """Очистка сессии перед входом и выдача нового идентификатора.
+
+    Старая сессия удаляется из хранилища, поэтому cookie, выданный до входа
+    (в том числе подброшенный другим человеком), после входа не действует.
+    """
+    if session.sid is not None:
+        session_store.delete(session.sid)
+        session.sid = None
+    session.clear()
+
+
+def start_session_flusher():
+    """Запуск фоновой записи времени обращений и удаления простаивающих сессий"""
+    return start_periodic_task('session-flush', SESSION_FLUSH_INTERVAL, session_store.flush)
@@ -0,0 +1,314 @@
+# sla.py
+"""Сроки выполнения и соблюдение SLA по мастерам и типам оборудования.
+
+Среднее время скрывает длинный хвост (в тестовых данных есть заявки старше
+900 дней), поэтому здесь считаются перцентили p50/p90/p99 срока выполнения,
+число нарушений SLA и время пребывания в каждом статусе по status_history.
+
+Нужные столбцы один раз загружаются в массивы NumPy, все группировки
+выполняются векторно (сортировка + bincount), без цикла по заявкам.
+Результат кэшируется по версии данных аналитической реплики.
+
+Пример запуска:
+    python sla.py                        # отчет по текущим данным
+    python sla.py --benchmark 1000000    # замер на синтетических данных
+"""
+import argparse
+import sys
+import threading
+import time
+
+import numpy as np
+
+from archive import COMPLETED_STATUS, requests_source
+from replica import get_analytics_connection
+
+# Нормативный срок выполнения заявки в днях и допустимые значения в API
+SLA_DAYS = 14
+SLA_DAYS_MAX = 365
+QUANTILES = (0.5, 0.9, 0.99)
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+# ========== Векторные вычисления ==========
+def group_percentiles(codes, values, n_groups, quantiles=QUANTILES):
+    """Перцентили values по группам codes (линейная интерполяция, как np.percentile).
+
+    Возвращает массив (n_groups, len(quantiles)), для пустых групп - NaN.
+    """
+    counts = np.bincount(codes, minlength=n_groups)
+    offsets = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    sorted_values = values
+    if len(values):
+        # Одна сортировка по составному ключу (группа, значение) вместо lexsort
+        low_value = values.min()
+        span = values.max() - low_value + 1
+        keys = np.sort(codes * span + (values - low_value))
+        sorted_values = keys - np.repeat(np.arange(n_groups), counts) * span + low_value
+    result = np.full((n_groups, len(quantiles)), np.nan)
+    filled = counts > 0
+    for j, q in enumerate(quantiles):
+        position = offsets[filled] + (counts[filled] - 1) * q
+        low = np.floor(position).astype(np.int64)
+        high = np.ceil(position).astype(np.int64)
+        result[filled, j] = sorted_values[low] + (sorted_values[high] - sorted_values[low]) * (position - low)
+    return result
+
+
+def group_summary(codes, labels, turnaround, completed, age, sla_days):
+    """Перцентили срока и нарушения SLA по группам"""
+    n_groups = len(labels)
+    done = completed
+    percentiles = group_percentiles(codes[done], turnaround[done], n_groups)
+    completed_count = np.bincount(codes[done], minlength=n_groups)
+    mean = np.bincount(codes[done], weights=turnaround[done], minlength=n_groups) / np.maximum(completed_count, 1)
+    breached = np.bincount(codes[done & (turnaround > sla_days)], minlength=n_groups)
+    open_count = np.bincount(codes[~done], minlength=n_groups)
+    open_breached = np.bincount(codes[~done & (age > sla_days)], minlength=n_groups)
+
+    summary = []
+    for g in range(n_groups):
+        summary.append({
+            "key": labels[g],
+            "completed": int(completed_count[g]),
+            "open": int(open_count[g]),
+            "mean_days": round(float(mean[g]), 1) if completed_count[g] else None,
+            **{f"p{round(q * 100)}_days": (None if np.isnan(percentiles[g, j]) else round(float(percentiles[g, j]), 1))
+               for j, q in enumerate(QUANTILES)},
+            "sla_breached": int(breached[g]),
+            "sla_breach_rate": round(int(breached[g]) / int(completed_count[g]), 3) if completed_count[g] else None,
+            "open_over_sla": int(open_breached[g]),
+        })
+    return summary
+
+
+def status_durations(history_request_ids, history_times, history_old, history_new,
+                     request_ids, start_times, open_requests, now):
+    """Отрезки пребывания в статусах по истории, упорядоченной по (заявка, время).
+
+    Отрезок статуса new_status длится до следующей записи по той же заявке;
+    у последней записи - до now, если заявка не завершена. Первый отрезок
+    (old_status первой записи) начинается со start_date заявки.
+    Возвращает (коды статусов, длительности в днях).
+    """
+    n = len(history_request_ids)
+    if n == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0)
+    same_next = np.zeros(n, dtype=bool)
+    same_next[:-1] = history_request_ids[1:] == history_request_ids[:-1]
+    first = np.ones(n, dtype=bool)
+    first[1:] = ~same_next[:-1]
+
+    # Сопоставление записей истории с заявками (request_ids отсортированы)
+    position = np.clip(np.searchsorted(request_ids, history_request_ids), 0, max(len(request_ids) - 1, 0))
+    known = (request_ids[position] == history_request_ids) if len(request_ids) else np.zeros(n, dtype=bool)
+
+    end = np.full(n, np.nan)
+    end[:-1] = history_times[1:]
+    still_open = known & open_requests[position] if len(request_ids) else np.zeros(n, dtype=bool)
+    end[~same_next] = np.where(still_open[~same_next], now, np.nan)
+    durations = end - history_times
+
+    initial = first & known & (history_old >= 0)
+    initial_durations = history_times[initial] - start_times[position[initial]]
+
+    codes = np.concatenate((history_new, history_old[initial]))
+    values = np.concatenate((durations, initial_durations))
+    valid = ~np.isnan(values)
+    return codes[valid], np.maximum(values[valid], 0)
+
+
+# ========== Загрузка данных ==========
+def _factorize(values):
+    """Коды групп и их значения (в порядке сортировки значений)"""
+    if isinstance(values, np.ndarray):
+        labels, codes = np.unique(values, return_inverse=True)
+        return codes.astype(np.int64), labels.tolist()
+    index = {}
+    codes = np.fromiter((index.setdefault(value, len(index)) for value in values),
+                        dtype=np.int64, count=len(values))
+    labels = sorted(index)
+    rank = np.empty(len(labels), dtype=np.int64)
+    rank[[index[label] for label in labels]] = np.arange(len(labels))
+    return rank[codes], labels
+
+
+def load_arrays(cursor, include_archived=False):
+    """Столбцы заявок и истории статусов в виде массивов NumPy (даты - юлианские дни)"""
+    source = requests_source(cursor, include_archived)
+    cursor.execute("SELECT JULIANDAY('now', 'localtime')")
+    now = cursor.fetchone()[0]
+    cursor.execute(f'''
+        SELECT request_id, JULIANDAY(start_date), JULIANDAY(completion_date),
+               COALESCE(master_id, 0), COALESCE(tech_type, '')
+        FROM {source}
+        ORDER BY request_id
+    ''')
+    rows = cursor.fetchall()
+    columns = list(zip(*rows)) if rows else [(), (), (), (), ()]
+    requests = {
+        "request_id": np.array(columns[0], dtype=np.int64),
+        "start": np.array(columns[1], dtype=float),
+        "completion": np.array(columns[2], dtype=float),
+        "master_id": np.array(columns[3], dtype=np.int64),
+        "tech_type": columns[4],
+    }
+
+    # История - только заявок из того же источника: без архива переходы
+    # архивных заявок не попадают во время в статусах
+    cursor.execute(f'''
+        SELECT request_id, JULIANDAY(changed_at), COALESCE(old_status, ''), new_status
+        FROM status_history
+        WHERE request_id IN (SELECT request_id FROM {source})
+        ORDER BY request_id, changed_at, id
+    ''')
+    rows = cursor.fetchall()
+    columns = list(zip(*rows)) if rows else [(), (), (), ()]
+    statuses = sorted((set(columns[2]) | set(columns[3])) - {''})
+    status_codes = {status: code for code, status in enumerate(statuses)}
+    history = {
+        "request_id": np.array(columns[0], dtype=np.int64),
+        "changed_at": np.array(columns[1], dtype=float),
+        "old_status": np.array([status_codes.get(s, -1) if s else -1 for s in columns[2]], dtype=np.int64),
+        "new_status": np.array([status_codes[s] for s in columns[3]], dtype=np.int64),
+        "statuses": statuses,
+    }
+
+    cursor.execute("SELECT id, master_fio FROM masters")
+    master_names = dict(cursor.fetchall())
+    return requests, history, master_names, now
+
+
+def compute_sla(requests, history, master_names, now, sla_days=SLA_DAYS):
+    """Сводка SLA по мастерам, типам оборудования и статусам"""
+    completed = ~np.isnan(requests["completion"]) & ~np.isnan(requests["start"])
+    turnaround = np.where(completed, requests["completion"] - requests["start"], 0.0)
+    age = now - requests["start"]
+    age = np.where(np.isnan(age), 0.0, age)
+
+    master_codes, masters = _factorize(requests["master_id"])
+    type_codes, tech_types = _factorize(requests["tech_type"])
+    overall_codes = np.zeros(len(turnaround), dtype=np.int64)
+
+    by_master = group_summary(master_codes, masters, turnaround, completed, age, sla_days)
+    for item in by_master:
+        item["master_id"] = int(item.pop("key")) or None
+        item["master_fio"] = master_names.get(item["master_id"], "Не назначен")
+    by_tech_type = group_summary(type_codes, tech_types, turnaround, completed, age, sla_days)
+    for item in by_tech_type:
+        item["tech_type"] = item.pop("key")
+    overall = group_summary(overall_codes, ["all"], turnaround, completed, age, sla_days)[0]
+    overall.pop("key")
+
+    codes, durations = status_durations(
+        history["request_id"], history["changed_at"], history["old_status"], history["new_status"],
+        requests["request_id"], requests["start"], ~completed, now)
+    statuses = history["statuses"]
+    percentiles = group_percentiles(codes, durations, len(statuses))
+    counts = np.bincount(codes, minlength=len(statuses))
+    totals = np.bincount(codes, weights=durations, minlength=len(statuses))
+    time_in_status = [{
+        "status": statuses[s],
+        "intervals": int(counts[s]),
+        "mean_days": round(float(totals[s] / counts[s]), 1) if counts[s] else None,
+        **{f"p{round(q * 100)}_days": (None if np.isnan(percentiles[s, j]) else round(float(percentiles[s, j]), 1))
+           for j, q in enumerate(QUANTILES)},
+    } for s in range(len(statuses))]
+
+    return {
+        "sla_days": sla_days,
+        "overall": overall,
+        "by_master": by_master,
+        "by_tech_type": by_tech_type,
+        "time_in_status": time_in_status,
+    }
+
+
+def get_sla_report(include_archived=False, sla_days=SLA_DAYS):
+    """Сводка SLA по аналитической реплике с кэшем по версии данных"""
+    conn, freshness = get_analytics_connection()
+    try:
+        key = (freshness["data_version"], include_archived, sla_days)
+        with _cache_lock:
+            cached = _cache.get(key)
+        if cached is None:
+            requests, history, master_names, now = load_arrays(conn.cursor(), include_archived)
+            cached = compute_sla(requests, history, master_names, now, sla_days)
+            with _cache_lock:
+                # Результаты для старых версий данных больше не нужны
+                for old_key in [k for k in _cache if k[0] != key[0]]:
+                    del _cache[old_key]
+                _cache[key] = cached
+    finally:
+        conn.close()
+    return dict(cached, freshness=freshness)
+
+
+# ========== Замер производительности ==========
+def synthetic_arrays(n, seed=0):
+    """Синтетические заявки и история (3 смены статуса на заявку) в виде массивов"""
+    rng = np.random.default_rng(seed)
+    now = 2461000.0
+    start = now - rng.uniform(0, 1000, n)
+    turnaround = rng.lognormal(mean=1.8, sigma=1.0, size=n)
+    completion = np.where(start + turnaround < now, start + turnaround, np.nan)
+    requests = {
+        "request_id": np.arange(1, n + 1, dtype=np.int64),
+        "start": start,
+        "completion": completion,
+        "master_id": rng.zipf(1.5, n) % 50,
+        "tech_type": [f"type_{i}" for i in rng.zipf(1.3, n) % 30],
+    }
+    steps = np.sort(rng.uniform(0, 1, (n, 3)), axis=1) * np.where(np.isnan(turnaround), 1, turnaround)[:, None]
+    history = {
+        "request_id": np.repeat(requests["request_id"], 3),
+        "changed_at": (start[:, None] + steps).ravel(),
+        "old_status": np.tile([0, 1, 2], n),
+        "new_status": np.tile([1, 2, 3], n),
+        "statuses": ['Новая заявка', 'В процессе ремонта', 'Ожидание запчастей', COMPLETED_STATUS],
+    }
+    return requests, history, {}, now
+
+
+def benchmark(n):
+    requests, history, master_names, now = synthetic_arrays(n)
+    started = time.perf_counter()
+    report = compute_sla(requests, history, master_names, now)
+    elapsed = time.perf_counter() - started
+    print(f"Заявок: {n}, записей истории: {len(history['request_id'])}")
+    print(f"Расчет: {elapsed:.3f} с, мастеров: {len(report['by_master'])}, "
+          f"типов: {len(report['by_tech_type'])}")
+    print(f"Итого: {report['overall']}")
+
+    # Проверка перцентилей по одной группе против np.percentile
+    codes, labels = _factorize(requests["tech_type"])
+    done = ~np.isnan(requests["completion"])
+    values = (requests["completion"] - requests["start"])[done & (codes == 0)]
+    expected = np.percentile(values, [q * 100 for q in QUANTILES])
+    actual = [report["by_tech_type"][0][f"p{round(q * 100)}_days"] for q in QUANTILES]
+    print(f"Проверка по '{labels[0]}': {np.round(expected, 1).tolist()} == {actual}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сроки выполнения и SLA по мастерам и типам оборудования")
+    parser.add_argument('--sla-days', type=float, default=SLA_DAYS, help="нормативный срок в днях")
+    parser.add_argument('--include-archived', action='store_true', help="учитывать архив")
+    parser.add_argument('--benchmark', type=int, metavar='N', help="замер на N синтетических заявках")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        benchmark(args.benchmark)
+        return 0
+    report = get_sla_report(args.include_archived, args.sla_days)
+    print(f"Итого: {report['overall']}")
+    for section in ('by_master', 'by_tech_type', 'time_in_status'):
+        print(f"\n{section}:")
+        for item in report[section]:
+            print(f"  {item}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,221 @@
+# sql_profiler.py
+"""Профилировщик операторов SQLite и журнал медленных запросов.
+
+Подключается к соединениям из get_db_connection (TimedConnection в
+metrics.py) и собирает по каждому нормализованному оператору (литералы
+заменены на ?) число выполнений, суммарное и максимальное время, p95,
+время выборки строк, число строк, объем работы виртуальной машины SQLite
+(через set_progress_handler) и число операторов, выполненных триггерами
+(через set_trace_callback: каждый оператор тела триггера вызывает его
+еще раз). Обработчики ставятся только на соединения, открытые при
+включенном профилировщике. Операторы дольше SLOW_QUERY_MS попадают
+в журнал вместе с формой параметров и EXPLAIN QUERY PLAN.
+
+Время оператора - время execute: для агрегатов и сортировок в нем вся
+работа, время последующей выборки строк учитывается отдельно (fetch_ms).
+
+По умолчанию профилировщик выключен: обработчики замедляют каждый
+оператор. Включается при запуске (SQL_PROFILER_ENABLED=1) или
+администратором через POST /api/admin/sql-profile {"enabled": true}.
+Медленные запросы пишутся в журнал logging "sql_profiler".
+"""
+import logging
+import os
+import re
+import threading
+from collections import deque
+from datetime import datetime
+
+from metrics import set_statement_profiler
+
+SQL_PROFILER_ENABLED = os.environ.get('SQL_PROFILER_ENABLED', '0') == '1'
+# Порог медленного запроса (миллисекунды)
+SLOW_QUERY_MS = 100
+# Через сколько инструкций виртуальной машины вызывается счетчик работы
+PROGRESS_STEP = 1000
+# Сколько последних времен выполнения хранится для p95
+PROFILE_SAMPLES = 1000
+# Сколько медленных запросов хранится в журнале
+SLOW_LOG_SIZE = 200
+
+# Операторы, для которых имеет смысл EXPLAIN QUERY PLAN
+_EXPLAINABLE = ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH', 'REPLACE')
+_TRANSACTION = ('BEGIN', 'COMMIT', 'ROLLBACK')
+_WHITESPACE = re.compile(r'\s+')
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+
+logger = logging.getLogger('sql_profiler')
+
+
+def normalize_sql(sql):
+    """Оператор без литералов и лишних пробелов: одинаковые запросы группируются вместе"""
+    sql = _STRING.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = _WHITESPACE.sub(' ', sql).strip()
+    return _LIST.sub('(?, ...)', sql)
+
+
+def params_shape(params, many=False):
+    """Форма параметров без значений: типы по позициям или именам"""
+    if many:
+        if isinstance(params, (list, tuple)):
+            return f"{len(params)} x {params_shape(params[0]) if params else '()'}"
+        return "iter"
+    if isinstance(params, dict):
+        return '{' + ', '.join(f"{key}: {type(value).__name__}" for key, value in params.items()) + '}'
+    return '(' + ', '.join(type(value).__name__ for value in params) + ')'
+
+
+class StatementProfiler:
+    """Сбор статистики операторов; методы on_* вызываются из TimedCursor/TimedConnection"""
+
+    def __init__(self, enabled=SQL_PROFILER_ENABLED, slow_query_ms=SLOW_QUERY_MS):
+        self.enabled = enabled
+        self.slow_query_ms = slow_query_ms
+        self._lock = threading.Lock()
+        self._statements = {}
+        self._slow = deque(maxlen=SLOW_LOG_SIZE)
+        self._local = threading.local()
+        self.started_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+    # ---------- Обработчики SQLite ----------
+    def _progress(self):
+        self._local.steps = getattr(self._local, 'steps', 0) + 1
+        return 0
+
+    def _trace(self, statement):
+        # Неявные BEGIN/COMMIT модуля sqlite3 к оператору не относятся
+        if not statement.startswith(_TRANSACTION) and not getattr(self._local, 'explaining', False):
+            self._local.traced = getattr(self._local, 'traced', 0) + 1
+
+    def _take_work(self):
+        """Работа виртуальной машины и трассируемые операторы с прошлого вызова в этом потоке"""
+        steps = getattr(self._local, 'steps', 0)
+        traced = getattr(self._local, 'traced', 0)
+        self._local.steps = self._local.traced = 0
+        return steps * PROGRESS_STEP, traced
+
+    def on_connect(self, conn):
+        # Выключенный профилировщик не замедляет соединения обработчиками
+        if not self.enabled:
+            return
+        conn.set_progress_handler(self._progress, PROGRESS_STEP)
+        conn.set_trace_callback(self._trace)
+
+    def on_execute(self, cursor, sql, params, seconds, many):
+        if not self.enabled or getattr(self._local, 'explaining', False):
+            return
+        key = normalize_sql(sql)
+        cursor.profile_key = key
+        steps, traced = self._take_work()
+        with self._lock:
+            entry = self._statements.get(key)
+            if entry is None:
+                entry = self._statements[key] = {
+                    "count": 0, "total": 0.0, "max": 0.0, "fetch_total": 0.0, "rows": 0,
+                    "vm_steps": 0, "trigger_statements": 0, "samples": deque(maxlen=PROFILE_SAMPLES),
+                }
+            entry["count"] += 1
+            entry["total"] += seconds
+            entry["max"] = max(entry["max"], seconds)
+            entry["vm_steps"] += steps
+            entry["samples"].append(seconds)
+            # executemany вызывает трассировку на каждую строку параметров
+            executions = len(params) if many and isinstance(params, (list, tuple)) else 1
+            entry["trigger_statements"] += max(traced - executions, 0)
+        if seconds * 1000 >= self.slow_query_ms:
+            self._log_slow(cursor, sql, key, params, seconds, many, steps)
+
+    def on_fetch(self, cursor, seconds, rows):
+        if not self.enabled or getattr(self._local, 'explaining', False):
+            return
+        key = getattr(cursor, 'profile_key', None)
+        steps, _ = self._take_work()
+        with self._lock:
+            entry = self._statements.get(key)
+            if entry is not None:
+                entry["fetch_total"] += seconds
+                entry["rows"] += rows
+                entry["vm_steps"] += steps
+
+    # ---------- Журнал медленных запросов ----------
+    def _explain(self, conn, sql, params, many):
+        if not sql.lstrip().upper().startswith(_EXPLAINABLE):
+            return None
+        if many:
+            params = params[0] if isinstance(params, (list, tuple)) and params else ()
+        self._local.explaining = True
+        try:
+            # Оператор идет через TimedCursor, но флаг explaining исключает его из статистики
+            return [row[-1] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()]
+        except Exception as e:
+            return [f"не удалось получить план: {e}"]
+        finally:
+            self._local.explaining = False
+
+    def _log_slow(self, cursor, sql, key, params, seconds, many, steps):
+        entry = {
+            "at": datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            "duration_ms": round(seconds * 1000, 2),
+            "sql": key,
+            "params": params_shape(params, many),
+            "vm_steps": steps,
+            "plan": self._explain(cursor.connection, sql, params, many),
+        }
+        with self._lock:
+            self._slow.append(entry)
+        plan = ''.join(f"\n    {line}" for line in entry["plan"] or [])
+        logger.warning("Медленный запрос (%s мс, параметры %s): %s%s",
+                       entry['duration_ms'], entry['params'], key, plan)
+
+    # ---------- Выдача ----------
+    def report(self, limit=50, sort='total'):
+        """Статистика операторов (по убыванию sort) и журнал медленных запросов"""
+        with self._lock:
+            statements = []
+            for sql, entry in self._statements.items():
+                samples = sorted(entry["samples"])
+                p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))] if samples else 0.0
+                statements.append({
+                    "sql": sql,
+                    "count": entry["count"],
+                    "total_ms": round(entry["total"] * 1000, 3),
+                    "mean_ms": round(entry["total"] / entry["count"] * 1000, 3),
+                    "p95_ms": round(p95 * 1000, 3),
+                    "max_ms": round(entry["max"] * 1000, 3),
+                    "fetch_ms": round(entry["fetch_total"] * 1000, 3),
+                    "rows": entry["rows"],
+                    "vm_steps": entry["vm_steps"],
+                    "trigger_statements": entry["trigger_statements"],
+                })
+            slow = list(self._slow)
+        sort_key = {'total': 'total_ms', 'count': 'count', 'p95': 'p95_ms', 'max': 'max_ms'}.get(sort, 'total_ms')
+        statements.sort(key=lambda item: item[sort_key], reverse=True)
+        return {
+            "enabled": self.enabled,
+            "slow_query_ms": self.slow_query_ms,
+            "since": self.started_at,
+            "statements": statements[:limit],
+            "slow": slow[::-1],
+        }
+
+    def reset(self):
+        with self._lock:
+            self._statements.clear()
+            self._slow.clear()
+            self.started_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+
+profiler = StatementProfiler()
+
+
+def install_sql_profiler():
+    """Подключение профилировщика к новым соединениям.
+
+    Подключается всегда, чтобы его можно было включить без перезапуска;
+    выключенный профилировщик сразу возвращается из обработчиков.
+    """
+    set_statement_profiler(profiler)
+    return profiler
@@ -0,0 +1,207 @@
+# status_timeline.py
+"""История статусов заявок: индекс, текущий статус и время в статусах.
+
+request_current_status хранит для каждой заявки текущий статус и время его
+установки, request_status_durations - накопленное время (в днях) и число
+интервалов в каждом пройденном статусе. Обе таблицы ведутся триггерами при
+создании заявки и при записи в status_history, поэтому время в статусе
+(например, ожидание запчастей) читается одной строкой, а не окном по всей
+истории. Для текущего статуса к накопленному времени добавляется интервал
+от since до текущего момента.
+
+Пример запуска:
+    python status_timeline.py --rebuild     # пересчитать таблицы по истории
+"""
+import argparse
+import sys
+from datetime import datetime
+
+from archive import COMPLETED_STATUS, requests_source
+from db import get_db_connection
+
+CURRENT_STATUS_TABLE = 'request_current_status'
+DURATIONS_TABLE = 'request_status_durations'
+
+
+def _add_duration_sql(status, start, end, request_id, source=''):
+    """Добавление интервала статуса к накопленному времени"""
+    return f'''
+    INSERT INTO {DURATIONS_TABLE} (request_id, status, total_days, intervals)
+    SELECT {request_id}, {status}, MAX(COALESCE(JULIANDAY({end}) - JULIANDAY({start}), 0), 0), 1
+    {source}
+    ON CONFLICT(request_id, status) DO UPDATE SET
+        total_days = total_days + excluded.total_days,
+        intervals = intervals + excluded.intervals'''
+
+
+def ensure_status_timeline(cursor):
+    """Индекс истории статусов, материализованные таблицы и их триггеры.
+
+    Вызывается после ensure_archive_schema; при первом создании таблицы
+    заполняются по существующей истории.
+    """
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_status_history_request_changed
+    ON status_history(request_id, changed_at, id)
+    ''')
+
+    cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?", (CURRENT_STATUS_TABLE,))
+    created = cursor.fetchone() is None
+
+    cursor.execute(f'''
+    CREATE TABLE IF NOT EXISTS {CURRENT_STATUS_TABLE} (
+        request_id INTEGER PRIMARY KEY,
+        status TEXT,
+        since TIMESTAMP
+    )
+    ''')
+    cursor.execute(f'''
+    CREATE TABLE IF NOT EXISTS {DURATIONS_TABLE} (
+        request_id INTEGER NOT NULL,
+        status TEXT NOT NULL,
+        total_days REAL NOT NULL DEFAULT 0,
+        intervals INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (request_id, status)
+    )
+    ''')
+    cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_status_durations_status ON {DURATIONS_TABLE}(status)")
+
+    # Новая заявка находится в своем статусе с момента создания
+    cursor.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS trg_service_requests_insert_current_status
+    AFTER INSERT ON service_requests
+    BEGIN
+        INSERT OR IGNORE INTO {CURRENT_STATUS_TABLE} (request_id, status, since)
+        VALUES (NEW.request_id, NEW.request_status, NEW.start_date);
+    END
+    ''')
+    # Смена статуса закрывает интервал предыдущего статуса и открывает новый.
+    # Если текущего статуса нет, первым интервалом считается old_status
+    # от start_date заявки.
+    close_current = _add_duration_sql(
+        'cur.status', 'cur.since', 'NEW.changed_at', 'NEW.request_id',
+        source=f"FROM {CURRENT_STATUS_TABLE} cur WHERE cur.request_id = NEW.request_id AND cur.status IS NOT NULL")
+    close_initial = _add_duration_sql(
+        'NEW.old_status', 'r.start_date', 'NEW.changed_at', 'NEW.request_id',
+        source=f'''FROM service_requests r WHERE r.request_id = NEW.request_id AND NEW.old_status IS NOT NULL
+        AND NOT EXISTS (SELECT 1 FROM {CURRENT_STATUS_TABLE} WHERE request_id = NEW.request_id)''')
+    cursor.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS trg_status_history_insert_timeline
+    AFTER INSERT ON status_history
+    BEGIN
+        {close_current};
+        {close_initial};
+        INSERT INTO {CURRENT_STATUS_TABLE} (request_id, status, since)
+        VALUES (NEW.request_id, NEW.new_status, NEW.changed_at)
+        ON CONFLICT(request_id) DO UPDATE SET status = excluded.status, since = excluded.since;
+    END
+    ''')
+
+    if created:
+        rebuild_status_timeline(cursor)
+
+
+def rebuild_status_timeline(cursor):
+    """Пересчет текущих статусов и времени в статусах по всей истории"""
+    source = requests_source(cursor, include_archived=True)
+    cursor.execute(f"DELETE FROM {CURRENT_STATUS_TABLE}")
+    cursor.execute(f"DELETE FROM {DURATIONS_TABLE}")
+    # Интервалы между соседними записями истории
+    cursor.execute(_add_duration_sql(
+        'h.new_status', 'h.changed_at', 'h.next_at', 'h.request_id',
+        source='''FROM (
+            SELECT request_id, new_status, changed_at,
+                   LEAD(changed_at) OVER (PARTITION BY request_id ORDER BY changed_at, id) AS next_at
+            FROM status_history
+        ) h WHERE h.next_at IS NOT NULL'''))
+    # Первый интервал: old_status первой записи от создания заявки
+    cursor.execute(_add_duration_sql(
+        'h.old_status', 'service_requests.start_date', 'h.changed_at', 'h.request_id',
+        source=f'''FROM (
+            SELECT request_id, old_status, changed_at,
+                   ROW_NUMBER() OVER (PARTITION BY request_id ORDER BY changed_at, id) AS position
+            FROM status_history
+        ) h JOIN {source} ON service_requests.request_id = h.request_id
+        WHERE h.position = 1 AND h.old_status IS NOT NULL'''))
+    # Текущий статус - последняя запись истории, а без истории - статус заявки
+    cursor.execute(f'''
+    INSERT INTO {CURRENT_STATUS_TABLE} (request_id, status, since)
+    SELECT request_id, new_status, changed_at FROM (
+        SELECT request_id, new_status, changed_at,
+               ROW_NUMBER() OVER (PARTITION BY request_id ORDER BY changed_at DESC, id DESC) AS position
+        FROM status_history
+    ) WHERE position = 1
+    ''')
+    cursor.execute(f'''
+    INSERT OR IGNORE INTO {CURRENT_STATUS_TABLE} (request_id, status, since)
+    SELECT request_id, request_status, start_date FROM {source}
+    ''')
+
+
+def get_request_timeline(cursor, request_id):
+    """История статусов заявки, текущий статус и время в каждом статусе"""
+    cursor.execute('''
+        SELECT old_status, new_status, changed_by, changed_at, comment
+        FROM status_history
+        WHERE request_id = ?
+        ORDER BY changed_at, id
+    ''', (request_id,))
+    history = [{
+        "old_status": row[0],
+        "new_status": row[1],
+        "changed_by": row[2],
+        "changed_at": row[3],
+        "comment": row[4],
+    } for row in cursor.fetchall()]
+
+    cursor.execute(f'''
+        SELECT status, since, MAX(JULIANDAY('now', 'localtime') - JULIANDAY(since), 0)
+        FROM {CURRENT_STATUS_TABLE} WHERE request_id = ?
+    ''', (request_id,))
+    row = cursor.fetchone()
+    current = {"status": row[0], "since": row[1], "days": round(row[2], 2) if row[2] is not None else None} \
+        if row else None
+
+    cursor.execute(f'''
+        SELECT status, total_days, intervals FROM {DURATIONS_TABLE} WHERE request_id = ?
+    ''', (request_id,))
+    durations = {status: [total_days, intervals] for status, total_days, intervals in cursor.fetchall()}
+    # Текущий статус еще длится: добавляем открытый интервал (кроме завершения)
+    if current and current["status"] not in (None, COMPLETED_STATUS) and current["days"] is not None:
+        total = durations.setdefault(current["status"], [0.0, 0])
+        total[0] += current["days"]
+        total[1] += 1
+    time_in_status = [{"status": status, "days": round(total_days, 2), "intervals": intervals}
+                      for status, (total_days, intervals) in durations.items()]
+
+    return {
+        "request_id": request_id,
+        "current_status": current,
+        "history": history,
+        "time_in_status": time_in_status,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Текущие статусы и время в статусах по истории")
+    parser.add_argument('--rebuild', action='store_true', help="пересчитать таблицы по истории")
+    parser.add_argument('--request', type=int, help="показать историю заявки")
+    args = parser.parse_args()
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    if args.rebuild:
+        started = datetime.now()
+        cursor.execute("BEGIN IMMEDIATE")
+        ensure_status_timeline(cursor)
+        rebuild_status_timeline(cursor)
+        conn.commit()
+        print(f"Таблицы пересчитаны за {(datetime.now() - started).total_seconds():.2f} с")
+    if args.request is not None:
+        print(get_request_timeline(cursor, args.request))
+    conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
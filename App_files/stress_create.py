@@ -0,0 +1,126 @@
+# stress_create.py
+"""Нагрузочная проверка создания заявок.
+
+Несколько потоков одновременно создают заявки в копии базы данных
+(одиночными вставками и пакетами). Скрипт проверяет, что все выданные
+номера уникальны и совпадают с записанными строками, и выводит
+скорость вставки.
+
+Пример запуска:
+    python stress_create.py --threads 8 --per-thread 500 --batch 50
+"""
+import argparse
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+from db import DB_PATH, get_db_connection, enable_wal, ensure_request_sequence, insert_service_requests
+from equipment import ensure_equipment_catalog
+
+
+def make_item(worker, number):
+    """Тестовая заявка"""
+    return {
+        'tech_type': 'Кондиционер',
+        'tech_model': f'Stress-{worker}',
+        'problem_description': f'Нагрузочный тест {worker}/{number}',
+        'client_fio': 'Нагрузочный Тест',
+        'client_phone': '89000000000',
+        'client_login': 'stress',
+    }
+
+
+def run_workers(db_path, threads, per_thread, batch):
+    """Запуск потоков-писателей, возвращает выданные номера и время работы"""
+    issued = []
+    errors = []
+    lock = threading.Lock()
+    barrier = threading.Barrier(threads)
+
+    def worker(worker_id):
+        conn = get_db_connection(db_path=db_path)
+        local_ids = []
+        try:
+            barrier.wait()
+            for start in range(0, per_thread, batch):
+                items = [make_item(worker_id, n) for n in range(start, min(start + batch, per_thread))]
+                local_ids.extend(insert_service_requests(conn, items))
+        except Exception as e:
+            errors.append(f"Поток {worker_id}: {e}")
+        finally:
+            conn.close()
+        with lock:
+            issued.extend(local_ids)
+
+    pool = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    started = time.perf_counter()
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    return issued, errors, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочная проверка выдачи номеров заявок")
+    parser.add_argument('--db', default=DB_PATH, help="исходная база данных (копируется во временный каталог)")
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--per-thread', type=int, default=200)
+    parser.add_argument('--batch', type=int, default=1, help="заявок в одной транзакции (1 = одиночное создание)")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        print(f"Файл {args.db} не найден!")
+        return 1
+
+    tmp_dir = tempfile.mkdtemp(prefix='stress_create_')
+    db_path = os.path.join(tmp_dir, 'stress.db')
+    try:
+        # Копируем базу через backup API, чтобы не трогать рабочую
+        source = sqlite3.connect(args.db)
+        target = sqlite3.connect(db_path)
+        source.backup(target)
+        source.close()
+        cursor = target.cursor()
+        enable_wal(cursor)
+        ensure_request_sequence(cursor)
+        ensure_equipment_catalog(cursor)
+        cursor.execute("SELECT COUNT(*) FROM service_requests")
+        rows_before = cursor.fetchone()[0]
+        target.commit()
+        target.close()
+
+        issued, errors, elapsed = run_workers(db_path, args.threads, args.per_thread, args.batch)
+
+        conn = sqlite3.connect(db_path)
+        rows_after = conn.execute("SELECT COUNT(*) FROM service_requests").fetchone()[0]
+        stored = {row[0] for row in conn.execute(
+            "SELECT request_id FROM service_requests WHERE client_login = 'stress'")}
+        conn.close()
+
+        expected = args.threads * args.per_thread
+        duplicates = len(issued) - len(set(issued))
+        print("=" * 60)
+        print(f"Потоков: {args.threads}, заявок на поток: {args.per_thread}, размер пакета: {args.batch}")
+        print(f"Создано заявок: {len(issued)} из {expected}")
+        print(f"Повторяющихся номеров: {duplicates}")
+        print(f"Строк в таблице: {rows_before} -> {rows_after}")
+        print(f"Время: {elapsed:.3f} с, скорость: {len(issued) / elapsed:.0f} вставок/с")
+        for error in errors:
+            print(f"Ошибка: {error}")
+        print("=" * 60)
+
+        ok = (not errors and duplicates == 0 and len(issued) == expected
+              and set(issued) == stored and rows_after - rows_before == expected)
+        print("Проверка пройдена" if ok else "Проверка НЕ пройдена")
+        return 0 if ok else 1
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
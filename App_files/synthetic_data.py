@@ -0,0 +1,357 @@
+# synthetic_data.py
+"""Генератор синтетических данных для проверки на больших объемах.
+
+Создает новую базу со схемой рабочей (таблицы копируются из --template)
+и заполняет ее мастерами, пользователями, каталогом оборудования,
+заявками с комментариями и историей статусов. Распределения скошены:
+несколько мастеров и типов техники получают большую часть заявок,
+у постоянных клиентов бывает много заявок, время ремонта зависит от
+типа техники. Один и тот же --seed дает одну и ту же базу.
+
+Загрузка идет пакетами executemany в одной транзакции без журнала,
+триггеры и производные таблицы (агрегаты, время в статусах, счетчики)
+создаются после загрузки теми же функциями, что и при запуске
+приложения, и заполняются одним проходом.
+
+Пример запуска:
+    python synthetic_data.py --db synthetic.db --requests 1000000 --seed 42
+"""
+import argparse
+import math
+import os
+import sqlite3
+import sys
+import time
+
+import numpy as np
+from werkzeug.security import generate_password_hash
+
+from db import DB_PATH, get_db_connection, ensure_request_sequence, ensure_change_counter, ensure_updated_at_trigger
+from archive import COMPLETED_STATUS, ensure_archive_schema
+from rollups import ensure_rollups
+from status_timeline import ensure_status_timeline
+from request_age import NEW_STATUS, ensure_days_in_process, refresh_days_in_process
+from equipment import ensure_equipment_catalog
+
+# Таблицы, схема которых копируется из рабочей базы
+BASE_TABLES = ('users', 'masters', 'equipment_types', 'service_requests', 'status_history')
+# Заявок в одном пакете вставки
+GENERATE_BATCH_SIZE = 50000
+# Пароль всех синтетических пользователей
+SYNTHETIC_PASSWORD = 'pass'
+# Период заявок по умолчанию (фиксирован, чтобы база не зависела от даты запуска)
+DEFAULT_START = '2022-01-01'
+DEFAULT_END = '2025-12-31'
+
+IN_PROGRESS_STATUS = 'В процессе ремонта'
+WAITING_STATUS = 'Ожидание комплектующих'
+READY_STATUS = 'Готова к выдаче'
+# Статусы открытых заявок и их доли
+OPEN_STATUSES = (IN_PROGRESS_STATUS, WAITING_STATUS, READY_STATUS)
+OPEN_STATUS_WEIGHTS = (0.6, 0.25, 0.15)
+
+# Тип техники: (доля заявок, медиана времени ремонта в днях, бренды)
+TECH_TYPES = {
+    'Кондиционер': (0.35, 9, ('TCL', 'Electrolux', 'Ballu', 'Haier', 'LG')),
+    'Увлажнитель воздуха': (0.2, 5, ('Xiaomi', 'Polaris', 'Boneco', 'Electrolux')),
+    'Сушилка для рук': (0.1, 4, ('Ballu', 'Dyson', 'Electrolux')),
+    'Обогреватель': (0.15, 3, ('Ballu', 'Timberk', 'Polaris', 'Scarlett')),
+    'Очиститель воздуха': (0.12, 6, ('Xiaomi', 'Philips', 'Tefal')),
+    'Вентилятор': (0.08, 2, ('Xiaomi', 'Vitek', 'Scarlett')),
+}
+MODELS_PER_BRAND = 8
+# Доля заявок, которые так и не завершаются
+STALLED_SHARE = 0.01
+
+PROBLEMS = (
+    'Не включается', 'Не охлаждает воздух', 'Выключается сам по себе', 'Сильный шум при работе',
+    'Пар имеет неприятный запах', 'Не работает пульт', 'Течет вода', 'Мигает индикатор ошибки',
+    'Не греет', 'Слабый поток воздуха', 'Треснул корпус', 'Не реагирует на кнопки',
+)
+COMMENTS = (
+    'Всё сделаем!', 'Требуется диагностика', 'Заказаны комплектующие', 'Починен, заменен фильтр',
+    'Заменена плата управления', 'Клиент предупрежден о сроках', 'Гарантийный случай',
+)
+REPAIR_PARTS = ('Фильтр', 'Плата управления', 'Вентилятор', 'Датчик температуры', 'Компрессор', 'Пульт')
+
+MALE_NAMES = ('Иван', 'Петр', 'Алексей', 'Дмитрий', 'Сергей', 'Никита', 'Артём', 'Матвей', 'Фёдор', 'Андрей')
+FEMALE_NAMES = ('Анна', 'Мария', 'Ева', 'Софья', 'Ульяна', 'Виктория', 'Екатерина', 'Ольга', 'Дарья')
+SURNAMES = ('Иванов', 'Петров', 'Сидоров', 'Смирнов', 'Кузнецов', 'Козлов', 'Николаев', 'Гончаров',
+            'Кудрявцев', 'Баранов', 'Гусев', 'Ковалев', 'Овчинников', 'Широков', 'Беспалов')
+PATRONYMICS = ('Иванович', 'Петрович', 'Алексеевич', 'Дмитриевич', 'Сергеевич', 'Матвеевич')
+
+
+def zipf_weights(count, skew):
+    """Доли 1/rank^skew: первые элементы получают большую часть"""
+    weights = 1.0 / np.arange(1, count + 1) ** skew
+    return weights / weights.sum()
+
+
+def make_people(rng, count):
+    """ФИО и телефоны count человек"""
+    female = rng.random(count) < 0.5
+    surnames = rng.integers(0, len(SURNAMES), count)
+    male_names = rng.integers(0, len(MALE_NAMES), count)
+    female_names = rng.integers(0, len(FEMALE_NAMES), count)
+    patronymics = rng.integers(0, len(PATRONYMICS), count)
+    phones = rng.integers(9000000000, 9999999999, count)
+    people = []
+    for i in range(count):
+        if female[i]:
+            fio = (f"{SURNAMES[surnames[i]]}а {FEMALE_NAMES[female_names[i]]} "
+                   f"{PATRONYMICS[patronymics[i]][:-2]}на")
+        else:
+            fio = f"{SURNAMES[surnames[i]]} {MALE_NAMES[male_names[i]]} {PATRONYMICS[patronymics[i]]}"
+        people.append((fio, f"8{phones[i]}"))
+    return people
+
+
+def make_catalog(rng):
+    """Каталог оборудования: список (тип, модель) и индексы моделей каждого типа"""
+    catalog, models_by_type = [], {}
+    for tech_type, (_, _, brands) in TECH_TYPES.items():
+        models_by_type[tech_type] = []
+        for brand in brands:
+            for number in rng.choice(np.arange(100, 1000), MODELS_PER_BRAND, replace=False):
+                models_by_type[tech_type].append(len(catalog))
+                catalog.append((tech_type, f"{brand} {tech_type[:2].upper()}-{number}"))
+    return catalog, models_by_type
+
+
+def create_schema(conn, template):
+    """Создание основных таблиц по схеме базы template"""
+    source = sqlite3.connect(f"file:{template}?mode=ro", uri=True)
+    try:
+        placeholders = ', '.join('?' * len(BASE_TABLES))
+        statements = source.execute(
+            f"SELECT name, sql FROM sqlite_master WHERE type = 'table' AND name IN ({placeholders})",
+            BASE_TABLES).fetchall()
+    finally:
+        source.close()
+    missing = set(BASE_TABLES) - {name for name, _ in statements}
+    if missing:
+        raise RuntimeError(f"В базе {template} нет таблиц: {', '.join(sorted(missing))}")
+    for _, sql in statements:
+        conn.execute(sql)
+
+
+def _timestamps(seconds):
+    """Строки 'YYYY-MM-DD HH:MM:SS' для массива секунд эпохи"""
+    return [value.replace('T', ' ') for value in np.datetime_as_string(seconds.astype('datetime64[s]'))]
+
+
+def _status_path(final_status, waited):
+    """Последовательность статусов от создания заявки до final_status"""
+    path = [NEW_STATUS]
+    if final_status == NEW_STATUS:
+        return path
+    path.append(IN_PROGRESS_STATUS)
+    if waited or final_status == WAITING_STATUS:
+        path.append(WAITING_STATUS)
+        if final_status != WAITING_STATUS:
+            path.append(IN_PROGRESS_STATUS)
+    if final_status in (READY_STATUS, COMPLETED_STATUS):
+        path.append(READY_STATUS)
+    if final_status == COMPLETED_STATUS:
+        path.append(COMPLETED_STATUS)
+    return path
+
+
+def generate_requests(rng, first_id, starts, end_ts, masters, clients, catalog, models_by_type, skew):
+    """Пакет заявок и их истории статусов: (строки service_requests, строки status_history)"""
+    count = len(starts)
+    type_names = list(TECH_TYPES)
+    type_index = rng.choice(len(type_names), count, p=[TECH_TYPES[name][0] for name in type_names])
+    medians = np.array([TECH_TYPES[name][1] for name in type_names])[type_index]
+    turnaround = rng.lognormal(np.log(medians), 0.8) * 86400
+    completions = starts + turnaround.astype(np.int64)
+    # Небольшая доля заявок зависает и остается открытой надолго
+    completed = (completions <= end_ts) & (rng.random(count) >= STALLED_SHARE)
+    # Незавершенные: совсем свежие чаще всего еще новые
+    age_days = (end_ts - starts) / 86400
+    is_new = ~completed & (rng.random(count) < np.exp(-age_days / 3))
+    open_status = rng.choice(len(OPEN_STATUSES), count, p=OPEN_STATUS_WEIGHTS)
+    master_index = rng.choice(len(masters), count, p=zipf_weights(len(masters), skew))
+    client_index = rng.choice(len(clients), count, p=zipf_weights(len(clients), skew * 0.7))
+    model_draw = rng.random(count)
+    problem_index = rng.integers(0, len(PROBLEMS), count)
+    has_comment = rng.random(count) < 0.3
+    comment_index = rng.integers(0, len(COMMENTS), count)
+    parts = rng.random(count) < 0.4
+    parts_index = rng.integers(0, len(REPAIR_PARTS), count)
+    waited = rng.random(count) < 0.2
+    fractions = np.sort(rng.random((count, 5)), axis=1)
+
+    start_text = _timestamps(starts)
+    completion_text = _timestamps(np.minimum(completions, end_ts))
+    # Моменты смены статусов: доли интервала от создания до завершения (или конца периода)
+    ends = np.where(completed, completions, end_ts)
+    change_text = _timestamps((starts[:, None] + (ends - starts)[:, None] * fractions).ravel())
+    requests, history = [], []
+    for i in range(count):
+        request_id = first_id + i
+        tech_type = type_names[type_index[i]]
+        type_models = models_by_type[tech_type]
+        # Модели внутри типа тоже неравномерны: квадрат равномерной величины
+        tech_model = catalog[type_models[int(model_draw[i] ** 2 * len(type_models))]][1]
+        if completed[i]:
+            status, completion_date = COMPLETED_STATUS, completion_text[i]
+            days = int(turnaround[i] // 86400)
+        elif is_new[i]:
+            status, completion_date, days = NEW_STATUS, None, None
+        else:
+            status, completion_date = OPEN_STATUSES[open_status[i]], None
+            days = int(age_days[i])
+        master = masters[master_index[i]] if status != NEW_STATUS else None
+        client_login, client_fio, client_phone = clients[client_index[i]]
+        comment = COMMENTS[comment_index[i]] if has_comment[i] and master else ''
+        requests.append((
+            request_id, start_text[i], tech_type, tech_model, PROBLEMS[problem_index[i]],
+            status, completion_date, days,
+            REPAIR_PARTS[parts_index[i]] if parts[i] and status == COMPLETED_STATUS else '',
+            bool(comment), comment,
+            master[0] if master else None, master[1] if master else None, master[2] if master else None,
+            client_fio, client_phone, client_login,
+            master[0] if comment else None,
+        ))
+
+        path = _status_path(status, waited[i])
+        for step in range(1, len(path)):
+            changed_at = completion_date if path[step] == COMPLETED_STATUS else change_text[i * 5 + step - 1]
+            if step == 1:
+                changed_by, note = 'Оператор', f"Назначен мастер: {master[1]}"
+            else:
+                changed_by, note = master[1], None
+            history.append((request_id, path[step - 1], path[step], changed_by, changed_at, note))
+    return requests, history
+
+
+def generate(conn, requests_count, masters_count, clients_count, seed, period, skew=1.1,
+             batch_size=GENERATE_BATCH_SIZE, progress=print):
+    """Заполнение пустой базы; возвращает число строк по таблицам"""
+    rng = np.random.default_rng(seed)
+    cursor = conn.cursor()
+    password_hash = generate_password_hash(SYNTHETIC_PASSWORD)
+
+    catalog, models_by_type = make_catalog(rng)
+    cursor.executemany("INSERT INTO equipment_types (tech_type, tech_model) VALUES (?, ?)", catalog)
+
+    masters = [(i + 1, fio, phone, f"master{i + 1}")
+               for i, (fio, phone) in enumerate(make_people(rng, masters_count))]
+    cursor.executemany('''
+        INSERT INTO masters (id, master_fio, master_phone, master_login, master_type)
+        VALUES (?, ?, ?, ?, 'Специалист')
+    ''', masters)
+    clients = [(f"client{i + 1}", fio, phone) for i, (fio, phone) in enumerate(make_people(rng, clients_count))]
+
+    staff = [('admin', 'Администратор Системы', '', 'admin'), ('operator', 'Оператор', '', 'operator')]
+    users = staff + [(login, fio, phone, 'master') for _, fio, phone, login in masters] \
+        + [(login, fio, phone, 'client') for login, fio, phone in clients]
+    cursor.executemany('''
+        INSERT INTO users (login, password_hash, fio, phone, user_type) VALUES (?, ?, ?, ?, ?)
+    ''', [(login, password_hash, fio, phone, user_type) for login, fio, phone, user_type in users])
+
+    # Номера заявок идут в порядке даты создания
+    starts = np.sort(rng.integers(period[0], period[1], requests_count))
+    history_count = 0
+    for first in range(0, requests_count, batch_size):
+        count = min(batch_size, requests_count - first)
+        requests, history = generate_requests(rng, first + 1, starts[first:first + count], period[1],
+                                              masters, clients, catalog, models_by_type, skew)
+        cursor.executemany('''
+            INSERT INTO service_requests (
+                request_id, start_date, tech_type, tech_model, problem_description,
+                request_status, completion_date, days_in_process, repair_parts,
+                has_comment, comment_message, master_id, master_fio, master_phone,
+                client_fio, client_phone, client_login, comment_master_id
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', requests)
+        cursor.executemany('''
+            INSERT INTO status_history (request_id, old_status, new_status, changed_by, changed_at, comment)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', history)
+        history_count += len(history)
+        progress(f"Заявок: {first + count} из {requests_count}")
+
+    return {
+        "equipment_types": len(catalog),
+        "masters": len(masters),
+        "users": len(users),
+        "service_requests": requests_count,
+        "status_history": history_count,
+    }
+
+
+def finalize(conn):
+    """Служебные таблицы, индексы и триггеры, как при запуске приложения"""
+    cursor = conn.cursor()
+    ensure_request_sequence(cursor)
+    ensure_archive_schema(cursor)
+    ensure_change_counter(cursor)
+    ensure_updated_at_trigger(cursor)
+    ensure_equipment_catalog(cursor)
+    ensure_rollups(cursor)
+    ensure_status_timeline(cursor)
+    ensure_days_in_process(cursor)
+    conn.commit()
+    refresh_days_in_process(conn)
+
+
+def _epoch(value):
+    """Секунды от начала эпохи для даты YYYY-MM-DD (без учета часового пояса)"""
+    return int(np.datetime64(value, 's').astype(np.int64))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Генерация синтетической базы заявок")
+    parser.add_argument('--db', default='synthetic.db', help="создаваемая база данных")
+    parser.add_argument('--template', default=DB_PATH, help="база, из которой берется схема таблиц")
+    parser.add_argument('--requests', type=int, default=10000, help="число заявок")
+    parser.add_argument('--masters', type=int, default=None, help="число мастеров (по умолчанию от числа заявок)")
+    parser.add_argument('--clients', type=int, default=None, help="число клиентов (по умолчанию заявки / 5)")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--skew', type=float, default=1.1, help="скошенность распределения по мастерам и клиентам")
+    parser.add_argument('--start', default=DEFAULT_START, help="дата первой заявки (YYYY-MM-DD)")
+    parser.add_argument('--end', default=DEFAULT_END, help="дата последней заявки (YYYY-MM-DD)")
+    parser.add_argument('--batch', type=int, default=GENERATE_BATCH_SIZE, help="заявок в одном пакете вставки")
+    parser.add_argument('--force', action='store_true', help="перезаписать существующий файл")
+    args = parser.parse_args()
+
+    if os.path.exists(args.db):
+        if not args.force:
+            print(f"Файл {args.db} уже существует, используйте --force")
+            return 1
+        os.remove(args.db)
+    masters_count = args.masters or max(3, int(math.sqrt(args.requests)))
+    clients_count = args.clients or max(1, args.requests // 5)
+
+    started = time.perf_counter()
+    conn = get_db_connection(db_path=args.db)
+    try:
+        # Новый файл: журнал и синхронизация на время загрузки не нужны
+        conn.execute("PRAGMA journal_mode=OFF")
+        conn.execute("PRAGMA synchronous=OFF")
+        conn.execute("PRAGMA cache_size=-200000")
+        create_schema(conn, args.template)
+        counts = generate(conn, args.requests, masters_count, clients_count, args.seed,
+                          (_epoch(args.start), _epoch(args.end)), args.skew, args.batch)
+        conn.commit()
+        loaded = time.perf_counter() - started
+        finalize(conn)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+    finally:
+        conn.close()
+
+    elapsed = time.perf_counter() - started
+    print("=" * 60)
+    for table, count in counts.items():
+        print(f"{table}: {count}")
+    print(f"Загрузка: {loaded:.1f} с ({args.requests / loaded:.0f} заявок/с), "
+          f"с индексами и агрегатами: {elapsed:.1f} с")
+    print(f"Пароль всех пользователей: {SYNTHETIC_PASSWORD} (admin, operator, master1.., client1..)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,61 @@
+# test_request_age.py
+"""Пересчет days_in_process не должен менять updated_at заявок.
+
+Запуск:
+    python -m pytest test_request_age.py
+"""
+from db import get_db_connection, ensure_updated_at_trigger
+from request_age import refresh_days_in_process
+
+UPDATED_AT = '2024-01-01 00:00:00'
+
+
+def make_db(path):
+    conn = get_db_connection(db_path=str(path))
+    cursor = conn.cursor()
+    cursor.execute('''
+    CREATE TABLE service_requests (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        request_id INTEGER,
+        request_status TEXT,
+        start_date TEXT,
+        completion_date TEXT,
+        days_in_process INTEGER,
+        updated_at TEXT
+    )
+    ''')
+    ensure_updated_at_trigger(cursor)
+    cursor.executemany('''
+    INSERT INTO service_requests (request_id, request_status, start_date, completion_date, days_in_process, updated_at)
+    VALUES (?, ?, ?, ?, ?, ?)
+    ''', [
+        (1, 'В процессе ремонта', '2024-01-01 10:00:00', None, 0, UPDATED_AT),
+        (2, 'Новая заявка', '2024-01-01 10:00:00', None, None, UPDATED_AT),
+    ])
+    conn.commit()
+    return conn
+
+
+def test_refresh_keeps_updated_at(tmp_path):
+    conn = make_db(tmp_path / 'requests.db')
+    try:
+        assert refresh_days_in_process(conn) == 1
+        rows = conn.execute("SELECT request_id, days_in_process, updated_at FROM service_requests "
+                            "ORDER BY request_id").fetchall()
+        assert rows[0][1] > 0
+        assert [row[2] for row in rows] == [UPDATED_AT, UPDATED_AT]
+    finally:
+        conn.close()
+
+
+def test_refresh_restores_touch_trigger(tmp_path):
+    conn = make_db(tmp_path / 'requests.db')
+    try:
+        refresh_days_in_process(conn)
+        # Обычное изменение заявки после пересчета по-прежнему обновляет updated_at
+        conn.execute("UPDATE service_requests SET request_status = 'Готова к выдаче' WHERE request_id = 1")
+        conn.commit()
+        updated_at = conn.execute("SELECT updated_at FROM service_requests WHERE request_id = 1").fetchone()[0]
+        assert updated_at != UPDATED_AT
+    finally:
+        conn.close()
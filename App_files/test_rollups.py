@@ -0,0 +1,58 @@
+# test_rollups.py
+"""Перцентили срока выполнения в /api/stats/timeseries.
+
+Запуск:
+    python -m pytest test_rollups.py
+"""
+from archive import ensure_archive_schema
+from db import get_db_connection
+from rollups import ensure_rollups, query_timeseries
+
+
+def make_db(path, turnarounds):
+    """База с заявками, завершенными 2024-06-01 за указанное число дней"""
+    conn = get_db_connection(db_path=str(path))
+    cursor = conn.cursor()
+    cursor.execute('''
+    CREATE TABLE service_requests (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        request_id INTEGER,
+        client_login TEXT,
+        tech_type TEXT,
+        master_id INTEGER,
+        request_status TEXT,
+        start_date TEXT,
+        completion_date TEXT
+    )
+    ''')
+    ensure_archive_schema(cursor)
+    ensure_rollups(cursor)
+    cursor.executemany('''
+    INSERT INTO service_requests (request_id, tech_type, master_id, request_status, start_date, completion_date)
+    VALUES (?, 'Телевизор', 1, 'Готова к выдаче', date('2024-06-01', ?), '2024-06-01')
+    ''', [(i, f'-{days} days') for i, days in enumerate(turnarounds, 1)])
+    conn.commit()
+    return conn
+
+
+def test_percentile_in_closed_bin(tmp_path):
+    conn = make_db(tmp_path / 'requests.db', [4, 4, 4, 100])
+    try:
+        point, = query_timeseries(conn.cursor(), start='2024-06-01', granularity='day')
+        assert point["p50_turnaround_days"] == 5
+        assert point["p90_turnaround_days"] == 180
+    finally:
+        conn.close()
+
+
+def test_percentile_in_open_last_bin(tmp_path):
+    # 1000 дней - за последней границей интервалов: верхней оценки нет
+    conn = make_db(tmp_path / 'requests.db', [1000])
+    try:
+        point, = query_timeseries(conn.cursor(), start='2024-06-01', granularity='day')
+        assert point["completed"] == 1
+        assert point["avg_turnaround_days"] == 1000
+        assert point["p50_turnaround_days"] is None
+        assert point["p90_turnaround_days"] is None
+    finally:
+        conn.close()